@@ -1,111 +1,1449 @@
-from flask import Flask, render_template, request, jsonify
-from carbon_footprint_model import CarbonFootprintCalculator
-
-app = Flask(__name__)
-calculator = CarbonFootprintCalculator()
-
-# Consumption values mapping for each category and level
-CONSUMPTION_VALUES = {
-    'electricity': {
-        'high': 450,      # kWh per month
-        'moderate': 300,  # kWh per month
-        'low': 150        # kWh per month
-    },
-    'transport': {
-        'high': 350,      # km per week
-        'moderate': 200,  # km per week
-        'low': 50         # km per week
-    },
-    'meat': {
-        'high': 2.5,      # kg per week
-        'moderate': 1.5,  # kg per week
-        'low': 0.3        # kg per week
-    },
-    'waste': {
-        'high': 12,       # kg per week
-        'moderate': 5,    # kg per week
-        'low': 2          # kg per week
-    },
-    'water': {
-        'high': 250,      # liters per day
-        'moderate': 150,  # liters per day
-        'low': 70         # liters per day
-    }
-}
-
-@app.route('/')
-def index():
-    """Render the main page."""
-    return render_template('index.html')
-
-@app.route('/calculate', methods=['POST'])
-def calculate():
-    """Calculate carbon footprint based on form data."""
-    try:
-        # Get form data (now dropdown values instead of numbers)
-        electricity_level = request.form.get('electricity', 'moderate')
-        transport_level = request.form.get('transport', 'moderate')
-        meat_level = request.form.get('meat', 'moderate')
-        waste_level = request.form.get('waste', 'moderate')
-        water_level = request.form.get('water', 'moderate')
-        region = request.form.get('region', '')
-        
-        # Convert levels to numeric values using the mapping
-        electricity = CONSUMPTION_VALUES['electricity'][electricity_level]
-        transport = CONSUMPTION_VALUES['transport'][transport_level]
-        meat = CONSUMPTION_VALUES['meat'][meat_level]
-        waste = CONSUMPTION_VALUES['waste'][waste_level]
-        water = CONSUMPTION_VALUES['water'][water_level]
-        
-        # Calculate footprint
-        result = calculator.calculate_footprint(electricity, transport, meat, waste, water)
-        
-        # Add the selected levels to the result
-        result['selected_levels'] = {
-            'electricity': electricity_level,
-            'transport': transport_level,
-            'meat': meat_level,
-            'waste': waste_level,
-            'water': water_level
-        }
-        
-        # Get total footprint and level
-        total = result['footprints']['total']
-        level = calculator.get_footprint_level(total)
-        
-        # Get regional comparison if provided
-        regional_comparison = ""
-        if region:
-            regional_comparison = calculator.compare_with_region(total, region)
-        
-        # Format recommendations
-        recommendations = {}
-        if result['detailed_recommendations']:
-            for category, suggestions in result['detailed_recommendations'].items():
-                recommendations[category] = suggestions[:3]  # Limit to top 3 recommendations
-        
-        # Prepare response data
-        response_data = {
-            'success': True,
-            'footprints': result['footprints'],
-            'comparisons': result['comparisons'],
-            'level': level,
-            'recommendations': recommendations,
-            'regional_comparison': regional_comparison,
-            'global_averages': result['global_averages'],
-            'selected_levels': result['selected_levels']
-        }
-        
-        return jsonify(response_data)
-    
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
-
-@app.route('/regions', methods=['GET'])
-def get_regions():
-    """Return a list of valid regions."""
-    regions = list(calculator.regional_averages.keys())
-    return jsonify(regions)
-
-if __name__ == '__main__':
+import codecs
+import functools
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import threading
+from collections import OrderedDict
+from time import perf_counter
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+import carbon_footprint_binary
+import carbon_footprint_data
+from carbon_footprint_metrics import REGISTRY
+from carbon_footprint_model import (ANNUAL_MULTIPLIERS, CarbonFootprintCalculator, COMPARED_CATEGORIES,
+                                    DEFAULT_FACTORS, FOOTPRINT_CATEGORIES, LEVEL_NAMES, LEVEL_HIGH)
+from carbon_footprint_history import HistoryStore
+from carbon_footprint_org import OrgTree
+from carbon_footprint_planner import GoalPlanner
+from carbon_footprint_population import ALL_REGIONS, PopulationStats, merge_files
+from carbon_footprint_uncertainty import DEFAULT_SAMPLES, UncertaintyModel
+from carbon_footprint_whatif import WhatIfEngine
+
+app = Flask(__name__)
+
+# Form fields in calculate_footprint argument order
+INPUT_FIELDS = ('electricity', 'transport', 'meat', 'waste', 'water')
+
+# Footprint category calculated from each form field
+FIELD_CATEGORIES = dict(zip(INPUT_FIELDS, FOOTPRINT_CATEGORIES))
+
+# Number of records computed together by the batch endpoint
+BATCH_CHUNK_SIZE = 1000
+
+# Bytes read from the request body at a time by the batch endpoint
+BATCH_READ_SIZE = 64 * 1024
+
+# Longest single record accepted by the batch endpoints, in characters
+MAX_BATCH_RECORD_SIZE = 1024 * 1024
+
+# Hot-path instrumentation, exposed by /metrics
+STAGE_SECONDS = REGISTRY.histogram('carbon_calculate_stage_seconds', "Time spent in each /calculate stage",
+                                   ('stage',))
+CALCULATE_REQUESTS = REGISTRY.counter('carbon_calculate_requests_total',
+                                      "Successful /calculate requests by level combination and region",
+                                      INPUT_FIELDS + ('region',))
+BATCH_RECORDS = REGISTRY.counter('carbon_batch_records_total', "Records processed by /calculate/batch",
+                                 ('success',))
+ERRORS = REGISTRY.counter('carbon_errors_total', "Failed requests by endpoint and error type",
+                          ('endpoint', 'error'))
+SHED_REQUESTS = REGISTRY.counter('carbon_admission_shed_total',
+                                 "Requests rejected with 503 by endpoint and reason (queue_full or timeout)",
+                                 ('endpoint', 'reason'))
+COALESCED_REQUESTS = REGISTRY.counter('carbon_coalesced_requests_total',
+                                      "Requests that shared the result of an identical request in flight",
+                                      ('endpoint',))
+
+def _lap(stage, start):
+    """Record the time since start for a /calculate stage and return the current clock."""
+    return STAGE_SECONDS.time((stage,), start)
+
+@app.route('/')
+def index():
+    """Render the main page."""
+    return render_template('index.html')
+
+def build_calculate_response(state, levels, region, factors=None, timed=False):
+    """
+    Build the /calculate response data for the selected levels and region.
+    
+    Parameters:
+    state: DatasetState to calculate with
+    levels: Dictionary mapping each form field in INPUT_FIELDS to its level
+    region: Region name, or an empty string for global comparison only
+    factors: Optional dictionary mapping form fields to EMISSION_FACTORS names
+    timed: Record per-stage latencies, used when serving a request
+    """
+    start = perf_counter() if timed else None
+    calculator = state.calculator
+    choices = calculator.resolve_factors({FIELD_CATEGORIES[field]: name for field, name in (factors or {}).items()})
+    
+    # Convert levels to numeric values using the mapping
+    electricity = state.consumption_values['electricity'][levels['electricity']]
+    transport = state.consumption_values['transport'][levels['transport']]
+    meat = state.consumption_values['meat'][levels['meat']]
+    waste = state.consumption_values['waste'][levels['waste']]
+    water = state.consumption_values['water'][levels['water']]
+    if timed:
+        start = _lap('lookup', start)
+    
+    # Calculate footprint
+    result = calculator.calculate_footprint(electricity, transport, meat, waste, water, factors=choices)
+    if timed:
+        start = _lap('calculate_footprint', start)
+    
+    # Add the selected levels and emission factors to the result
+    result['selected_levels'] = {field: levels[field] for field in INPUT_FIELDS}
+    result['selected_factors'] = {field: choices[FIELD_CATEGORIES[field]] for field in INPUT_FIELDS}
+    
+    # Get total footprint and level
+    total = result['footprints']['total']
+    level = calculator.get_footprint_level(total)
+    
+    # Get regional comparison if provided
+    regional_comparison = ""
+    if region:
+        regional_comparison = calculator.compare_with_region(total, region)
+    
+    # Format recommendations
+    recommendations = {}
+    if result['detailed_recommendations']:
+        for category, suggestions in result['detailed_recommendations'].items():
+            recommendations[category] = suggestions[:3]  # Limit to top 3 recommendations
+    if timed:
+        _lap('comparison', start)
+    
+    # Prepare response data
+    return {
+        'success': True,
+        'footprints': result['footprints'],
+        'comparisons': result['comparisons'],
+        'level': level,
+        'recommendations': recommendations,
+        'regional_comparison': regional_comparison,
+        'global_averages': result['global_averages'],
+        'selected_levels': result['selected_levels'],
+        'selected_factors': result['selected_factors'],
+        'dataset_version': result['dataset_version']
+    }
+
+def read_factor_choices(state, values):
+    """
+    Read optional '<field>_factor' emission factor choices.
+    
+    Returns a dictionary mapping form fields to the factor names that differ
+    from DEFAULT_FACTORS. Raises ValueError for unknown factor names.
+    """
+    factors = {}
+    for field in INPUT_FIELDS:
+        name = values.get(f'{field}_factor') or DEFAULT_FACTORS[FIELD_CATEGORIES[field]]
+        if not isinstance(name, str) or name not in state.calculator.factor_index[FIELD_CATEGORIES[field]]:
+            raise ValueError(f"Invalid {field} emission factor: {name!r}")
+        if name != DEFAULT_FACTORS[FIELD_CATEGORIES[field]]:
+            factors[field] = name
+    return factors
+
+def response_code(state, levels, region):
+    """
+    Return the response table code for a level/region combination.
+    
+    Codes pack the level index of every field and the region index into one
+    integer. Returns None when a level or region is not a known value.
+    """
+    code = 0
+    for field in INPUT_FIELDS:
+        index = state.level_index[field].get(levels[field])
+        if index is None:
+            return None
+        code = code * len(state.level_index[field]) + index
+    region_index = state.region_index.get(region)
+    if region_index is None:
+        return None
+    return code * len(state.region_index) + region_index
+
+def _encode_json(obj):
+    """Encode a value the way jsonify does for compact responses."""
+    return json.dumps(obj, default=app.json.default, ensure_ascii=app.json.ensure_ascii,
+                      sort_keys=app.json.sort_keys, separators=(',', ':')).encode('utf-8')
+
+def build_static_fragments(state):
+    """
+    Pre-encode the /calculate response parts that never change between requests.
+    
+    Returns a dictionary with the encoded dataset version, global averages
+    and top-three recommendation list for every category.
+    """
+    calculator = state.calculator
+    return {
+        'dataset_version': _encode_json(state.version),
+        'global_averages': _encode_json(calculator.global_averages),
+        'recommendations': {category: _encode_json(category) + b':' + _encode_json(suggestions[:3])
+                            for category, suggestions in calculator.detailed_suggestions.items()}
+    }
+
+def encode_calculate_response(state, levels, region, factors=None, timed=False):
+    """
+    Encode the /calculate response body, byte for byte equal to jsonify output.
+    
+    Only the varying values are encoded per call; the dataset version, global
+    averages and recommendation lists are spliced in from state.fragments. Falls back
+    to jsonify encoding when the app is configured for indented JSON.
+    
+    Returns a (body, footprints) tuple, where footprints is the footprints
+    dictionary of the response.
+    """
+    response_data = build_calculate_response(state, levels, region, factors, timed)
+    start = perf_counter() if timed else None
+    if not app.json.sort_keys or app.json.compact is False or (app.json.compact is None and app.debug):
+        body = app.json.response(response_data).get_data()
+        if timed:
+            _lap('serialize', start)
+        return body, response_data['footprints']
+    
+    recommendations = state.fragments['recommendations']
+    body = b''.join([
+        b'{"comparisons":', _encode_json(response_data['comparisons']),
+        b',"dataset_version":', state.fragments['dataset_version'],
+        b',"footprints":', _encode_json(response_data['footprints']),
+        b',"global_averages":', state.fragments['global_averages'],
+        b',"level":', _encode_json(response_data['level']),
+        b',"recommendations":{', b','.join(recommendations[category]
+                                           for category in sorted(response_data['recommendations'])),
+        b'},"regional_comparison":', _encode_json(response_data['regional_comparison']),
+        b',"selected_factors":', _encode_json(response_data['selected_factors']),
+        b',"selected_levels":', _encode_json(response_data['selected_levels']),
+        b',"success":true}\n'
+    ])
+    if timed:
+        _lap('serialize', start)
+    return body, response_data['footprints']
+
+def build_response_table(state):
+    """
+    Serialize the /calculate response for every dropdown combination.
+    
+    Returns a list of (body, footprints) tuples indexed by response_code, with
+    bodies encoded exactly as jsonify would encode them.
+    """
+    table = [None] * len(state.region_index)
+    for field in INPUT_FIELDS:
+        table *= len(state.level_index[field])
+    
+    with app.app_context():
+        for combination in itertools.product(*(state.consumption_values[field] for field in INPUT_FIELDS)):
+            levels = dict(zip(INPUT_FIELDS, combination))
+            for region in state.region_index:
+                table[response_code(state, levels, region)] = encode_calculate_response(state, levels, region)
+    return table
+
+class ResponseCache:
+    """Thread-safe bounded LRU cache of encoded responses with hit/miss/eviction counters."""
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+    
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'maxsize': self.maxsize
+            }
+
+class _Flight:
+    """A computation in progress and the callers waiting for it."""
+    __slots__ = ('done', 'result', 'error')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical computations.
+    
+    The first caller for a key runs the computation; callers arriving with
+    the same key while it runs wait for it and get the same result, or the
+    same exception.
+    """
+    
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+    
+    def do(self, key, function):
+        """
+        Return function() for key, sharing one call among concurrent callers.
+        
+        Returns:
+        (result, shared) tuple, where shared is True when another caller ran the computation
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = function()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result, False
+    
+    def stats(self):
+        with self.lock:
+            return {'in_flight': len(self.flights), 'coalesced': self.coalesced}
+
+class AdmissionController:
+    """
+    Bounded admission queue in front of the request handlers.
+    
+    At most concurrency requests run at once and at most queue_size more
+    wait for a slot, in arrival order. Requests arriving at a full queue, or
+    waiting longer than timeout seconds, are rejected right away so clients
+    can retry later instead of piling up until they time out.
+    """
+    
+    def __init__(self, concurrency, queue_size, timeout):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = {'queue_full': 0, 'timeout': 0}
+    
+    def acquire(self):
+        """
+        Take a slot, waiting in the queue when all slots are busy.
+        
+        Returns:
+        None when admitted, otherwise the reason for shedding the request
+        ('queue_full' or 'timeout')
+        """
+        with self.condition:
+            if self.running < self.concurrency and not self.waiting:
+                self.running += 1
+                self.admitted += 1
+                return None
+            if self.waiting >= self.queue_size:
+                self.shed['queue_full'] += 1
+                return 'queue_full'
+            self.waiting += 1
+            try:
+                admitted = self.condition.wait_for(lambda: self.running < self.concurrency, self.timeout)
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.shed['timeout'] += 1
+                return 'timeout'
+            self.running += 1
+            self.admitted += 1
+            return None
+    
+    def release(self):
+        """Free a slot taken by acquire()."""
+        with self.condition:
+            self.running -= 1
+            self.condition.notify()
+    
+    def stats(self):
+        with self.condition:
+            return {
+                'running': self.running,
+                'queue_depth': self.waiting,
+                'concurrency': self.concurrency,
+                'queue_size': self.queue_size,
+                'admitted': self.admitted,
+                'shed': dict(self.shed)
+            }
+
+# Seconds a browser may use a factor bundle before checking for a new version
+BUNDLE_REFRESH_SECONDS = 300
+
+def build_factor_bundle(state):
+    """
+    Build the factor bundle script.js uses to calculate results in the browser.
+    
+    The bundle holds everything build_calculate_response needs: consumption
+    values, emission factors, multipliers, the comparison thresholds exactly
+    as the model computes them, the regional comparison messages and the
+    top-three recommendations. Numbers are sent as computed here, so the
+    browser repeats the same double-precision operations and gets identical
+    results.
+    """
+    calculator = state.calculator
+    table = calculator.table
+    regions = {}
+    for region, index in table.region_index.items():
+        # Infinite totals and the regional average itself select each of the three messages
+        regions[region] = {
+            'high': table.regional_total_high[index],
+            'low': table.regional_total_low[index],
+            'messages': {
+                'higher': calculator.compare_with_region(float('inf'), region),
+                'lower': calculator.compare_with_region(float('-inf'), region),
+                'close': calculator.compare_with_region(calculator.regional_averages[region], region)
+            }
+        }
+    return {
+        'version': state.hash,
+        'dataset_version': state.version,
+        'refresh_seconds': BUNDLE_REFRESH_SECONDS,
+        'fields': FIELD_CATEGORIES,
+        'multipliers': dict(zip(FOOTPRINT_CATEGORIES, ANNUAL_MULTIPLIERS)),
+        'consumption_values': state.consumption_values,
+        'factors': calculator.emission_factors,
+        'default_factors': DEFAULT_FACTORS,
+        'categories': COMPARED_CATEGORIES,
+        'global_averages': calculator.global_averages,
+        'thresholds': {'high': table.global_high, 'low': table.global_low},
+        'regions': regions,
+        'recommendations': {category: calculator.detailed_suggestions[category][:3]
+                            for category in calculator.suggestions if category in calculator.detailed_suggestions}
+    }
+
+def make_etag(state, body):
+    """Return a strong ETag for a response body under a dataset."""
+    return f"{state.hash}-{hashlib.sha256(body).hexdigest()[:16]}"
+
+def cached_json_response(body, etag):
+    """Return a JSON response for an encoded body, answering conditional GETs with 304."""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+class DatasetState:
+    """
+    A dataset version with everything precomputed from it.
+    
+    The state is fully built before it is published in dataset_state, and
+    each request reads dataset_state once, so requests in flight during a
+    swap finish with the version they started with.
+    """
+    
+    def __init__(self, dataset, source, mtime):
+        """
+        Parameters:
+        dataset: Dataset tables plus DATASET_VERSION, as for CarbonFootprintCalculator
+        source: Path of the file the dataset was read from
+        mtime: Modification time of source when it was read
+        """
+        self.calculator = CarbonFootprintCalculator(dataset)
+        self.version = self.calculator.dataset_version
+        # Content hash; the version may be an explicit label reused for different content
+        self.hash = carbon_footprint_data.dataset_version(dataset)
+        self.consumption_values = self.calculator.consumption_values
+        # Index of each level within its field, used to build response codes
+        self.level_index = {field: {level: index for index, level in enumerate(self.consumption_values[field])}
+                            for field in INPUT_FIELDS}
+        self.source = source
+        self.mtime = mtime
+        self.whatif_engine = WhatIfEngine(self.calculator)
+        self.planner = GoalPlanner(self.whatif_engine)
+        self.uncertainty_models = {}
+        self.region_index = {region: index for index, region
+                             in enumerate([''] + list(self.calculator.regional_averages))}
+        self.fragments = build_static_fragments(self)
+        self.table = build_response_table(self)
+        with app.app_context():
+            self.regions_body = app.json.response(list(self.calculator.regional_averages.keys())).get_data()
+        self.regions_etag = make_etag(self, self.regions_body)
+        self.bundle = build_factor_bundle(self)
+        self.bundle_body = _encode_json(self.bundle)
+        self.bundle_etag = make_etag(self, self.bundle_body)
+
+def _dataset_source():
+    """Return the path of the file the dataset is loaded from."""
+    return app.config['DATASET_FILE'] or carbon_footprint_data.__file__
+
+def swap_dataset(reload_data=True):
+    """
+    Load the dataset and atomically replace dataset_state.
+    
+    Parameters:
+    reload_data: Re-read the dataset source, so edits are picked up without
+                 restarting the server
+    
+    Returns:
+    The new DatasetState
+    """
+    global dataset_state
+    with _dataset_lock:
+        source = _dataset_source()
+        mtime = os.stat(source).st_mtime
+        if app.config['DATASET_FILE']:
+            dataset = carbon_footprint_data.load_snapshot(source)
+        else:
+            if reload_data:
+                importlib.reload(carbon_footprint_data)
+            dataset = carbon_footprint_data.current_dataset()
+        state = DatasetState(dataset, source, mtime)
+        dataset_state = state
+    
+    # Cache keys include the content hash, so this only frees entries of the old dataset
+    response_cache.clear()
+    return state
+
+# Dataset snapshot written by carbon_footprint_data.py --write-snapshot; the
+# dataset module itself is used when empty
+app.config.setdefault('DATASET_FILE', os.environ.get('CARBON_DATASET_SNAPSHOT', ''))
+
+# Swap in a new dataset version when the dataset source changes on disk
+app.config.setdefault('RESPONSE_TABLE_AUTO_RELOAD', os.environ.get('CARBON_RESPONSE_TABLE_AUTO_RELOAD',
+                                                                   '1' if app.config['DATASET_FILE'] else '0') == '1')
+
+# Seconds between checks of the dataset source for changes
+app.config.setdefault('DATASET_CHECK_INTERVAL', 1.0)
+
+# Maximum number of /calculate responses kept in the LRU cache
+app.config.setdefault('RESPONSE_CACHE_SIZE', int(os.environ.get('CARBON_RESPONSE_CACHE_SIZE', '4096')))
+
+# Requests handled at once, and requests allowed to wait for a slot before
+# new ones are rejected with 503; admission control is off when concurrency is 0
+app.config.setdefault('ADMISSION_CONCURRENCY', int(os.environ.get('CARBON_ADMISSION_CONCURRENCY', '32')))
+app.config.setdefault('ADMISSION_QUEUE_SIZE', int(os.environ.get('CARBON_ADMISSION_QUEUE_SIZE', '64')))
+
+# Seconds a request may wait for a slot, and the Retry-After value of rejected requests
+app.config.setdefault('ADMISSION_TIMEOUT', float(os.environ.get('CARBON_ADMISSION_TIMEOUT', '1.0')))
+app.config.setdefault('ADMISSION_RETRY_AFTER', 1)
+
+# Seconds a /plan/batch request may spend planning; requests may ask for less with budget_ms
+app.config.setdefault('PLAN_BUDGET', float(os.environ.get('CARBON_PLAN_BUDGET', '2.0')))
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
+calculate_flights = SingleFlight()
+admission = AdmissionController(app.config['ADMISSION_CONCURRENCY'], app.config['ADMISSION_QUEUE_SIZE'],
+                                app.config['ADMISSION_TIMEOUT'])
+REGISTRY.gauge('carbon_admission_queue_depth', "Requests waiting for an admission slot",
+               function=lambda: admission.waiting)
+REGISTRY.gauge('carbon_admission_running', "Requests holding an admission slot",
+               function=lambda: admission.running)
+_dataset_lock = threading.Lock()
+_dataset_checked = 0.0
+_dataset_rejected_mtime = None
+dataset_state = None
+swap_dataset(reload_data=False)
+
+@app.before_request
+def check_dataset():
+    """Swap in a new dataset version when its source changed, at most once per DATASET_CHECK_INTERVAL."""
+    global _dataset_checked, _dataset_rejected_mtime
+    if not app.config['RESPONSE_TABLE_AUTO_RELOAD']:
+        return
+    now = perf_counter()
+    if now - _dataset_checked < app.config['DATASET_CHECK_INTERVAL']:
+        return
+    _dataset_checked = now
+    source = _dataset_source()
+    try:
+        mtime = os.stat(source).st_mtime
+    except OSError:
+        return
+    if (source == dataset_state.source and mtime == dataset_state.mtime) or mtime == _dataset_rejected_mtime:
+        return
+    try:
+        swap_dataset()
+    except Exception as e:
+        # Keep serving the current version until the source changes again
+        _dataset_rejected_mtime = mtime
+        ERRORS.inc(('dataset', type(e).__name__))
+        app.logger.exception("Could not load the dataset from %s", dataset_state.source)
+
+# Directory shared by all workers for population statistics snapshots
+app.config.setdefault('POPULATION_STATS_DIR', os.environ.get('CARBON_POPULATION_STATS_DIR', ''))
+
+# Seconds between saving this worker's statistics and reloading the others'
+app.config.setdefault('POPULATION_STATS_INTERVAL', 10.0)
+
+population_stats = PopulationStats()
+_population_merged = None
+_population_synced = 0.0
+_population_lock = threading.Lock()
+
+def _population_path():
+    return os.path.join(app.config['POPULATION_STATS_DIR'], f'population-{os.getpid()}.bin')
+
+def sync_population_stats(force=False):
+    """
+    Share population statistics with the other workers.
+    
+    Saves this worker's statistics to POPULATION_STATS_DIR and merges every
+    worker's file into the view used for percentile queries, at most once per
+    POPULATION_STATS_INTERVAL unless forced. Without a shared directory the
+    local statistics are used directly.
+    """
+    global _population_merged, _population_synced
+    directory = app.config['POPULATION_STATS_DIR']
+    if not directory:
+        return population_stats
+    now = perf_counter()
+    if not force and _population_merged is not None and now - _population_synced < app.config['POPULATION_STATS_INTERVAL']:
+        return _population_merged
+    with _population_lock:
+        os.makedirs(directory, exist_ok=True)
+        population_stats.save(_population_path())
+        paths = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                 if name.startswith('population-') and name.endswith('.bin')]
+        _population_merged = merge_files(paths)
+        _population_synced = now
+    return _population_merged
+
+def observe_population(footprints, region):
+    """Record a served calculation in the population statistics."""
+    population_stats.observe(footprints, region)
+    if app.config['POPULATION_STATS_DIR'] and perf_counter() - _population_synced >= app.config['POPULATION_STATS_INTERVAL']:
+        sync_population_stats()
+
+# Directory of the footprint history store; history is not recorded when empty
+app.config.setdefault('HISTORY_DIR', os.environ.get('CARBON_HISTORY_DIR', ''))
+
+_history_store = None
+_history_lock = threading.Lock()
+
+def get_history_store():
+    """Return the shared HistoryStore, opening it on first use, or None when disabled."""
+    global _history_store
+    if not app.config['HISTORY_DIR']:
+        return None
+    if _history_store is None:
+        with _history_lock:
+            if _history_store is None:
+                _history_store = HistoryStore(app.config['HISTORY_DIR'])
+    return _history_store
+
+def admission_controlled(view):
+    """
+    Run a view only once the admission controller gives it a slot.
+    
+    Shed requests get a 503 with Retry-After. The slot of a streamed
+    response is held until the stream is closed.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not admission.concurrency:
+            return view(*args, **kwargs)
+        reason = admission.acquire()
+        if reason is not None:
+            SHED_REQUESTS.inc((request.path, reason))
+            response = jsonify({'success': False, 'error': "The server is busy, please retry later"})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(app.config['ADMISSION_RETRY_AFTER'])
+            return response
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except BaseException:
+            admission.release()
+            raise
+        if response.is_streamed:
+            response.call_on_close(admission.release)
+        else:
+            admission.release()
+        return response
+    return wrapper
+
+def compute_calculate_entry(state, key, levels, region, factors):
+    """Compute, cache and return the (body, etag, footprints) entry of a /calculate request."""
+    start = perf_counter()
+    # Every dropdown combination with default factors is in the precomputed table
+    code = response_code(state, levels, region) if not factors else None
+    if code is not None:
+        body, footprints = state.table[code]
+        start = _lap('table', start)
+    else:
+        body, footprints = encode_calculate_response(state, levels, region, factors, timed=True)
+        start = perf_counter()
+    entry = (body, make_etag(state, body), footprints)
+    response_cache.put(key, entry)
+    _lap('etag', start)
+    return entry
+
+@app.route('/calculate', methods=['GET', 'POST'])
+@admission_controlled
+def calculate():
+    """Calculate carbon footprint based on form data or query parameters."""
+    try:
+        request_start = start = perf_counter()
+        state = dataset_state
+        
+        # Get form data (now dropdown values instead of numbers)
+        levels = {field: request.values.get(field, 'moderate') for field in INPUT_FIELDS}
+        region = request.values.get('region', '')
+        factors = read_factor_choices(state, request.values)
+        start = _lap('parse', start)
+        
+        key = (tuple(levels[field] for field in INPUT_FIELDS), tuple(sorted(factors.items())), region, state.hash)
+        entry = response_cache.get(key)
+        start = _lap('cache', start)
+        if entry is None:
+            # Identical requests arriving while this one is computed wait for its entry
+            entry, shared = calculate_flights.do(key, lambda: compute_calculate_entry(state, key, levels,
+                                                                                      region, factors))
+            if shared:
+                COALESCED_REQUESTS.inc(('/calculate',))
+            start = perf_counter()
+        
+        body, etag, footprints = entry
+        response = cached_json_response(body, etag)
+        _lap('respond', start)
+        _lap('total', request_start)
+        
+        region_label = region if region in state.region_index else 'unknown'
+        CALCULATE_REQUESTS.inc(key[0] + (region_label or 'none',))
+        observe_population(footprints, region if region_label != 'unknown' else '')
+        
+        # Record the result in the user's history when a user id is given
+        user_id = request.values.get('user_id', '')
+        store = get_history_store() if user_id else None
+        if store is not None:
+            store.append(user_id, footprints)
+        return response
+    
+    except Exception as e:
+        ERRORS.inc(('/calculate', type(e).__name__))
+        return jsonify({'success': False, 'error': str(e)})
+
+def _read_text(stream):
+    """Yield decoded text from a binary stream in bounded-size pieces."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        data = stream.read(BATCH_READ_SIZE)
+        if not data:
+            text = decoder.decode(b'', final=True)
+            if text:
+                yield text
+            return
+        text = decoder.decode(data)
+        if text:
+            yield text
+
+class MalformedRecord:
+    """Stands in for an NDJSON line that is not valid JSON, so the lines after it are still read."""
+    __slots__ = ('error',)
+    
+    def __init__(self, error):
+        self.error = error
+
+def check_record_object(record):
+    """Raise ValueError unless a batch record is a JSON object."""
+    if isinstance(record, MalformedRecord):
+        raise ValueError(record.error)
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+
+def _parse_line(line):
+    """Decode one NDJSON line, or return a MalformedRecord describing why it is invalid."""
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        return MalformedRecord(f"Invalid JSON: {e}")
+
+def iter_batch_records(stream):
+    """
+    Yield records from a JSON array or NDJSON body without reading it all.
+    
+    The format is detected from the first non-whitespace character: '[' means
+    a JSON array of objects, anything else is treated as one object per line.
+    An NDJSON line that is not valid JSON is yielded as a MalformedRecord; a
+    malformed JSON array raises ValueError. A record longer than
+    MAX_BATCH_RECORD_SIZE raises ValueError, so a malformed body is not
+    re-parsed as it grows.
+    """
+    decoder = json.JSONDecoder()
+    pieces = _read_text(stream)
+    buffer = ''
+    pos = 0
+    
+    def fill():
+        nonlocal buffer, pos
+        if len(buffer) - pos > MAX_BATCH_RECORD_SIZE:
+            raise ValueError(f"Record longer than {MAX_BATCH_RECORD_SIZE} characters or malformed")
+        piece = next(pieces, None)
+        if piece is None:
+            return False
+        buffer = buffer[pos:] + piece
+        pos = 0
+        return True
+    
+    # Find the first meaningful character to detect the format
+    while True:
+        stripped = buffer.lstrip()
+        if stripped or not fill():
+            break
+    buffer = buffer.lstrip()
+    if not buffer:
+        return
+    
+    if buffer[0] != '[':
+        # NDJSON: one record per non-empty line
+        searched = 0
+        while True:
+            newline = buffer.find('\n', pos + searched)
+            if newline == -1:
+                searched = len(buffer) - pos
+                if fill():
+                    continue
+                line = buffer[pos:].strip()
+                if line:
+                    yield _parse_line(line)
+                return
+            line = buffer[pos:newline].strip()
+            pos = newline + 1
+            searched = 0
+            if line:
+                yield _parse_line(line)
+    
+    # JSON array: decode one element at a time
+    pos = 1
+    expect_value = True
+    trailing_comma = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buffer):
+            if not fill():
+                raise ValueError("Unterminated JSON array")
+            continue
+        if buffer[pos] == ']':
+            if expect_value and trailing_comma:
+                raise ValueError("Trailing comma in JSON array")
+            return
+        if buffer[pos] == ',' and not expect_value:
+            pos += 1
+            expect_value = trailing_comma = True
+            continue
+        if not expect_value:
+            raise ValueError("Expected ',' or ']' in JSON array")
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Possibly cut off by the end of the buffer: retry with more of the body
+            if fill():
+                continue
+            raise
+        pos = end
+        expect_value = False
+        yield record
+
+def parse_batch_record(state, record):
+    """
+    Validate one batch record against the dataset's CONSUMPTION_VALUES.
+    
+    Returns a (levels, factors, region) tuple, where levels holds the selected
+    level for each form field and factors any non-default '<field>_factor'
+    choices. Missing levels default to 'moderate' like /calculate.
+    """
+    check_record_object(record)
+    levels = {}
+    for field in INPUT_FIELDS:
+        level = record.get(field, 'moderate')
+        if not isinstance(level, str) or level not in state.consumption_values[field]:
+            raise ValueError(f"Invalid {field} level: {level!r}")
+        levels[field] = level
+    region = record.get('region', '') or ''
+    if not isinstance(region, str) or region and region not in state.calculator.regional_averages:
+        raise ValueError(f"Invalid region: {region!r}")
+    return levels, read_factor_choices(state, record), region
+
+def _compute_batch_chunk(state, chunk):
+    """Compute one chunk of (index, levels, factors, region) entries with calculate_footprints_batch."""
+    calculator = state.calculator
+    BATCH_RECORDS.inc(('true',), len(chunk))
+    inputs = [[state.consumption_values[field][levels[field]] for _, levels, _, _ in chunk]
+              for field in INPUT_FIELDS]
+    factor_codes = {}
+    for field, category in FIELD_CATEGORIES.items():
+        names = [factors.get(field, DEFAULT_FACTORS[category]) for _, _, factors, _ in chunk]
+        factor_codes[category] = [calculator.factor_index[category][name] for name in names]
+    result = calculator.calculate_footprints_batch(*inputs, factors=factor_codes)
+    population_stats.observe_batch(result['footprints'], [region for _, _, _, region in chunk])
+    return result
+
+def _calculate_batch_chunk(state, chunk):
+    """Compute one chunk of (index, levels, factors, region) entries and yield NDJSON lines."""
+    if not chunk:
+        return
+    calculator = state.calculator
+    result = _compute_batch_chunk(state, chunk)
+    footprints = {category: values.tolist() for category, values in result['footprints'].items()}
+    comparisons = {category: codes.tolist() for category, codes in result['comparisons'].items()}
+    for row, (index, levels, factors, region) in enumerate(chunk):
+        total = footprints['total'][row]
+        yield json.dumps({
+            'index': index,
+            'success': True,
+            'footprints': {category: values[row] for category, values in footprints.items()},
+            'comparisons': {category: LEVEL_NAMES[codes[row]] for category, codes in comparisons.items()},
+            'level': LEVEL_NAMES[comparisons['total'][row]],
+            'recommendations': [category for category, codes in comparisons.items()
+                                if codes[row] == LEVEL_HIGH and category in calculator.suggestions],
+            'regional_comparison': calculator.compare_with_region(total, region) if region else "",
+            'selected_levels': levels,
+            'selected_factors': {field: factors.get(field, DEFAULT_FACTORS[category])
+                                 for field, category in FIELD_CATEGORIES.items()},
+            'dataset_version': state.version
+        }) + '\n'
+
+def _binary_batch_chunk(state, chunk):
+    """Compute one chunk of (index, levels, factors, region) entries and yield its binary records."""
+    if not chunk:
+        return
+    result = _compute_batch_chunk(state, chunk)
+    yield carbon_footprint_binary.encode_records(result['footprints'], result['comparisons'])
+
+def generate_batch_results(state, records, binary=False):
+    """
+    Validate and compute records in chunks with one DatasetState.
+    
+    Yields one NDJSON line per record, or with binary=True a
+    carbon_footprint_binary header followed by one record per input record.
+    """
+    if binary:
+        calculate_chunk = _binary_batch_chunk
+        yield carbon_footprint_binary.encode_header(state.version)
+    else:
+        calculate_chunk = _calculate_batch_chunk
+    chunk = []
+    index = -1
+    try:
+        for index, record in enumerate(records):
+            try:
+                levels, factors, region = parse_batch_record(state, record)
+            except ValueError as e:
+                yield from calculate_chunk(state, chunk)
+                chunk = []
+                ERRORS.inc(('/calculate/batch', type(e).__name__))
+                BATCH_RECORDS.inc(('false',))
+                if binary:
+                    yield carbon_footprint_binary.encode_failures(1)
+                else:
+                    yield json.dumps({'index': index, 'success': False, 'error': str(e)}) + '\n'
+                continue
+            chunk.append((index, levels, factors, region))
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                yield from calculate_chunk(state, chunk)
+                chunk = []
+        yield from calculate_chunk(state, chunk)
+    except ValueError as e:
+        # Malformed body: report what was computed so far, then the error
+        yield from calculate_chunk(state, chunk)
+        ERRORS.inc(('/calculate/batch', type(e).__name__))
+        if binary:
+            yield carbon_footprint_binary.encode_failures(1, carbon_footprint_binary.STATUS_MALFORMED)
+        else:
+            yield json.dumps({'index': index + 1, 'success': False, 'error': str(e)}) + '\n'
+
+@app.route('/calculate/batch', methods=['POST'])
+@admission_controlled
+def calculate_batch():
+    """
+    Calculate carbon footprints for a JSON array or NDJSON stream of records.
+    
+    Each record holds the same level fields as the /calculate form plus an
+    optional region. Results are streamed back as NDJSON, one line per record
+    in input order, so memory use does not grow with the request size.
+    Clients accepting carbon_footprint_binary.MIMETYPE get the fixed-layout
+    binary records instead.
+    """
+    records = iter_batch_records(request.stream)
+    binary = (request.accept_mimetypes.best_match(['application/x-ndjson', carbon_footprint_binary.MIMETYPE])
+              == carbon_footprint_binary.MIMETYPE)
+    response = Response(stream_with_context(generate_batch_results(dataset_state, records, binary)),
+                        mimetype=carbon_footprint_binary.MIMETYPE if binary else 'application/x-ndjson')
+    response.vary.add('Accept')
+    return response
+
+@app.route('/regions', methods=['GET'])
+def get_regions():
+    """Return a list of valid regions."""
+    state = dataset_state
+    return cached_json_response(state.regions_body, state.regions_etag)
+
+@app.route('/bundle', methods=['GET'])
+def get_bundle():
+    """
+    Return the factor bundle of the current dataset.
+    
+    Browsers revalidate it with its ETag on every use; the same bundle is
+    served for long-term caching at /bundle/<version>.
+    """
+    state = dataset_state
+    response = cached_json_response(state.bundle_body, state.bundle_etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/bundle/<version>', methods=['GET'])
+def get_versioned_bundle(version):
+    """Return the factor bundle of a version, cacheable forever; 404 once the version is replaced."""
+    state = dataset_state
+    if version != state.bundle['version']:
+        return jsonify({'success': False, 'error': f"Unknown bundle version: {version!r}",
+                        'version': state.bundle['version']}), 404
+    response = cached_json_response(state.bundle_body, state.bundle_etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Return instrumentation data in the Prometheus text format."""
+    if not REGISTRY.enabled:
+        return Response("Metrics are disabled\n", status=404, mimetype='text/plain')
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/whatif', methods=['GET', 'POST'])
+@admission_controlled
+def whatif():
+    """Rank reduction suggestions by estimated tons of CO2 saved for the given levels."""
+    try:
+        state = dataset_state
+        levels = {field: request.values.get(field, 'moderate') for field in INPUT_FIELDS}
+        factors = read_factor_choices(state, request.values)
+        limit = request.values.get('limit', type=int)
+        inputs = [state.consumption_values[field][levels[field]] for field in INPUT_FIELDS]
+        suggestions = state.whatif_engine.rank(*inputs, factors={FIELD_CATEGORIES[field]: name
+                                                                 for field, name in factors.items()}, limit=limit)
+        return jsonify({'success': True, 'suggestions': suggestions, 'dataset_version': state.version})
+    
+    except Exception as e:
+        ERRORS.inc(('/whatif', type(e).__name__))
+        return jsonify({'success': False, 'error': str(e)})
+
+# Records planned together by /plan/batch, and so the granularity of its latency budget
+PLAN_CHUNK_SIZE = 256
+
+def parse_plan_record(state, record):
+    """
+    Validate one /plan record.
+    
+    Returns a (levels, factors, target) tuple as for parse_batch_record, with
+    the optional 'target' total defaulting to the global average total.
+    """
+    levels, factors, _ = parse_batch_record(state, record)
+    target = record.get('target')
+    if target is None or target == '':
+        return levels, factors, state.calculator.global_averages['total']
+    if isinstance(target, bool):
+        raise ValueError(f"Invalid target: {target!r}")
+    try:
+        return levels, factors, float(target)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid target: {target!r}")
+
+def _plan_batch_chunk(state, chunk):
+    """
+    Plan one chunk of entries and yield NDJSON lines in input order.
+    
+    Entries are (index, levels, factors, target) tuples, or (index, error)
+    tuples for records that failed validation.
+    """
+    if not chunk:
+        return
+    calculator = state.calculator
+    valid = [entry for entry in chunk if len(entry) == 4]
+    if valid:
+        inputs = [[state.consumption_values[field][levels[field]] for _, levels, _, _ in valid] for field in INPUT_FIELDS]
+        factor_codes = {}
+        for field, category in FIELD_CATEGORIES.items():
+            names = [factors.get(field, DEFAULT_FACTORS[category]) for _, _, factors, _ in valid]
+            factor_codes[category] = [calculator.factor_index[category][name] for name in names]
+        targets = [target for _, _, _, target in valid]
+        result = state.planner.plan_batch(*inputs, targets=targets, factors=factor_codes)
+    row = 0
+    for entry in chunk:
+        if len(entry) == 2:
+            yield json.dumps({'index': entry[0], 'success': False, 'error': entry[1]}) + '\n'
+            continue
+        line = {'index': entry[0], 'success': True}
+        line.update(state.planner.describe(result, row, entry[3]))
+        line['dataset_version'] = state.version
+        row += 1
+        yield json.dumps(line) + '\n'
+
+def generate_plan_results(state, records, budget):
+    """
+    Validate and plan records in chunks, yielding one NDJSON line per record.
+    
+    Once budget seconds have passed, a final line reports the index of the
+    first record left unplanned and the rest of the body is not read.
+    """
+    start = perf_counter()
+    chunk = []
+    index = -1
+    try:
+        for index, record in enumerate(records):
+            try:
+                levels, factors, target = parse_plan_record(state, record)
+                chunk.append((index, levels, factors, target))
+            except ValueError as e:
+                ERRORS.inc(('/plan/batch', type(e).__name__))
+                chunk.append((index, str(e)))
+            if len(chunk) >= PLAN_CHUNK_SIZE:
+                if perf_counter() - start > budget:
+                    break
+                yield from _plan_batch_chunk(state, chunk)
+                chunk = []
+        else:
+            if not chunk or perf_counter() - start <= budget:
+                yield from _plan_batch_chunk(state, chunk)
+                return
+        # Budget used up: report the first record left unplanned
+        ERRORS.inc(('/plan/batch', 'BudgetExceeded'))
+        yield json.dumps({'index': chunk[0][0], 'success': False, 'budget_exceeded': True,
+                          'error': f"Latency budget of {budget * 1000:g} ms exceeded; "
+                                   f"records from this index on were not planned"}) + '\n'
+    except ValueError as e:
+        # Malformed body: report what was planned so far, then the error
+        yield from _plan_batch_chunk(state, chunk)
+        ERRORS.inc(('/plan/batch', type(e).__name__))
+        yield json.dumps({'index': index + 1, 'success': False, 'error': str(e)}) + '\n'
+
+def read_plan_budget():
+    """Return the /plan/batch budget in seconds: PLAN_BUDGET, or the smaller budget_ms of the request."""
+    budget = app.config['PLAN_BUDGET']
+    requested = request.args.get('budget_ms')
+    if requested is not None:
+        try:
+            requested = float(requested) / 1000
+        except ValueError:
+            raise ValueError(f"Invalid budget_ms: {requested!r}")
+        if requested <= 0:
+            raise ValueError("budget_ms must be positive")
+        budget = min(budget, requested)
+    return budget
+
+@app.route('/plan', methods=['GET', 'POST'])
+@admission_controlled
+def plan():
+    """
+    Return the least-effort set of suggestions that brings the given levels under a target total.
+    
+    Takes the same fields as /calculate plus target (tons CO2/year, default
+    the global average total). Where the target is out of reach, the plan
+    with the lowest total is returned with reached set to false.
+    """
+    try:
+        state = dataset_state
+        levels, factors, target = parse_plan_record(state, request.values)
+        inputs = [state.consumption_values[field][levels[field]] for field in INPUT_FIELDS]
+        result = state.planner.plan(*inputs, target=target,
+                                    factors={FIELD_CATEGORIES[field]: name for field, name in factors.items()})
+        response = {'success': True}
+        response.update(result)
+        response['dataset_version'] = state.version
+        return jsonify(response)
+    
+    except Exception as e:
+        ERRORS.inc(('/plan', type(e).__name__))
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/plan/batch', methods=['POST'])
+@admission_controlled
+def plan_batch():
+    """
+    Plan suggestions for a JSON array or NDJSON stream of /plan records.
+    
+    Results are streamed back as NDJSON in input order. Planning stops once
+    the PLAN_BUDGET (or a smaller budget_ms query parameter) is used up.
+    """
+    try:
+        budget = read_plan_budget()
+    except ValueError as e:
+        ERRORS.inc(('/plan/batch', type(e).__name__))
+        return jsonify({'success': False, 'error': str(e)}), 400
+    records = iter_batch_records(request.stream)
+    return Response(stream_with_context(generate_plan_results(dataset_state, records, budget)),
+                    mimetype='application/x-ndjson')
+
+# Largest number of Monte Carlo samples a single /uncertainty request may ask for
+MAX_UNCERTAINTY_SAMPLES = 10000
+
+def get_uncertainty_model(state, samples, seed):
+    """Return the UncertaintyModel for a dataset, sample count and seed, drawing its samples on first use."""
+    models = state.uncertainty_models
+    key = (samples, seed)
+    model = models.get(key)
+    if model is None:
+        if len(models) >= 16:
+            models.clear()
+        model = models[key] = UncertaintyModel(state.calculator, samples, seed)
+    return model
+
+@app.route('/uncertainty', methods=['GET', 'POST'])
+@admission_controlled
+def uncertainty():
+    """
+    Return Monte Carlo uncertainty bands for the given levels.
+    
+    Takes the same fields as /calculate plus samples (default
+    DEFAULT_SAMPLES, at most MAX_UNCERTAINTY_SAMPLES) and seed. Returns the
+    mean, 5th and 95th percentile footprint per category and in total.
+    """
+    try:
+        state = dataset_state
+        levels = {field: request.values.get(field, 'moderate') for field in INPUT_FIELDS}
+        factors = read_factor_choices(state, request.values)
+        samples = request.values.get('samples', DEFAULT_SAMPLES, type=int)
+        seed = request.values.get('seed', 0, type=int)
+        if not 1 <= samples <= MAX_UNCERTAINTY_SAMPLES:
+            raise ValueError(f"samples must be between 1 and {MAX_UNCERTAINTY_SAMPLES}")
+        inputs = [state.consumption_values[field][levels[field]] for field in INPUT_FIELDS]
+        bands = get_uncertainty_model(state, samples, seed).calculate_footprints_batch(
+            *inputs, factors={FIELD_CATEGORIES[field]: name for field, name in factors.items()})
+        response = {'success': True, 'samples': samples, 'seed': seed, 'dataset_version': state.version}
+        for label, values in bands.items():
+            response[label] = {category: float(value) for category, value in values.items()}
+        return jsonify(response)
+    
+    except Exception as e:
+        ERRORS.inc(('/uncertainty', type(e).__name__))
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/percentile', methods=['GET'])
+def get_percentile():
+    """
+    Return the percentile of a footprint among the calculations served so far.
+    
+    Query parameters: value (tons CO2/year), region (default: all regions)
+    and category (default: total).
+    """
+    value = request.args.get('value', type=float)
+    region = request.args.get('region', '') or ALL_REGIONS
+    category = request.args.get('category', 'total')
+    if value is None or category not in COMPARED_CATEGORIES:
+        return jsonify({'success': False, 'error': "A numeric value and a valid category are required"})
+    stats = sync_population_stats()
+    return jsonify({
+        'success': True,
+        'region': region,
+        'category': category,
+        'percentile': stats.percentile(value, region, category),
+        'count': stats.count(region, category)
+    })
+
+@app.route('/history/users/<user_id>', methods=['GET'])
+def get_user_history(user_id):
+    """
+    Return a user's footprint history.
+    
+    Query parameters: start and end (ISO dates or Unix seconds, end
+    exclusive) and period. Without a period the totals over time and the
+    trend in tons per year are returned; with period=month or period=year
+    the user's records are rolled up per period.
+    """
+    store = get_history_store()
+    if store is None:
+        return jsonify({'success': False, 'error': "History is not enabled"}), 404
+    try:
+        start, end = request.args.get('start'), request.args.get('end')
+        period = request.args.get('period')
+        if period:
+            return jsonify({'success': True, 'user_id': user_id, 'period': period,
+                            'rollup': store.rollup(period, start, end, user_id)})
+        return jsonify(dict(store.trend(user_id, start, end), success=True, user_id=user_id))
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/history/rollup', methods=['GET'])
+def get_history_rollup():
+    """Return mean footprints of all users per month or year (query parameters: period, start, end)."""
+    store = get_history_store()
+    if store is None:
+        return jsonify({'success': False, 'error': "History is not enabled"}), 404
+    try:
+        period = request.args.get('period', 'month')
+        return jsonify({'success': True, 'period': period,
+                        'rollup': store.rollup(period, request.args.get('start'), request.args.get('end'))})
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/dataset', methods=['GET'])
+def get_dataset():
+    """Return the version, content hash and source file of the dataset being served."""
+    state = dataset_state
+    return jsonify({'version': state.version, 'hash': state.hash, 'source': state.source})
+
+_org_tree = None
+_org_lock = threading.Lock()
+
+def get_org_tree():
+    """Return the shared OrgTree, recalculating it when the dataset version changed."""
+    global _org_tree
+    state = dataset_state
+    with _org_lock:
+        if _org_tree is None:
+            _org_tree = OrgTree(state.calculator)
+        elif _org_tree.calculator is not state.calculator:
+            _org_tree.recalculate(state.calculator)
+    return _org_tree
+
+def parse_org_record(state, record):
+    """
+    Validate one organization record.
+    
+    Records of kind 'person', or with any form level field, are people and
+    are validated like batch records; all others are groups.
+    
+    Returns:
+    ('group', (node_id, parent, kind, name, region)) or
+    ('person', (node_id, parent, name, levels, factors, region))
+    """
+    check_record_object(record)
+    node_id = record.get('id')
+    if not isinstance(node_id, str) or not node_id:
+        raise ValueError("Record needs a non-empty string id")
+    parent = record.get('parent') or None
+    if parent is not None and not isinstance(parent, str):
+        raise ValueError(f"Invalid parent: {parent!r}")
+    kind = record.get('kind', '')
+    name = record.get('name', '')
+    if not isinstance(kind, str) or not isinstance(name, str):
+        raise ValueError("Record kind and name must be strings")
+    if kind == 'person' or any(field in record for field in INPUT_FIELDS):
+        levels, factors, region = parse_batch_record(state, record)
+        return 'person', (node_id, parent, name, levels, factors, region)
+    region = record.get('region', '') or ''
+    if region and region not in state.calculator.regional_averages:
+        raise ValueError(f"Invalid region: {region!r}")
+    return 'group', (node_id, parent, kind, name, region)
+
+@app.route('/org/nodes', methods=['POST'])
+@admission_controlled
+def load_org_nodes():
+    """
+    Add organization nodes and people from a JSON array or NDJSON stream.
+    
+    Group records hold id, parent, kind (e.g. 'site'), name and region.
+    People hold id, parent, name and the same level and factor fields as
+    /calculate; existing people are updated. Every record is validated
+    against the tree and the rest of the request before anything is added.
+    """
+    try:
+        tree = get_org_tree()
+        state = dataset_state
+        groups = []
+        people = []
+        for record in iter_batch_records(request.stream):
+            kind, row = parse_org_record(state, record)
+            (people if kind == 'person' else groups).append(row)
+        inputs = [[state.consumption_values[field][levels[field]] for _, _, _, levels, _, _ in people]
+                  for field in INPUT_FIELDS]
+        factor_index = tree.calculator.factor_index
+        factor_codes = {category: [factor_index[category][factors.get(field, DEFAULT_FACTORS[category])]
+                                   for _, _, _, _, factors, _ in people]
+                        for field, category in FIELD_CATEGORIES.items()}
+        added, updated = tree.load(groups, [row[0] for row in people], [row[1] for row in people], inputs,
+                                   factor_codes, names=[row[2] for row in people], regions=[row[5] for row in people])
+        return jsonify({'success': True, 'groups': added, 'people': updated, 'nodes': len(tree)})
+    
+    except ValueError as e:
+        ERRORS.inc(('/org/nodes', type(e).__name__))
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/org/members/<member_id>', methods=['PUT', 'POST'])
+def set_org_member(member_id):
+    """Add a person or change their levels, updating only the groups above them; returns the person's node."""
+    try:
+        tree = get_org_tree()
+        record = request.get_json(silent=True)
+        if record is None:
+            record = request.values.to_dict()
+        if not isinstance(record, dict):
+            raise ValueError("Record must be a JSON object")
+        record = dict(record, id=member_id, kind='person')
+        state = dataset_state
+        _, (node_id, parent, name, levels, factors, region) = parse_org_record(state, record)
+        tree.set_member(node_id, [state.consumption_values[field][levels[field]] for field in INPUT_FIELDS],
+                        {FIELD_CATEGORIES[field]: factor for field, factor in factors.items()},
+                        parent_id=parent, name=name, region=region)
+        return jsonify(dict(tree.summary(node_id), success=True))
+    
+    except ValueError as e:
+        ERRORS.inc(('/org/members', type(e).__name__))
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/org/members/<member_id>', methods=['DELETE'])
+def remove_org_member(member_id):
+    """Remove a person from the organization tree."""
+    try:
+        get_org_tree().remove_member(member_id)
+        return jsonify({'success': True})
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+
+@app.route('/org/nodes/<node_id>', methods=['GET'])
+def get_org_node(node_id):
+    """
+    Return a node's category totals, per-person means and comparison levels.
+    
+    With expand=1 the summaries of its children are included as well.
+    """
+    try:
+        return jsonify(dict(get_org_tree().summary(node_id, request.args.get('expand') == '1'), success=True))
+    except KeyError:
+        return jsonify({'success': False, 'error': f"Unknown node: {node_id!r}"}), 404
+
+@app.route('/org', methods=['GET'])
+def get_org_roots():
+    """Return the summaries of the root nodes of the organization tree."""
+    tree = get_org_tree()
+    return jsonify({'success': True, 'roots': [tree.summary(node_id) for node_id in tree.roots()]})
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Return hit, miss and eviction counters for the response cache."""
+    return jsonify(response_cache.stats())
+
+@app.route('/admission/stats', methods=['GET'])
+def get_admission_stats():
+    """Return the admission queue depth, shed counts and coalesced /calculate requests."""
+    return jsonify(dict(admission.stats(), coalescing=calculate_flights.stats()))
+
+if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
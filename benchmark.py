@@ -0,0 +1,326 @@
+"""
+Carbon Footprint Calculator Benchmarks
+
+Measures the calculation model, the batch path, the Flask endpoints and the
+command line start-up time, and writes the results as JSON. A saved result
+file can be passed as a baseline to flag regressions.
+
+Usage:
+python benchmark.py --output results.json
+python benchmark.py --baseline results.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+# Registered benchmarks as (group, name, function) tuples, in run order
+BENCHMARKS = []
+
+# Batch sizes measured by the batch group, capped by --max-batch-size
+BATCH_SIZES = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Default relative slowdown that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def benchmark(group):
+    """Register a benchmark function under a group name."""
+    def register(function):
+        BENCHMARKS.append((group, function.__name__.replace('bench_', ''), function))
+        return function
+    return register
+
+def measure(function, repeat=5, items=1, min_time=0.2):
+    """
+    Time a function call and summarize the results
+
+    Parameters:
+    function: Callable with no arguments
+    repeat: Number of timing rounds
+    items: Number of items processed per call, used for items_per_sec
+    min_time: Minimum seconds per round; calls are looped until reached
+
+    Returns:
+    Dictionary with per-call timings in seconds
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    rounds = [elapsed / number] + [timer.timeit(number) / number for _ in range(repeat - 1)]
+    median = statistics.median(rounds)
+    return {
+        'seconds': median,
+        'min_seconds': min(rounds),
+        'calls_per_round': number,
+        'rounds': repeat,
+        'items': items,
+        'items_per_sec': items / median if median else None
+    }
+
+def make_inputs(size, seed=0):
+    """Return five random input arrays in calculate_footprint argument order."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    return [rng.uniform(0, 800, size), rng.uniform(0, 600, size), rng.uniform(0, 5, size),
+            rng.uniform(0, 20, size), rng.uniform(0, 400, size)]
+
+@benchmark('model')
+def bench_model(options):
+    from carbon_footprint_model import CarbonFootprintCalculator
+    calculator = CarbonFootprintCalculator()
+    return {
+        'calculate_footprint': measure(lambda: calculator.calculate_footprint(300, 200, 1.5, 5, 150)),
+        'get_footprint_level': measure(lambda: calculator.get_footprint_level(9.2)),
+        'compare_with_region': measure(lambda: calculator.compare_with_region(9.2, 'Europe'))
+    }
+
+@benchmark('batch')
+def bench_batch(options):
+    from carbon_footprint_model import CarbonFootprintCalculator
+    calculator = CarbonFootprintCalculator()
+    results = {}
+    for size in BATCH_SIZES:
+        if size > options.max_batch_size:
+            break
+        inputs = make_inputs(size)
+        results[f'calculate_footprints_batch[{size}]'] = measure(
+            lambda: calculator.calculate_footprints_batch(*inputs), repeat=3, items=size)
+    return results
+
+@benchmark('parallel')
+def bench_parallel(options):
+    from carbon_footprint_model import CarbonFootprintCalculator
+    from carbon_footprint_parallel import ShardedExecutor
+    calculator = CarbonFootprintCalculator()
+    size = options.parallel_size
+    inputs = make_inputs(size)
+    single = measure(lambda: calculator.calculate_footprints_batch(*inputs), repeat=3, items=size)
+    # Shard every size so the measured speedup can be used to tune DEFAULT_MIN_ROWS
+    with ShardedExecutor(options.workers, options.chunk_size, calculator, min_rows=0) as executor:
+        # Start the workers before timing
+        executor.calculate_footprints_batch(*inputs)
+        sharded = measure(lambda: executor.calculate_footprints_batch(*inputs), repeat=3, items=size)
+    sharded['workers'] = executor.workers
+    sharded['speedup'] = single['seconds'] / sharded['seconds']
+    print(f"Sharded speedup with {executor.workers} workers: {sharded['speedup']:.2f}x", file=sys.stderr)
+    return {
+        f'single_process[{size}]': single,
+        f'sharded[{size}]': sharded
+    }
+
+@benchmark('uncertainty')
+def bench_uncertainty(options):
+    from carbon_footprint_model import CarbonFootprintCalculator
+    from carbon_footprint_uncertainty import UncertaintyModel
+    model = UncertaintyModel(CarbonFootprintCalculator(), samples=1000)
+    inputs = make_inputs(10000)
+    return {'calculate_footprints_batch[10000x1000]': measure(
+        lambda: model.calculate_footprints_batch(*inputs), repeat=3, items=10000)}
+
+@benchmark('org')
+def bench_org(options):
+    from carbon_footprint_model import CarbonFootprintCalculator
+    from carbon_footprint_org import OrgTree
+    calculator = CarbonFootprintCalculator()
+    # 1 organization, 20 sites, 50 teams per site, 100k people
+    groups = [('org', None, 'organization', '', '')]
+    groups += [(f'site{site}', 'org', 'site', '', '') for site in range(20)]
+    groups += [(f'team{site}.{team}', f'site{site}', 'team', '', '') for site in range(20) for team in range(50)]
+    size = 100000
+    people = [f'person{index}' for index in range(size)]
+    parents = [f'team{index % 20}.{index // 20 % 50}' for index in range(size)]
+    inputs = make_inputs(size)
+
+    def load():
+        tree = OrgTree(calculator)
+        tree.add_nodes(groups)
+        tree.set_members(people, parents, inputs)
+        return tree
+
+    tree = load()
+    return {
+        f'load[{size}]': measure(load, repeat=3, items=size),
+        'set_member': measure(lambda: tree.set_member('person0', (300, 200, 1.5, 5, 150))),
+        'summary[org]': measure(lambda: tree.summary('org'))
+    }
+
+@benchmark('planner')
+def bench_planner(options):
+    from carbon_footprint_model import CarbonFootprintCalculator
+    from carbon_footprint_planner import GoalPlanner
+    from carbon_footprint_whatif import WhatIfEngine
+    planner = GoalPlanner(WhatIfEngine(CarbonFootprintCalculator()))
+    size = 10000
+    inputs = make_inputs(size)
+    return {
+        'plan': measure(lambda: planner.plan(300, 200, 1.5, 5, 150)),
+        f'plan_batch[{size}]': measure(lambda: planner.plan_batch(*inputs), repeat=3, items=size)
+    }
+
+@benchmark('binary')
+def bench_binary(options):
+    import app
+    import carbon_footprint_binary
+    from carbon_footprint_model import CarbonFootprintCalculator, LEVEL_NAMES
+    calculator = CarbonFootprintCalculator()
+    size = 10000
+    result = calculator.calculate_footprints_batch(*make_inputs(size))
+
+    def encode_json():
+        # The footprints and comparisons of /calculate/batch NDJSON lines
+        footprints = {category: values.tolist() for category, values in result['footprints'].items()}
+        comparisons = {category: codes.tolist() for category, codes in result['comparisons'].items()}
+        return ''.join(json.dumps({
+            'footprints': {category: values[row] for category, values in footprints.items()},
+            'comparisons': {category: LEVEL_NAMES[codes[row]] for category, codes in comparisons.items()}
+        }) + '\n' for row in range(size)).encode('utf-8')
+
+    def encode_binary():
+        return (carbon_footprint_binary.encode_header(calculator.dataset_version) +
+                carbon_footprint_binary.encode_records(result['footprints'], result['comparisons']))
+
+    client = app.app.test_client()
+    lines = [json.dumps({'electricity': level, 'meat': 'low', 'region': 'Europe'})
+             for level in ('low', 'moderate', 'high') * (size // 30)]
+    body = '\n'.join(lines)
+    records = len(lines)
+
+    def post(accept):
+        return client.post('/calculate/batch', data=body, headers={'Accept': accept}, buffered=True).data
+
+    results = {
+        f'json_encode[{size}]': (measure(encode_json, repeat=3, items=size), len(encode_json())),
+        f'binary_encode[{size}]': (measure(encode_binary, repeat=3, items=size), len(encode_binary())),
+        f'/calculate/batch[json,{records}]': (measure(lambda: post('application/x-ndjson'), repeat=3, items=records),
+                                              len(post('application/x-ndjson'))),
+        f'/calculate/batch[binary,{records}]': (
+            measure(lambda: post(carbon_footprint_binary.MIMETYPE), repeat=3, items=records),
+            len(post(carbon_footprint_binary.MIMETYPE)))
+    }
+    for result, length in results.values():
+        result['bytes'] = length
+        result['bytes_per_item'] = length / result['items']
+    print(f"Binary results: {results[f'json_encode[{size}]'][1] / results[f'binary_encode[{size}]'][1]:.1f}x "
+          f"smaller, {results[f'json_encode[{size}]'][0]['seconds'] / results[f'binary_encode[{size}]'][0]['seconds']:.0f}x "
+          f"faster to encode than JSON", file=sys.stderr)
+    return {name: result for name, (result, length) in results.items()}
+
+@benchmark('web')
+def bench_web(options):
+    import app
+    client = app.app.test_client()
+    form = {'electricity': 'high', 'transport': 'moderate', 'meat': 'low', 'waste': 'moderate',
+            'water': 'high', 'region': 'Europe'}
+    custom = dict(form, transport_factor='car_electric', meat_factor='chicken')
+    return {
+        '/calculate': measure(lambda: client.post('/calculate', data=form)),
+        '/calculate[factors]': measure(lambda: client.post('/calculate', data=custom)),
+        '/regions': measure(lambda: client.get('/regions'))
+    }
+
+@benchmark('cli')
+def bench_cli(options):
+    command = [sys.executable, os.path.join(PROJECT_DIR, 'carbon_footprint_app.py'), '--help']
+
+    def start():
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, cwd=PROJECT_DIR)
+
+    return {'cold_start': measure(start, repeat=5, min_time=0)}
+
+def run_benchmarks(options):
+    """Run the selected benchmark groups and return the result document."""
+    results = {}
+    for group, name, function in BENCHMARKS:
+        if options.only and group not in options.only:
+            continue
+        print(f"Running {group} benchmarks...", file=sys.stderr)
+        for case, result in function(options).items():
+            results[f'{group}.{case}'] = result
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two result documents
+
+    Returns:
+    List of (name, baseline seconds, current seconds, ratio, regressed) tuples
+    for every benchmark present in both documents
+    """
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['seconds']
+        after = result['seconds']
+        ratio = after / before if before else float('inf')
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+def format_seconds(seconds):
+    """Format a duration with a readable unit."""
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the carbon footprint calculator benchmarks.")
+    parser.add_argument('--output', help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument('--baseline', help="Compare against a saved results file and flag regressions")
+    parser.add_argument('--current', help="Compare this saved results file instead of running benchmarks")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Relative slowdown counted as a regression (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--only', nargs='+', choices=sorted({group for group, _, _ in BENCHMARKS}),
+                        help="Benchmark groups to run")
+    parser.add_argument('--max-batch-size', type=int, default=BATCH_SIZES[-1],
+                        help=f"Largest batch size to measure (default: {BATCH_SIZES[-1]})")
+    parser.add_argument('--parallel-size', type=int, default=10000000,
+                        help="Rows measured by the parallel group (default: 10000000)")
+    parser.add_argument('--workers', type=int, help="Worker processes for the parallel group (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=262144,
+                        help="Rows per task for the parallel group (default: 262144)")
+    options = parser.parse_args(argv)
+
+    if options.current:
+        with open(options.current) as f:
+            current = json.load(f)
+    else:
+        current = run_benchmarks(options)
+        document = json.dumps(current, indent=2)
+        if options.output:
+            with open(options.output, 'w') as f:
+                f.write(document + '\n')
+        elif not options.baseline:
+            print(document)
+
+    if not options.baseline:
+        return 0
+
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    rows = compare_results(baseline, current, options.threshold)
+    for name, before, after, ratio, regressed in rows:
+        flag = "REGRESSION" if regressed else "ok"
+        print(f"{name:50} {format_seconds(before):>12} -> {format_seconds(after):>12} {ratio:6.2f}x  {flag}")
+    regressions = sum(1 for row in rows if row[4])
+    print(f"\n{regressions} regression(s) in {len(rows)} benchmark(s)")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
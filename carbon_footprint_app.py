@@ -1,137 +1,472 @@
-from carbon_footprint_model import CarbonFootprintCalculator
-import sys
-import os
-
-def clear_screen():
-    """Clear the console screen."""
-    os.system('cls' if os.name == 'nt' else 'clear')
-
-def print_header(text):
-    """Print a formatted header."""
-    print("\n" + "=" * 60)
-    print(text.center(60))
-    print("=" * 60)
-
-def print_section(text):
-    """Print a formatted section header."""
-    print("\n" + "-" * 50)
-    print(text)
-    print("-" * 50)
-
-def get_float_input(prompt, default=None):
-    """Get a float input with validation and default value."""
-    while True:
-        try:
-            value_str = input(prompt)
-            if value_str.strip() == "" and default is not None:
-                return default
-            return float(value_str)
-        except ValueError:
-            print("Please enter a valid number.")
-
-def main():
-    clear_screen()
-    print_header("Carbon Footprint Calculator")
-    
-    print("\nThis tool calculates your carbon footprint and compares it with global averages.")
-    print("It will provide personalized recommendations to help reduce your environmental impact.")
-    print("\nPlease provide the following information (or press Enter for default values):")
-    
-    try:
-        # Get user inputs with defaults
-        electricity = get_float_input("\nMonthly electricity consumption (kWh) [300]: ", 300)
-        transport = get_float_input("Weekly distance traveled by car (km) [200]: ", 200)
-        meat = get_float_input("Weekly meat consumption (kg) [1.5]: ", 1.5)
-        waste = get_float_input("Weekly non-recycled waste (kg) [5]: ", 5)
-        water = get_float_input("Daily water consumption (liters) [150]: ", 150)
-        
-        # Get region with validation
-        valid_regions = ["North America", "Europe", "Asia", "Africa", "South America", "Oceania"]
-        print("\nValid regions:", ", ".join(valid_regions))
-        region = input("Your region (or press Enter for global comparison only): ")
-        if region and region not in valid_regions:
-            print(f"Warning: '{region}' is not a recognized region. Using global comparison only.")
-            region = ""
-        
-        # Calculate footprint
-        calculator = CarbonFootprintCalculator()
-        result = calculator.calculate_footprint(electricity, transport, meat, waste, water)
-        
-        # Display results
-        clear_screen()
-        print_header("Your Carbon Footprint Results")
-        
-        # Display footprint by category
-        print_section("Your Annual Carbon Footprint (metric tons CO2)")
-        
-        for category, value in result['footprints'].items():
-            if category != 'total':
-                status = result['comparisons'][category]
-                status_indicator = ""
-                if status == "high":
-                    status_indicator = "⚠️ HIGH"
-                elif status == "moderate":
-                    status_indicator = "⚠️ MODERATE"
-                elif status == "low":
-                    status_indicator = "✓ LOW"
-                
-                print(f"- {category.capitalize()}: {value:.2f} tons ({status_indicator})")
-                print(f"  Global average: {result['global_averages'][category]:.2f} tons")
-                
-                # Show comparison as percentage
-                percentage = (value / result['global_averages'][category]) * 100
-                if percentage > 100:
-                    print(f"  You're {percentage - 100:.0f}% above the global average")
-                else:
-                    print(f"  You're {100 - percentage:.0f}% below the global average")
-                print()
-        
-        # Display total footprint
-        total = result['footprints']['total']
-        level = calculator.get_footprint_level(total)
-        
-        print_section("Total Carbon Footprint")
-        print(f"Your total: {total:.2f} tons CO2/year")
-        print(f"Global average: {result['global_averages']['total']:.2f} tons CO2/year")
-        
-        # Show comparison as percentage
-        percentage = (total / result['global_averages']['total']) * 100
-        if percentage > 100:
-            print(f"You're {percentage - 100:.0f}% above the global average")
-        else:
-            print(f"You're {100 - percentage:.0f}% below the global average")
-        
-        # Compare with regional average if provided
-        if region:
-            print("\n" + calculator.compare_with_region(total, region))
-        
-        # Display recommendations for high categories
-        if result['detailed_recommendations']:
-            print_section("Personalized Recommendations")
-            print("Based on your inputs, here are some ways to reduce your carbon footprint:")
-            
-            for category, suggestions in result['detailed_recommendations'].items():
-                print(f"\nFor {category.capitalize()}:")
-                for i, suggestion in enumerate(suggestions[:3], 1):
-                    print(f"  {i}. {suggestion['title']}")
-                    print(f"     {suggestion['description']}")
-                    print(f"     Impact: {suggestion['impact']}, Effort: {suggestion['effort']}")
-        else:
-            print_section("Great Job!")
-            print("Your carbon footprint is below or at global averages.")
-            print("Keep up the good work and consider these additional steps:")
-            print("1. Continue to monitor your consumption patterns")
-            print("2. Advocate for climate-friendly policies in your community")
-            print("3. Share your sustainable practices with friends and family")
-            
-    except ValueError:
-        print("Error: Please enter valid numerical values.")
-    except KeyboardInterrupt:
-        print("\nCalculation cancelled.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-    
-    print("\nThank you for using the Carbon Footprint Calculator!")
-
-if __name__ == "__main__":
-    main() 
\ No newline at end of file
+from carbon_footprint_model import CarbonFootprintCalculator, BATCH_INPUT_COLUMNS, COMPARED_CATEGORIES
+import argparse
+import sys
+import os
+import time
+
+# Default number of rows scored at a time in bulk mode
+BULK_CHUNK_SIZE = 100000
+
+# Seconds between progress reports in bulk mode
+BULK_PROGRESS_INTERVAL = 5.0
+
+def clear_screen():
+    """Clear the console screen."""
+    os.system('cls' if os.name == 'nt' else 'clear')
+
+def print_header(text):
+    """Print a formatted header."""
+    print("\n" + "=" * 60)
+    print(text.center(60))
+    print("=" * 60)
+
+def print_section(text):
+    """Print a formatted section header."""
+    print("\n" + "-" * 50)
+    print(text)
+    print("-" * 50)
+
+def get_float_input(prompt, default=None):
+    """Get a float input with validation and default value."""
+    while True:
+        try:
+            value_str = input(prompt)
+            if value_str.strip() == "" and default is not None:
+                return default
+            return float(value_str)
+        except ValueError:
+            print("Please enter a valid number.")
+
+def is_parquet(path):
+    """Return True if the path looks like a Parquet file."""
+    return path.lower().endswith(('.parquet', '.pq'))
+
+def require_pyarrow():
+    """Raise ImportError with install instructions unless pyarrow, needed for Parquet files, is installed."""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet files need pyarrow, which is not installed; run: pip install pyarrow") from None
+
+def iter_input_chunks(path, chunk_size):
+    """Yield DataFrames of at most chunk_size rows from a CSV or Parquet file."""
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        import pandas as pd
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+class BulkWriter:
+    """
+    Write scored chunks to a CSV or Parquet file as they are produced.
+    
+    With binary=True the result columns are written as carbon_footprint_binary
+    records instead, headed with dataset_version.
+    """
+    
+    def __init__(self, path, binary=False, dataset_version=None):
+        self.path = path
+        self.parquet = is_parquet(path)
+        self.binary = binary
+        self.file = None
+        self.writer = None
+        if binary:
+            import carbon_footprint_binary
+            self.file = open(path, 'wb')
+            self.file.write(carbon_footprint_binary.encode_header(dataset_version))
+    
+    def write(self, frame):
+        if self.binary:
+            import carbon_footprint_binary
+            comparisons = {category: frame[f'{category}_comparison'] for category in COMPARED_CATEGORIES}
+            self.file.write(carbon_footprint_binary.encode_records(frame, comparisons))
+        elif self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            header = self.file is None
+            if header:
+                self.file = open(self.path, 'w', newline='')
+            frame.to_csv(self.file, header=header, index=False)
+    
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.file is not None:
+            self.file.close()
+
+def run_bulk(input_path, output_path, chunk_size=BULK_CHUNK_SIZE,
+             progress_interval=BULK_PROGRESS_INTERVAL, progress=sys.stderr, stats_path=None, workers=1,
+             uncertainty_samples=0, seed=0, binary=False):
+    """
+    Score every row of a CSV or Parquet file and write the results.
+    
+    The input must contain the BATCH_INPUT_COLUMNS columns. All input columns
+    are copied to the output, followed by the calculate_footprints_batch
+    result columns. Only one chunk is held in memory at a time.
+    
+    When stats_path is given, the footprints are also added to the population
+    statistics file at that path (created if missing), using the optional
+    'region' input column.
+    
+    With more than one worker, each chunk is split across that many worker
+    processes through shared memory.
+    
+    With uncertainty_samples, '<category>_mean', '<category>_p5' and
+    '<category>_p95' columns are added from a Monte Carlo run over the
+    emission factors, seeded with seed.
+    
+    With binary, only the footprints and comparison levels are written, as
+    fixed-layout carbon_footprint_binary records in input row order.
+    
+    Returns:
+    Number of rows processed
+    """
+    import pandas as pd
+    
+    if binary and uncertainty_samples:
+        raise ValueError("Uncertainty columns cannot be written in the binary format")
+    if is_parquet(input_path) or is_parquet(output_path) and not binary:
+        require_pyarrow()
+    calculator = CarbonFootprintCalculator()
+    executor = calculator
+    if workers > 1:
+        from carbon_footprint_parallel import ShardedExecutor
+        executor = ShardedExecutor(workers, -(-chunk_size // workers), calculator)
+    uncertainty = None
+    if uncertainty_samples:
+        from carbon_footprint_uncertainty import UncertaintyModel
+        uncertainty = UncertaintyModel(calculator, uncertainty_samples, seed)
+    writer = BulkWriter(output_path, binary, calculator.dataset_version)
+    stats = None
+    if stats_path:
+        from carbon_footprint_population import PopulationStats
+        stats = PopulationStats.load(stats_path) if os.path.exists(stats_path) else PopulationStats()
+    rows = 0
+    start = last_report = time.perf_counter()
+    try:
+        for chunk in iter_input_chunks(input_path, chunk_size):
+            result = executor.calculate_footprints_batch(chunk)
+            if uncertainty is not None:
+                _, inputs, factors = calculator.unpack_batch_inputs((chunk,))
+                bands = uncertainty.calculate_footprints_batch(*inputs, factors=factors)
+                for category in COMPARED_CATEGORIES:
+                    for label, values in bands.items():
+                        result[f'{category}_{label}'] = values[category]
+            writer.write(result if binary else pd.concat([chunk, result], axis=1))
+            if stats is not None:
+                regions = chunk['region'].fillna('').to_numpy() if 'region' in chunk.columns else None
+                stats.observe_batch(result, regions)
+            rows += len(chunk)
+            
+            now = time.perf_counter()
+            if progress is not None and now - last_report >= progress_interval:
+                print(f"{rows:,} rows processed ({rows / (now - start):,.0f} rows/sec)", file=progress)
+                last_report = now
+    finally:
+        writer.close()
+        if executor is not calculator:
+            executor.close()
+    if stats is not None:
+        stats.save(stats_path)
+    
+    if progress is not None:
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"Done: {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/sec)", file=progress)
+    return rows
+
+def build_parser():
+    """Build the command line parser."""
+    parser = argparse.ArgumentParser(
+        description="Calculate your carbon footprint. Runs interactively when no command is given.")
+    parser.add_argument('--history-dir', default=os.environ.get('CARBON_HISTORY_DIR', 'history'),
+                        help="Footprint history store directory (default: $CARBON_HISTORY_DIR or ./history)")
+    parser.add_argument('--user', help="Save the interactive result to this user's history")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    bulk = subparsers.add_parser('bulk', help="Score a CSV or Parquet file of profiles")
+    bulk.add_argument('input', help="Input CSV or Parquet file with columns: " + ", ".join(BATCH_INPUT_COLUMNS))
+    bulk.add_argument('output', help="Output CSV or Parquet file, or binary results file with --binary")
+    bulk.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE,
+                      help=f"Rows scored at a time (default: {BULK_CHUNK_SIZE})")
+    bulk.add_argument('--progress-interval', type=float, default=BULK_PROGRESS_INTERVAL,
+                      help=f"Seconds between progress reports (default: {BULK_PROGRESS_INTERVAL})")
+    bulk.add_argument('--stats', help="Add the results to this population statistics file")
+    bulk.add_argument('--uncertainty', type=int, default=0, metavar='SAMPLES',
+                      help="Add Monte Carlo mean, p5 and p95 columns using this many factor samples")
+    bulk.add_argument('--seed', type=int, default=0, help="Random seed for --uncertainty (default: 0)")
+    bulk.add_argument('--workers', type=int, default=1,
+                      help="Worker processes sharing each chunk of at least 4 million rows "
+                           "(default: 1, 0 for all cores)")
+    bulk.add_argument('--binary', action='store_true',
+                      help="Write fixed-layout binary results (see carbon_footprint_binary) instead of CSV or Parquet")
+    
+    sweep = subparsers.add_parser('sweep', help="Summarize footprints over a grid of all input combinations")
+    sweep.add_argument('--steps', type=int, default=100, help="Values per input (default: 100, i.e. 10^10 scenarios)")
+    sweep.add_argument('--margin', type=float, default=0.5,
+                       help="Widen the web form ranges by this fraction of each level (default: 0.5)")
+    sweep.add_argument('--range', nargs=3, action='append', metavar=('COLUMN', 'LOW', 'HIGH'),
+                       help="Override the range of one input column; may be repeated")
+    sweep.add_argument('--factor', action='append', metavar='CATEGORY=NAME',
+                       help="Use another emission factor for a category, e.g. transportation=bus")
+    sweep.add_argument('--bins', type=int, default=100, help="Histogram bins (default: 100)")
+    sweep.add_argument('--threshold', type=float, help="Total to compare against (default: global average total)")
+    sweep.add_argument('--max-memory', type=float, default=64, help="Working memory per chunk in MB (default: 64)")
+    sweep.add_argument('--progress-interval', type=float, default=BULK_PROGRESS_INTERVAL,
+                       help=f"Seconds between progress reports (default: {BULK_PROGRESS_INTERVAL})")
+    sweep.add_argument('--output', help="Write the summary JSON to this file (default: stdout)")
+    
+    meters = subparsers.add_parser('meters', help="Run the smart meter pipeline against a simulated feed")
+    meters.add_argument('--meters', type=int, default=1000, help="Simulated meters (default: 1000)")
+    meters.add_argument('--minutes', type=int, default=60, help="Minutes of per-minute readings (default: 60)")
+    meters.add_argument('--batch-size', type=int, default=1000, help="Readings per queued batch (default: 1000)")
+    meters.add_argument('--queue-size', type=int, default=64,
+                        help="Batches buffered before the feed waits (default: 64)")
+    meters.add_argument('--recompute-interval', type=float, default=1.0,
+                        help="Seconds between footprint recomputations (default: 1.0)")
+    meters.add_argument('--seed', type=int, default=0, help="Random seed of the simulated feed (default: 0)")
+    meters.add_argument('--show', type=int, default=5, help="Households to print (default: 5)")
+    
+    history = subparsers.add_parser('history', help="Query or compact the footprint history store")
+    actions = history.add_subparsers(dest='action', required=True)
+    show = actions.add_parser('show', help="Show a user's totals over time and trend")
+    show.add_argument('user', help="User id")
+    rollup = actions.add_parser('rollup', help="Show mean footprints per month or year")
+    rollup.add_argument('--user', dest='rollup_user', help="Only include this user's records")
+    for command in (show, rollup):
+        command.add_argument('--start', help="First date to include (YYYY-MM-DD)")
+        command.add_argument('--end', help="Date to stop before (YYYY-MM-DD)")
+    show.add_argument('--period', choices=('month', 'year'), help="Roll the user's records up per period")
+    rollup.add_argument('--period', choices=('month', 'year'), default='month', help="Rollup period (default: month)")
+    compact = actions.add_parser('compact', help="Sort records by time and release unused space")
+    compact.add_argument('--before', help="Drop records older than this date (YYYY-MM-DD)")
+    return parser
+
+def run_sweep(args, progress=sys.stderr):
+    """Sweep the input grid described by args and write the summary as JSON."""
+    import json
+    from carbon_footprint_sweep import ScenarioSweep, default_ranges, make_axes
+    
+    ranges = default_ranges(args.margin)
+    for column, low, high in args.range or []:
+        ranges[BATCH_INPUT_COLUMNS.index(column)] = (float(low), float(high))
+    factors = dict(choice.split('=', 1) for choice in args.factor or [])
+    sweep = ScenarioSweep(CarbonFootprintCalculator(), make_axes(ranges, args.steps), factors)
+    
+    start = last_report = time.perf_counter()
+    
+    def report(done, total):
+        nonlocal last_report
+        now = time.perf_counter()
+        if now - last_report >= args.progress_interval:
+            print(f"{done:,} of {total:,} scenarios ({100 * done / total:.1f}%, {done / (now - start):,.0f}/sec)",
+                  file=progress)
+            last_report = now
+    
+    summary = sweep.run(args.bins, args.threshold, int(args.max_memory * 1024 * 1024), report)
+    document = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(document + '\n')
+    else:
+        print(document)
+    print(f"Done: {summary['points']:,} scenarios in {time.perf_counter() - start:.1f}s, "
+          f"{100 * summary['share_above']:.1f}% above {summary['threshold']} tons CO2/year", file=progress)
+
+def run_meters(args):
+    """Run the smart meter pipeline against a simulated feed and print throughput."""
+    import asyncio
+    from carbon_footprint_meter import simulate
+    
+    result = asyncio.run(simulate(CarbonFootprintCalculator(), args.meters, args.minutes, args.batch_size,
+                                  args.queue_size, args.recompute_interval, args.seed))
+    print(f"Ingested {result['readings']:,} readings from {result['meters']:,} meters in {result['seconds']:.2f}s "
+          f"({result['readings_per_sec']:,.0f} readings/sec), {result['recomputed']:,} footprint updates")
+    for meter_id, footprints in sorted(result['footprints'].items())[:args.show]:
+        print(f"- {meter_id}: electricity {footprints['electricity']:.2f}, total {footprints['total']:.2f} tons CO2/year")
+
+def print_rollup(rows):
+    """Print rollup rows as a table of mean footprints."""
+    print(f"{'Period':10} {'Records':>8} " + " ".join(f"{category[:8].capitalize():>8}" for category in COMPARED_CATEGORIES))
+    for row in rows:
+        print(f"{row['period']:10} {row['count']:8d} " + " ".join(f"{row[category]:8.2f}" for category in COMPARED_CATEGORIES))
+
+def run_history(args):
+    """Run a history subcommand against the store in args.history_dir."""
+    from carbon_footprint_history import HistoryStore
+    
+    store = HistoryStore(args.history_dir)
+    if args.action == 'compact':
+        kept = store.compact(args.before)
+        print(f"Compacted history: {kept} records kept.")
+    elif args.action == 'rollup':
+        print_rollup(store.rollup(args.period, args.start, args.end, args.rollup_user))
+    elif args.period:
+        print_rollup(store.rollup(args.period, args.start, args.end, args.user))
+    else:
+        trend = store.trend(args.user, args.start, args.end)
+        for point in trend['points']:
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(point['time']))}  {point['total']:.2f} tons CO2/year")
+        if trend['slope_per_year'] is not None:
+            print(f"\nTrend: {trend['slope_per_year']:+.2f} tons CO2/year per year")
+        elif not trend['points']:
+            print("No history recorded for this user.")
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'bulk':
+        if args.chunk_size <= 0:
+            print("Error: --chunk-size must be positive.", file=sys.stderr)
+            return 1
+        try:
+            run_bulk(args.input, args.output, args.chunk_size, args.progress_interval, stats_path=args.stats,
+                     workers=args.workers or os.cpu_count() or 1, uncertainty_samples=args.uncertainty, seed=args.seed,
+                     binary=args.binary)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+    if args.command == 'sweep':
+        if args.range and any(column not in BATCH_INPUT_COLUMNS for column, _, _ in args.range):
+            print("Error: --range columns must be one of: " + ", ".join(BATCH_INPUT_COLUMNS), file=sys.stderr)
+            return 1
+        try:
+            run_sweep(args)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+    if args.command == 'meters':
+        if min(args.meters, args.minutes, args.batch_size, args.queue_size) <= 0:
+            print("Error: --meters, --minutes, --batch-size and --queue-size must be positive.", file=sys.stderr)
+            return 1
+        run_meters(args)
+        return 0
+    if args.command == 'history':
+        try:
+            run_history(args)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+    run_interactive(args.history_dir if args.user else None, args.user)
+    return 0
+
+def run_interactive(history_dir=None, user_id=None):
+    clear_screen()
+    print_header("Carbon Footprint Calculator")
+    
+    print("\nThis tool calculates your carbon footprint and compares it with global averages.")
+    print("It will provide personalized recommendations to help reduce your environmental impact.")
+    print("\nPlease provide the following information (or press Enter for default values):")
+    
+    try:
+        # Get user inputs with defaults
+        electricity = get_float_input("\nMonthly electricity consumption (kWh) [300]: ", 300)
+        transport = get_float_input("Weekly distance traveled by car (km) [200]: ", 200)
+        meat = get_float_input("Weekly meat consumption (kg) [1.5]: ", 1.5)
+        waste = get_float_input("Weekly non-recycled waste (kg) [5]: ", 5)
+        water = get_float_input("Daily water consumption (liters) [150]: ", 150)
+        
+        # Get region with validation
+        valid_regions = ["North America", "Europe", "Asia", "Africa", "South America", "Oceania"]
+        print("\nValid regions:", ", ".join(valid_regions))
+        region = input("Your region (or press Enter for global comparison only): ")
+        if region and region not in valid_regions:
+            print(f"Warning: '{region}' is not a recognized region. Using global comparison only.")
+            region = ""
+        
+        # Calculate footprint
+        calculator = CarbonFootprintCalculator()
+        result = calculator.calculate_footprint(electricity, transport, meat, waste, water)
+        
+        # Display results
+        clear_screen()
+        print_header("Your Carbon Footprint Results")
+        
+        # Display footprint by category
+        print_section("Your Annual Carbon Footprint (metric tons CO2)")
+        
+        for category, value in result['footprints'].items():
+            if category != 'total':
+                status = result['comparisons'][category]
+                status_indicator = ""
+                if status == "high":
+                    status_indicator = "⚠️ HIGH"
+                elif status == "moderate":
+                    status_indicator = "⚠️ MODERATE"
+                elif status == "low":
+                    status_indicator = "✓ LOW"
+                
+                print(f"- {category.capitalize()}: {value:.2f} tons ({status_indicator})")
+                print(f"  Global average: {result['global_averages'][category]:.2f} tons")
+                
+                # Show comparison as percentage
+                percentage = (value / result['global_averages'][category]) * 100
+                if percentage > 100:
+                    print(f"  You're {percentage - 100:.0f}% above the global average")
+                else:
+                    print(f"  You're {100 - percentage:.0f}% below the global average")
+                print()
+        
+        # Display total footprint
+        total = result['footprints']['total']
+        level = calculator.get_footprint_level(total)
+        
+        print_section("Total Carbon Footprint")
+        print(f"Your total: {total:.2f} tons CO2/year")
+        print(f"Global average: {result['global_averages']['total']:.2f} tons CO2/year")
+        
+        # Show comparison as percentage
+        percentage = (total / result['global_averages']['total']) * 100
+        if percentage > 100:
+            print(f"You're {percentage - 100:.0f}% above the global average")
+        else:
+            print(f"You're {100 - percentage:.0f}% below the global average")
+        
+        # Compare with regional average if provided
+        if region:
+            print("\n" + calculator.compare_with_region(total, region))
+        
+        # Save the result to the user's history
+        if history_dir and user_id:
+            from carbon_footprint_history import HistoryStore
+            HistoryStore(history_dir).append(user_id, result['footprints'])
+            print(f"\nSaved to the history of '{user_id}'.")
+        
+        # Display recommendations for high categories
+        if result['detailed_recommendations']:
+            print_section("Personalized Recommendations")
+            print("Based on your inputs, here are some ways to reduce your carbon footprint:")
+            
+            for category, suggestions in result['detailed_recommendations'].items():
+                print(f"\nFor {category.capitalize()}:")
+                for i, suggestion in enumerate(suggestions[:3], 1):
+                    print(f"  {i}. {suggestion['title']}")
+                    print(f"     {suggestion['description']}")
+                    print(f"     Impact: {suggestion['impact']}, Effort: {suggestion['effort']}")
+        else:
+            print_section("Great Job!")
+            print("Your carbon footprint is below or at global averages.")
+            print("Keep up the good work and consider these additional steps:")
+            print("1. Continue to monitor your consumption patterns")
+            print("2. Advocate for climate-friendly policies in your community")
+            print("3. Share your sustainable practices with friends and family")
+            
+    except ValueError:
+        print("Error: Please enter valid numerical values.")
+    except KeyboardInterrupt:
+        print("\nCalculation cancelled.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    
+    print("\nThank you for using the Carbon Footprint Calculator!")
+
+if __name__ == "__main__":
+    sys.exit(main()) 
\ No newline at end of file
@@ -0,0 +1,357 @@
+"""
+Carbon Footprint History Store
+
+Append-only history of calculation results stored as fixed-width columns in
+memory-mapped files, one file per column:
+
+user.u8         64-bit hash of the user id
+time.i8         Unix timestamp in seconds
+<category>.f8   Footprint in tons CO2/year for every COMPARED_CATEGORIES entry
+
+A small header file holds the number of committed records and whether they
+are still in time order. Range queries on time-ordered stores use binary
+search; rollups and trends are vectorized over the selected slice. Appends,
+queries and compaction are serialized with a lock file so several processes
+can share a store.
+
+Compaction writes the columns and header to a new generation directory and
+then switches the 'current' pointer file to it in one atomic rename, so a
+crash leaves either the old or the new generation, never a mix. Stores
+without a pointer file keep their files in the store directory itself.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+from carbon_footprint_model import COMPARED_CATEGORIES
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within a process
+    fcntl = None
+
+# Column file names and numpy dtypes
+COLUMNS = (('user', 'u8'), ('time', 'i8')) + tuple((category, 'f8') for category in COMPARED_CATEGORIES)
+
+# Header layout: committed record count, then 1 if records are in time order
+HEADER_FILE = 'header.i8'
+
+# Name of the generation directory in use, replaced atomically by compact()
+CURRENT_FILE = 'current'
+
+# Records allocated up front; capacity doubles when full
+INITIAL_CAPACITY = 1 << 16
+
+ROLLUP_PERIODS = {'month': 'datetime64[M]', 'year': 'datetime64[Y]'}
+
+def user_key(user_id):
+    """Return the 64-bit key stored for a user id."""
+    return int.from_bytes(hashlib.blake2b(str(user_id).encode('utf-8'), digest_size=8).digest(), 'little')
+
+def parse_timestamp(value):
+    """Convert None, Unix seconds (a number or numeric string) or an ISO date/datetime string (UTC) to Unix seconds."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        # Query string values are always strings
+        return int(float(value))
+    except (ValueError, OverflowError):
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+class HistoryStore:
+    def __init__(self, path, initial_capacity=INITIAL_CAPACITY):
+        import numpy as np
+        self.np = np
+        self.path = path
+        self.initial_capacity = initial_capacity
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self.columns = {}
+        self.capacity = 0
+        self.generation = self._read_generation()
+        self._open()
+
+    def _read_generation(self):
+        """Return the generation directory named by the pointer file, or '' for the store directory."""
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ''
+
+    def _directory(self, generation=None):
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.path, generation) if generation else self.path
+
+    def _open(self):
+        """Map the header and columns of the current generation."""
+        np = self.np
+        header_path = os.path.join(self._directory(), HEADER_FILE)
+        if not os.path.exists(header_path):
+            np.array([0, 1], dtype='i8').tofile(header_path)
+        self.header = np.memmap(header_path, dtype='i8', mode='r+', shape=(2,))
+        self.columns = {}
+        self._map(max(self._file_capacity(), self.initial_capacity))
+
+    def _column_path(self, name, dtype, generation=None):
+        return os.path.join(self._directory(generation), f'{name}.{dtype}')
+
+    def _file_capacity(self):
+        name, dtype = COLUMNS[0]
+        column_path = self._column_path(name, dtype)
+        return os.path.getsize(column_path) // 8 if os.path.exists(column_path) else 0
+
+    def _map(self, capacity):
+        """Grow every column file to capacity records and memory-map it."""
+        np = self.np
+        for name, dtype in COLUMNS:
+            column_path = self._column_path(name, dtype)
+            with open(column_path, 'ab') as f:
+                if f.tell() < capacity * 8:
+                    f.truncate(capacity * 8)
+            self.columns[name] = np.memmap(column_path, dtype=dtype, mode='r+', shape=(capacity,))
+        self.capacity = capacity
+
+    def _refresh(self):
+        """
+        Remap if another process has grown or compacted the files
+
+        Must be called with the file lock held. compact() switches to a new
+        generation, so mappings of the old one would use removed files.
+        """
+        generation = self._read_generation()
+        if generation != self.generation:
+            self.generation = generation
+            self._open()
+            return
+        size = self._file_capacity()
+        if size != self.capacity:
+            self._map(size)
+
+    def _locked(self):
+        store = self
+
+        class FileLock:
+            def __enter__(self):
+                store.lock.acquire()
+                if fcntl is not None:
+                    self.file = open(os.path.join(store.path, 'lock'), 'w')
+                    fcntl.flock(self.file, fcntl.LOCK_EX)
+                return self
+
+            def __exit__(self, *exc):
+                if fcntl is not None:
+                    fcntl.flock(self.file, fcntl.LOCK_UN)
+                    self.file.close()
+                store.lock.release()
+
+        return FileLock()
+
+    def __len__(self):
+        return int(self.header[0])
+
+    def append(self, user_id, footprints, timestamp=None):
+        """
+        Append one calculation result
+
+        Parameters:
+        user_id: User identifier; stored as a 64-bit hash
+        footprints: The 'footprints' dictionary of a calculate_footprint result
+        timestamp: Unix seconds or ISO string; defaults to now
+        """
+        timestamp = parse_timestamp(timestamp)
+        self.append_batch([user_key(user_id)], {category: [footprints[category]] for category in COMPARED_CATEGORIES},
+                          [int(time.time()) if timestamp is None else timestamp], hashed=True)
+
+    def append_batch(self, user_ids, footprints, timestamps, hashed=False):
+        """
+        Append many results at once
+
+        Parameters:
+        user_ids: Sequence of user ids, or of user_key values when hashed is True
+        footprints: Dictionary of per-category arrays, e.g. from calculate_footprints_batch
+        timestamps: Sequence of Unix seconds
+        """
+        np = self.np
+        keys = np.asarray(user_ids if hashed else [user_key(user_id) for user_id in user_ids], dtype='u8')
+        times = np.asarray(timestamps, dtype='i8')
+        values = {category: np.asarray(footprints[category], dtype='f8') for category in COMPARED_CATEGORIES}
+        size = len(keys)
+        with self._locked():
+            self._refresh()
+            count = len(self)
+            if count + size > self.capacity:
+                capacity = self.capacity
+                while capacity < count + size:
+                    capacity *= 2
+                self._map(capacity)
+
+            in_order = bool(self.header[1]) and (size == 0 or (
+                (count == 0 or times[0] >= self.columns['time'][count - 1]) and bool(np.all(np.diff(times) >= 0))))
+            self.columns['user'][count:count + size] = keys
+            self.columns['time'][count:count + size] = times
+            for category in COMPARED_CATEGORIES:
+                self.columns[category][count:count + size] = values[category]
+
+            # Records become visible only once the header count is updated
+            self.header[1] = 1 if in_order else 0
+            self.header[0] = count + size
+
+    def select(self, start=None, end=None, user_id=None):
+        """
+        Return the records in [start, end) for one user or all users
+
+        Returns:
+        Dictionary of arrays with 'time' and one entry per category
+        """
+        np = self.np
+        start, end = parse_timestamp(start), parse_timestamp(end)
+        with self._locked():
+            self._refresh()
+            count = len(self)
+            times = self.columns['time'][:count]
+            if self.header[1]:
+                # Time-ordered store: binary search the range
+                low = int(np.searchsorted(times, start, side='left')) if start is not None else 0
+                high = int(np.searchsorted(times, end, side='left')) if end is not None else count
+                selection = slice(low, high)
+                mask = None
+            else:
+                selection = slice(0, count)
+                mask = np.ones(count, dtype=bool)
+                if start is not None:
+                    mask &= times >= start
+                if end is not None:
+                    mask &= times < end
+            if user_id is not None:
+                matches = self.columns['user'][selection] == user_key(user_id)
+                mask = matches if mask is None else mask & matches
+            result = {}
+            for name in ('time',) + COMPARED_CATEGORIES:
+                column = self.columns[name][selection]
+                result[name] = np.array(column if mask is None else column[mask])
+            return result
+
+    def rollup(self, period='month', start=None, end=None, user_id=None):
+        """
+        Summarize records per calendar month or year
+
+        Returns:
+        List of dictionaries with 'period', 'count' and the mean footprint
+        of every category, in period order
+        """
+        np = self.np
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"Unknown rollup period: {period!r}")
+        records = self.select(start, end, user_id)
+        periods = records['time'].astype('datetime64[s]').astype(ROLLUP_PERIODS[period])
+        labels, groups = np.unique(periods, return_inverse=True)
+        counts = np.bincount(groups, minlength=len(labels))
+        means = {category: np.bincount(groups, weights=records[category], minlength=len(labels)) / np.maximum(counts, 1)
+                 for category in COMPARED_CATEGORIES}
+        return [dict({'period': str(label), 'count': int(counts[index])},
+                     **{category: float(means[category][index]) for category in COMPARED_CATEGORIES})
+                for index, label in enumerate(labels)]
+
+    def trend(self, user_id, start=None, end=None):
+        """
+        Return a user's totals over time and the linear trend in tons per year
+
+        Returns:
+        Dictionary with 'points' (list of {'time', 'total'}) and
+        'slope_per_year' (None with fewer than two points)
+        """
+        np = self.np
+        records = self.select(start, end, user_id)
+        order = np.argsort(records['time'], kind='stable')
+        times = records['time'][order]
+        totals = records['total'][order]
+        slope = None
+        if len(times) >= 2 and times[-1] > times[0]:
+            years = (times - times[0]) / (365.25 * 24 * 3600)
+            slope = float(np.polyfit(years, totals, 1)[0])
+        return {
+            'points': [{'time': int(stamp), 'total': float(total)} for stamp, total in zip(times, totals)],
+            'slope_per_year': slope
+        }
+
+    def compact(self, before=None):
+        """
+        Rewrite the store in time order and release unused capacity
+
+        Parameters:
+        before: Optional Unix seconds or ISO date; older records are dropped
+
+        Returns:
+        Number of records kept
+        """
+        np = self.np
+        before = parse_timestamp(before)
+        with self._locked():
+            self._refresh()
+            count = len(self)
+            times = np.array(self.columns['time'][:count])
+            keep = np.ones(count, dtype=bool) if before is None else times >= before
+            order = np.flatnonzero(keep)[np.argsort(times[keep], kind='stable')]
+            data = {name: np.array(self.columns[name][:count])[order] for name, _ in COLUMNS}
+            kept = len(order)
+
+            # Write the complete new generation next to the current one
+            old = self.generation
+            generation = f'gen-{int(old.rpartition("-")[2]) + 1 if old else 1}'
+            directory = self._directory(generation)
+            shutil.rmtree(directory, ignore_errors=True)  # Left over by an interrupted compaction
+            os.makedirs(directory)
+            capacity = max(self.initial_capacity, kept)
+            for name, dtype in COLUMNS:
+                padded = np.zeros(capacity, dtype=dtype)
+                padded[:kept] = data[name]
+                self._write_synced(self._column_path(name, dtype, generation), padded)
+            self._write_synced(os.path.join(directory, HEADER_FILE), np.array([kept, 1], dtype='i8'))
+
+            # Commit: other processes remap when they see the new generation
+            pointer = os.path.join(self.path, CURRENT_FILE)
+            with open(pointer + '.tmp', 'w') as f:
+                f.write(generation)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(pointer + '.tmp', pointer)
+
+            self.columns = {}
+            self.header = None
+            self.generation = generation
+            self._open()
+            self._remove_generation(old)
+            return kept
+
+    def _write_synced(self, path, values):
+        with open(path, 'wb') as f:
+            values.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _remove_generation(self, generation):
+        """Delete the files of a generation that is no longer current."""
+        if generation:
+            shutil.rmtree(self._directory(generation), ignore_errors=True)
+            return
+        for name in [HEADER_FILE] + [f'{name}.{dtype}' for name, dtype in COLUMNS]:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+    def flush(self):
+        with self.lock:
+            for column in self.columns.values():
+                column.flush()
+            self.header.flush()
@@ -0,0 +1,173 @@
+"""
+Carbon Footprint Calculator Metrics
+
+Lightweight counters, gauges and latency histograms for the hot paths of the
+web application and the calculation model, rendered in the Prometheus text
+exposition format. Instrumentation can be switched off entirely with the
+CARBON_METRICS=off environment variable or by setting REGISTRY.enabled.
+"""
+import bisect
+import os
+import threading
+from time import perf_counter
+
+# Histogram bucket upper bounds in seconds, from 1 microsecond to 1 second
+DEFAULT_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+                   0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    """Format label names and values as a Prometheus label set."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    """Format a sample value, keeping integers free of a decimal point."""
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    def __init__(self, registry, name, description, label_names=()):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        """Add amount to the series identified by the labels tuple."""
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self.lock:
+            series = sorted(self.values.items())
+        for labels, value in series:
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+class Histogram:
+    """Fixed-bucket latency histogram with a fixed set of label names."""
+
+    def __init__(self, registry, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        """Record one observation for the series identified by the labels tuple."""
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # Per-bucket counts plus an overflow slot, then sum and count
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, labels, start):
+        """Observe the time elapsed since start and return the current clock value."""
+        now = perf_counter()
+        self.observe(labels, now - start)
+        return now
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            snapshot = sorted((labels, (list(counts), total, count))
+                              for labels, (counts, total, count) in self.series.items())
+        for labels, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                label_set = _format_labels(self.label_names, labels, (('le', le),))
+                lines.append(f'{self.name}_bucket{label_set} {cumulative}')
+            label_set = _format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{label_set} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_set} {count}')
+        return lines
+
+class Gauge:
+    """Current value with a fixed set of label names, either set directly or read from a function."""
+
+    def __init__(self, registry, name, description, label_names=(), function=None):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.function = function
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def set(self, labels, value):
+        """Set the series identified by the labels tuple."""
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[labels] = value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} gauge']
+        if self.function is not None:
+            series = [((), self.function())]
+        else:
+            with self.lock:
+                series = sorted(self.values.items())
+        for labels, value in series:
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+class MetricsRegistry:
+    """Collection of metrics that can be disabled and rendered together."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = []
+
+    def counter(self, name, description, label_names=()):
+        metric = Counter(self, name, description, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(self, name, description, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, description, label_names=(), function=None):
+        metric = Gauge(self, name, description, label_names, function)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Shared registry used by the model and the web application
+REGISTRY = MetricsRegistry(enabled=os.environ.get('CARBON_METRICS', 'on').lower() not in ('off', '0', 'false'))
+
+# Time spent in calculator methods
+MODEL_SECONDS = REGISTRY.histogram('carbon_model_seconds', "Time spent in CarbonFootprintCalculator methods",
+                                   ('method',))
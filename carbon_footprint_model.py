@@ -1,109 +1,415 @@
-import pandas as pd
-import numpy as np
-from carbon_footprint_data import GLOBAL_AVERAGES, REGIONAL_AVERAGES, EMISSION_FACTORS, REDUCTION_SUGGESTIONS
-
-class CarbonFootprintCalculator:
-    def __init__(self):
-        # Use data from the imported dataset
-        self.global_averages = GLOBAL_AVERAGES
-        self.regional_averages = {region: data['total'] for region, data in REGIONAL_AVERAGES.items()}
-        self.emission_factors = EMISSION_FACTORS
-        self.suggestions = {category: [item['title'] for item in suggestions] 
-                           for category, suggestions in REDUCTION_SUGGESTIONS.items()}
-        self.detailed_suggestions = REDUCTION_SUGGESTIONS
-    
-    def calculate_footprint(self, electricity_kwh, transport_km, meat_consumption, 
-                           waste_kg, water_liters):
-        """
-        Calculate carbon footprint based on user inputs
-        
-        Parameters:
-        electricity_kwh: Monthly electricity consumption in kWh
-        transport_km: Weekly distance traveled by car in km
-        meat_consumption: Weekly meat consumption in kg
-        waste_kg: Weekly non-recycled waste in kg
-        water_liters: Daily water consumption in liters
-        
-        Returns:
-        Dictionary with carbon footprint values and comparisons
-        """
-        # Convert inputs to annual carbon footprint (metric tons CO2)
-        electricity_footprint = electricity_kwh * 12 * self.emission_factors['electricity']['mixed_grid']
-        transport_footprint = transport_km * 52 * self.emission_factors['transportation']['car_petrol']
-        food_footprint = meat_consumption * 52 * self.emission_factors['food']['beef']
-        waste_footprint = waste_kg * 52 * self.emission_factors['waste']['landfill']
-        water_footprint = water_liters * 365 * self.emission_factors['water']['cold_water']
-        
-        # Calculate total footprint
-        total_footprint = (electricity_footprint + transport_footprint + 
-                          food_footprint + waste_footprint + water_footprint)
-        
-        # Create result dictionary
-        footprints = {
-            'electricity': electricity_footprint,
-            'transportation': transport_footprint,
-            'food': food_footprint,
-            'waste': waste_footprint,
-            'water': water_footprint,
-            'total': total_footprint
-        }
-        
-        # Compare with global averages
-        comparisons = {}
-        for category, value in footprints.items():
-            if value > self.global_averages[category] * 1.2:
-                comparisons[category] = "high"
-            elif value < self.global_averages[category] * 0.8:
-                comparisons[category] = "low"
-            else:
-                comparisons[category] = "moderate"
-        
-        # Generate suggestions for high categories
-        recommendations = {}
-        detailed_recommendations = {}
-        for category, status in comparisons.items():
-            if status == "high" and category in self.suggestions:
-                recommendations[category] = self.suggestions[category]
-                detailed_recommendations[category] = self.detailed_suggestions[category]
-        
-        return {
-            'footprints': footprints,
-            'comparisons': comparisons,
-            'recommendations': recommendations,
-            'detailed_recommendations': detailed_recommendations,
-            'global_averages': self.global_averages
-        }
-    
-    def get_footprint_level(self, total_footprint):
-        """
-        Get overall footprint level compared to global average
-        """
-        if total_footprint > self.global_averages['total'] * 1.2:
-            return "high"
-        elif total_footprint < self.global_averages['total'] * 0.8:
-            return "low"
-        else:
-            return "moderate"
-    
-    def compare_with_region(self, total_footprint, region):
-        """
-        Compare footprint with regional average
-        """
-        if region in self.regional_averages:
-            regional_avg = self.regional_averages[region]
-            if total_footprint > regional_avg * 1.1:
-                return f"Your carbon footprint is higher than the {region} average of {regional_avg} tons CO2/year"
-            elif total_footprint < regional_avg * 0.9:
-                return f"Your carbon footprint is lower than the {region} average of {regional_avg} tons CO2/year"
-            else:
-                return f"Your carbon footprint is close to the {region} average of {regional_avg} tons CO2/year"
-        else:
-            return "Region not found in database"
-    
-    def get_detailed_recommendations(self, category):
-        """
-        Get detailed recommendations for a specific category
-        """
-        if category in self.detailed_suggestions:
-            return self.detailed_suggestions[category]
+import sys
+from time import perf_counter
+import carbon_footprint_data
+from carbon_footprint_metrics import MODEL_SECONDS
+
+# Input columns accepted by the batch API, in calculate_footprint argument order
+BATCH_INPUT_COLUMNS = ('electricity_kwh', 'transport_km', 'meat_consumption', 'waste_kg', 'water_liters')
+
+# Footprint categories in the order they are calculated
+FOOTPRINT_CATEGORIES = ('electricity', 'transportation', 'food', 'waste', 'water')
+
+# Multipliers converting each input to an annual quantity, in FOOTPRINT_CATEGORIES order
+ANNUAL_MULTIPLIERS = (12, 52, 52, 52, 365)
+
+# Categories compared against averages, with their fixed integer indices
+COMPARED_CATEGORIES = FOOTPRINT_CATEGORIES + ('total',)
+CATEGORY_INDEX = {category: index for index, category in enumerate(COMPARED_CATEGORIES)}
+TOTAL_INDEX = CATEGORY_INDEX['total']
+
+# Integer codes used by the batch API for comparison levels
+LEVEL_LOW = 0
+LEVEL_MODERATE = 1
+LEVEL_HIGH = 2
+LEVEL_NAMES = ('low', 'moderate', 'high')
+
+# Emission factor used for each category unless another one is chosen
+DEFAULT_FACTORS = {
+    'electricity': 'mixed_grid',
+    'transportation': 'car_petrol',
+    'food': 'beef',
+    'waste': 'landfill',
+    'water': 'cold_water'
+}
+
+class FactorTable:
+    """
+    Averages and comparison thresholds stored by fixed integer index
+    
+    Categories are stored at the CATEGORY_INDEX positions and regions at the
+    positions given by region_index, so comparisons only index flat tuples
+    instead of looking up nested dicts and multiplying on every call.
+    Tuples are used rather than array('d') so indexing does not allocate.
+    """
+    __slots__ = ('global_averages', 'global_high', 'global_low', 'regions', 'region_index',
+                 'regional_averages', 'regional_high', 'regional_low', 'regional_total_high',
+                 'regional_total_low', 'default_factors')
+    
+    def __init__(self, global_averages, regional_averages, emission_factors):
+        # Thresholds are computed exactly as the comparisons used to compute them
+        self.global_averages = tuple(global_averages[category] for category in COMPARED_CATEGORIES)
+        self.global_high = tuple(global_averages[category] * 1.2 for category in COMPARED_CATEGORIES)
+        self.global_low = tuple(global_averages[category] * 0.8 for category in COMPARED_CATEGORIES)
+        
+        self.regions = tuple(regional_averages)
+        self.region_index = {region: index for index, region in enumerate(self.regions)}
+        self.regional_averages = tuple(tuple(data[category] for category in COMPARED_CATEGORIES)
+                                       for data in regional_averages.values())
+        self.regional_high = tuple(tuple(data[category] * 1.2 for category in COMPARED_CATEGORIES)
+                                   for data in regional_averages.values())
+        self.regional_low = tuple(tuple(data[category] * 0.8 for category in COMPARED_CATEGORIES)
+                                  for data in regional_averages.values())
+        
+        # compare_with_region uses a narrower band around the regional total
+        self.regional_total_high = tuple(data['total'] * 1.1 for data in regional_averages.values())
+        self.regional_total_low = tuple(data['total'] * 0.9 for data in regional_averages.values())
+        
+        self.default_factors = tuple(emission_factors[category][DEFAULT_FACTORS[category]]
+                                     for category in FOOTPRINT_CATEGORIES)
+    
+    def level_codes(self, values, high=None, low=None):
+        """Return LEVEL_* codes for values in COMPARED_CATEGORIES order"""
+        high = self.global_high if high is None else high
+        low = self.global_low if low is None else low
+        return [LEVEL_HIGH if value > high[index] else LEVEL_LOW if value < low[index] else LEVEL_MODERATE
+                for index, value in enumerate(values)]
+    
+    def regional_level_codes(self, values, region):
+        """Return LEVEL_* codes for values compared with a region's category averages"""
+        index = self.region_index[region]
+        return self.level_codes(values, self.regional_high[index], self.regional_low[index])
+
+class CarbonFootprintCalculator:
+    def __init__(self, dataset=None):
+        """
+        Parameters:
+        dataset: Optional dictionary of the carbon_footprint_data DATASET_NAMES
+                 tables plus DATASET_VERSION, e.g. from load_snapshot();
+                 defaults to the imported dataset
+        """
+        dataset = dataset or carbon_footprint_data.current_dataset()
+        self.dataset = dataset
+        self.dataset_version = dataset['DATASET_VERSION']
+        self.global_averages = dataset['GLOBAL_AVERAGES']
+        self.regional_averages = {region: data['total'] for region, data in dataset['REGIONAL_AVERAGES'].items()}
+        self.emission_factors = dataset['EMISSION_FACTORS']
+        self.suggestions = {category: [item['title'] for item in suggestions] 
+                           for category, suggestions in dataset['REDUCTION_SUGGESTIONS'].items()}
+        self.detailed_suggestions = dataset['REDUCTION_SUGGESTIONS']
+        self.suggestion_effects = dataset['SUGGESTION_EFFECTS']
+        self.factor_uncertainty = dataset['FACTOR_UNCERTAINTY']
+        self.consumption_values = dataset['CONSUMPTION_VALUES']
+        self.table = FactorTable(dataset['GLOBAL_AVERAGES'], dataset['REGIONAL_AVERAGES'], dataset['EMISSION_FACTORS'])
+        
+        # Flatten the emission factors into a matrix with one row per category
+        # and one column per factor, so per-row choices become an array gather
+        self.factor_names = {category: tuple(self.emission_factors[category]) for category in FOOTPRINT_CATEGORIES}
+        self.factor_index = {category: {name: index for index, name in enumerate(names)}
+                             for category, names in self.factor_names.items()}
+        self._factor_matrix = None
+    
+    @property
+    def factor_matrix(self):
+        """Emission factors as a (category, factor) float64 array, built on first use"""
+        if self._factor_matrix is None:
+            # numpy is only imported once a batch feature needs it
+            import numpy as np
+            matrix = np.full((len(FOOTPRINT_CATEGORIES), max(len(names) for names in self.factor_names.values())),
+                             np.nan)
+            for row, category in enumerate(FOOTPRINT_CATEGORIES):
+                for column, name in enumerate(self.factor_names[category]):
+                    matrix[row, column] = self.emission_factors[category][name]
+            self._factor_matrix = matrix
+        return self._factor_matrix
+    
+    def resolve_factors(self, factors=None):
+        """
+        Return the emission factor name to use for every category
+        
+        Parameters:
+        factors: Optional dictionary mapping categories to EMISSION_FACTORS names;
+                 categories left out use DEFAULT_FACTORS
+        """
+        choices = dict(DEFAULT_FACTORS)
+        for category, name in (factors or {}).items():
+            if category not in self.factor_index:
+                raise ValueError(f"Unknown emission factor category: {category!r}")
+            if name not in self.factor_index[category]:
+                raise ValueError(f"Unknown {category} emission factor: {name!r}")
+            choices[category] = name
+        return choices
+    
+    def factor_codes(self, category, choices):
+        """
+        Convert factor choices for one category to factor_matrix columns
+        
+        Parameters:
+        category: Footprint category
+        choices: A factor name, or an array of factor names or integer codes
+        """
+        if category not in self.factor_index:
+            raise ValueError(f"Unknown emission factor category: {category!r}")
+        index = self.factor_index[category]
+        if isinstance(choices, str):
+            if choices not in index:
+                raise ValueError(f"Unknown {category} emission factor: {choices!r}")
+            return index[choices]
+        
+        import numpy as np
+        choices = np.asarray(choices)
+        if choices.dtype.kind in 'iu':
+            if choices.size and (choices.min() < 0 or choices.max() >= len(index)):
+                raise ValueError(f"Invalid {category} emission factor code")
+            return choices.astype(np.intp)
+        
+        # Look up each distinct name once, then expand back to every row
+        names, inverse = np.unique(choices.astype(str), return_inverse=True)
+        for name in names:
+            if name not in index:
+                raise ValueError(f"Unknown {category} emission factor: {name!r}")
+        codes = np.array([index[name] for name in names], dtype=np.intp)
+        return codes[inverse].reshape(choices.shape)
+    
+    def gather_factors(self, factors=None):
+        """
+        Gather the chosen emission factor for every row from the factor matrix
+        
+        Parameters:
+        factors: Optional dictionary mapping categories to a factor name or to
+                 arrays of names or factor_matrix column codes
+        
+        Returns:
+        Dictionary mapping every category to a float64 scalar or array
+        """
+        factors = factors or {}
+        for category in factors:
+            if category not in self.factor_index:
+                raise ValueError(f"Unknown emission factor category: {category!r}")
+        factor_values = {}
+        for row, category in enumerate(FOOTPRINT_CATEGORIES):
+            codes = self.factor_codes(category, factors.get(category, DEFAULT_FACTORS[category]))
+            factor_values[category] = self.factor_matrix[row, codes]
+        return factor_values
+    
+    def calculate_footprint(self, electricity_kwh, transport_km, meat_consumption, 
+                           waste_kg, water_liters, factors=None):
+        """
+        Calculate carbon footprint based on user inputs
+        
+        Parameters:
+        electricity_kwh: Monthly electricity consumption in kWh
+        transport_km: Weekly distance traveled by car in km
+        meat_consumption: Weekly meat consumption in kg
+        waste_kg: Weekly non-recycled waste in kg
+        water_liters: Daily water consumption in liters
+        factors: Optional dictionary mapping categories to EMISSION_FACTORS names,
+                 e.g. {'transportation': 'car_electric'}; defaults to DEFAULT_FACTORS
+        
+        Returns:
+        Dictionary with carbon footprint values and comparisons, and the
+        'dataset_version' they were calculated with
+        """
+        start = perf_counter()
+        if factors:
+            choices = self.resolve_factors(factors)
+            factor_values = [self.emission_factors[category][choices[category]] for category in FOOTPRINT_CATEGORIES]
+        else:
+            factor_values = self.table.default_factors
+        
+        # Convert inputs to annual carbon footprint (metric tons CO2)
+        electricity_footprint = electricity_kwh * 12 * factor_values[0]
+        transport_footprint = transport_km * 52 * factor_values[1]
+        food_footprint = meat_consumption * 52 * factor_values[2]
+        waste_footprint = waste_kg * 52 * factor_values[3]
+        water_footprint = water_liters * 365 * factor_values[4]
+        
+        # Calculate total footprint
+        total_footprint = (electricity_footprint + transport_footprint + 
+                          food_footprint + waste_footprint + water_footprint)
+        
+        # Create result dictionary
+        footprints = {
+            'electricity': electricity_footprint,
+            'transportation': transport_footprint,
+            'food': food_footprint,
+            'waste': waste_footprint,
+            'water': water_footprint,
+            'total': total_footprint
+        }
+        
+        # Compare with global averages using the precomputed thresholds
+        high = self.table.global_high
+        low = self.table.global_low
+        comparisons = {}
+        for index, (category, value) in enumerate(footprints.items()):
+            if value > high[index]:
+                comparisons[category] = "high"
+            elif value < low[index]:
+                comparisons[category] = "low"
+            else:
+                comparisons[category] = "moderate"
+        
+        # Generate suggestions for high categories
+        recommendations = {}
+        detailed_recommendations = {}
+        for category, status in comparisons.items():
+            if status == "high" and category in self.suggestions:
+                recommendations[category] = self.suggestions[category]
+                detailed_recommendations[category] = self.detailed_suggestions[category]
+        
+        MODEL_SECONDS.observe(('calculate_footprint',), perf_counter() - start)
+        return {
+            'footprints': footprints,
+            'comparisons': comparisons,
+            'recommendations': recommendations,
+            'detailed_recommendations': detailed_recommendations,
+            'global_averages': self.global_averages,
+            'dataset_version': self.dataset_version
+        }
+    
+    def get_footprint_level(self, total_footprint):
+        """
+        Get overall footprint level compared to global average
+        """
+        if total_footprint > self.table.global_high[TOTAL_INDEX]:
+            return "high"
+        elif total_footprint < self.table.global_low[TOTAL_INDEX]:
+            return "low"
+        else:
+            return "moderate"
+    
+    def compare_with_region(self, total_footprint, region):
+        """
+        Compare footprint with regional average
+        """
+        index = self.table.region_index.get(region)
+        if index is not None:
+            regional_avg = self.regional_averages[region]
+            if total_footprint > self.table.regional_total_high[index]:
+                return f"Your carbon footprint is higher than the {region} average of {regional_avg} tons CO2/year"
+            elif total_footprint < self.table.regional_total_low[index]:
+                return f"Your carbon footprint is lower than the {region} average of {regional_avg} tons CO2/year"
+            else:
+                return f"Your carbon footprint is close to the {region} average of {regional_avg} tons CO2/year"
+        else:
+            return "Region not found in database"
+    
+    def calculate_footprints_batch(self, *inputs, factors=None):
+        """
+        Calculate carbon footprints for many profiles at once
+        
+        Accepts either a pandas DataFrame with the BATCH_INPUT_COLUMNS columns,
+        or five array-likes in calculate_footprint argument order. Results match
+        calculate_footprint exactly, element by element.
+        
+        Emission factors can be chosen per row with the factors keyword, mapping
+        categories to a factor name or to arrays of names or factor_matrix
+        column codes. A DataFrame may instead carry '<category>_factor' columns,
+        where empty cells select the DEFAULT_FACTORS entry.
+        
+        Returns:
+        For array inputs, a dictionary with 'footprints' (float64 arrays per
+        category and 'total'), 'comparisons' (int8 arrays of LEVEL_* codes) and
+        'recommendations' (boolean arrays, True where suggestions apply), plus
+        the 'dataset_version' used.
+        For a DataFrame input, a DataFrame with the same index holding one
+        column per footprint, '<category>_comparison' and '<category>_recommend',
+        with the dataset version in attrs['dataset_version'].
+        """
+        import numpy as np
+        
+        start = perf_counter()
+        frame, inputs, factors = self.unpack_batch_inputs(inputs, factors)
+        
+        electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters = np.broadcast_arrays(
+            *[np.asarray(values, dtype=np.float64) for values in inputs])
+        
+        factor_values = self.gather_factors(factors)
+        
+        # Same operation order as calculate_footprint so floats match bit for bit
+        footprints = {
+            'electricity': electricity_kwh * 12 * factor_values['electricity'],
+            'transportation': transport_km * 52 * factor_values['transportation'],
+            'food': meat_consumption * 52 * factor_values['food'],
+            'waste': waste_kg * 52 * factor_values['waste'],
+            'water': water_liters * 365 * factor_values['water'],
+        }
+        footprints['total'] = (footprints['electricity'] + footprints['transportation'] +
+                               footprints['food'] + footprints['waste'] + footprints['water'])
+        
+        # Compare with global averages
+        comparisons = {}
+        for index, (category, values) in enumerate(footprints.items()):
+            codes = np.full(values.shape, LEVEL_MODERATE, dtype=np.int8)
+            codes[values > self.table.global_high[index]] = LEVEL_HIGH
+            codes[values < self.table.global_low[index]] = LEVEL_LOW
+            comparisons[category] = codes
+        
+        result = self.pack_batch_result(footprints, comparisons, frame)
+        MODEL_SECONDS.observe(('calculate_footprints_batch',), perf_counter() - start)
+        return result
+    
+    def unpack_batch_inputs(self, inputs, factors=None):
+        """
+        Normalize calculate_footprints_batch arguments
+        
+        Returns:
+        (frame, inputs, factors) tuple, where frame is the input DataFrame or
+        None, inputs are the five input array-likes and factors includes any
+        '<category>_factor' DataFrame columns
+        """
+        # A DataFrame can only be passed in if pandas has already been imported
+        pandas = sys.modules.get('pandas')
+        if len(inputs) == 1 and pandas is not None and isinstance(inputs[0], pandas.DataFrame):
+            import numpy as np
+            frame = inputs[0]
+            missing = [column for column in BATCH_INPUT_COLUMNS if column not in frame.columns]
+            if missing:
+                raise ValueError(f"Missing input columns: {', '.join(missing)}")
+            inputs = [frame[column].to_numpy(dtype=np.float64) for column in BATCH_INPUT_COLUMNS]
+            factors = dict(factors or {})
+            for category in FOOTPRINT_CATEGORIES:
+                if f'{category}_factor' in frame.columns and category not in factors:
+                    # Empty cells, e.g. of a partly filled CSV column, use the default factor
+                    column = frame[f'{category}_factor']
+                    factors[category] = column.where(column.notna() & (column != ''),
+                                                     DEFAULT_FACTORS[category]).to_numpy()
+            return frame, inputs, factors
+        if len(inputs) != len(BATCH_INPUT_COLUMNS):
+            raise TypeError(f"Expected a DataFrame or {len(BATCH_INPUT_COLUMNS)} arrays, got {len(inputs)} arguments")
+        return None, inputs, factors
+    
+    def pack_batch_result(self, footprints, comparisons, frame=None):
+        """
+        Build the calculate_footprints_batch result from footprint and comparison arrays
+        
+        Returns:
+        A result dictionary, or a DataFrame indexed like frame when one is given
+        """
+        # Flag categories where suggestions would be generated
+        recommendations = {category: comparisons[category] == LEVEL_HIGH
+                           for category in FOOTPRINT_CATEGORIES if category in self.suggestions}
+        
+        if frame is None:
+            return {
+                'footprints': footprints,
+                'comparisons': comparisons,
+                'recommendations': recommendations,
+                'dataset_version': self.dataset_version
+            }
+        columns = dict(footprints)
+        for category, codes in comparisons.items():
+            columns[f'{category}_comparison'] = codes
+        for category, flags in recommendations.items():
+            columns[f'{category}_recommend'] = flags
+        result = sys.modules['pandas'].DataFrame(columns, index=frame.index)
+        result.attrs['dataset_version'] = self.dataset_version
+        return result
+    
+    def get_detailed_recommendations(self, category):
+        """
+        Get detailed recommendations for a specific category
+        """
+        if category in self.detailed_suggestions:
+            return self.detailed_suggestions[category]
         return [] 
\ No newline at end of file
@@ -0,0 +1,441 @@
+"""
+Carbon Footprint Organization Rollups
+
+Category totals for every node of an organization tree, e.g. organization
+-> site -> team -> person. People are the leaves and carry their calculated
+footprints; every other node holds the sum over the people below it, so a
+team or site total is a lookup rather than a recalculation of its members.
+
+Changing one person's inputs adds the difference to the nodes on the path
+to the root only, which costs O(depth) whatever the size of the tree. Bulk
+loads calculate all footprints with calculate_footprints_batch and add them
+up one tree level at a time. Incremental updates can leave the group totals
+a few ulps away from a fresh sum; rebuild() re-adds them from the people.
+
+Comparisons use the mean footprint per person below a node, against the
+global averages and the averages of the node's region (inherited from the
+nearest ancestor that has one).
+"""
+import threading
+
+from carbon_footprint_model import (BATCH_INPUT_COLUMNS, COMPARED_CATEGORIES, DEFAULT_FACTORS, FOOTPRINT_CATEGORIES,
+                                   LEVEL_NAMES)
+
+# Nodes allocated up front; capacity doubles when full
+INITIAL_CAPACITY = 1024
+
+# Parent index of root nodes
+NO_PARENT = -1
+
+class OrgTree:
+    def __init__(self, calculator, initial_capacity=INITIAL_CAPACITY):
+        """
+        Parameters:
+        calculator: CarbonFootprintCalculator used for footprints and comparisons
+        initial_capacity: Nodes allocated up front
+        """
+        import numpy as np
+        self.np = np
+        self.calculator = calculator
+        self.lock = threading.RLock()
+        self.index = {}
+        self.ids = []
+        self.kinds = []
+        self.names = []
+        self.regions = []
+        self.children = []
+        self.size = 0
+        self.capacity = 0
+        self.parents = np.empty(0, dtype=np.intp)
+        self.depths = np.empty(0, dtype=np.intp)
+        self.is_member = np.empty(0, dtype=bool)
+        self.members = np.empty(0, dtype=np.int64)
+        self.inputs = np.empty((0, len(BATCH_INPUT_COLUMNS)))
+        self.codes = np.empty((0, len(FOOTPRINT_CATEGORIES)), dtype=np.intp)
+        self.totals = np.empty((0, len(COMPARED_CATEGORIES)))
+        self._grow(initial_capacity)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, node_id):
+        return node_id in self.index
+
+    def _grow(self, capacity):
+        """Reallocate the node arrays to hold at least capacity nodes."""
+        np = self.np
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for name in ('parents', 'depths', 'is_member', 'members', 'inputs', 'codes', 'totals'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def _new_node(self, node_id, parent_id, kind, name, region, member):
+        """Append a node without updating any totals and return its index."""
+        if node_id in self.index:
+            raise ValueError(f"Node {node_id!r} already exists")
+        parent = NO_PARENT
+        if parent_id is not None and parent_id != '':
+            parent = self.index.get(parent_id)
+            if parent is None:
+                raise ValueError(f"Unknown parent node: {parent_id!r}")
+            if self.is_member[parent]:
+                raise ValueError(f"Node {parent_id!r} is a person and cannot have members")
+        self._grow(self.size + 1)
+        node = self.size
+        self.size += 1
+        self.index[node_id] = node
+        self.ids.append(node_id)
+        self.kinds.append(kind)
+        self.names.append(name)
+        self.regions.append(region)
+        self.children.append([])
+        self.parents[node] = parent
+        self.depths[node] = 0 if parent == NO_PARENT else self.depths[parent] + 1
+        self.is_member[node] = member
+        if parent != NO_PARENT:
+            self.children[parent].append(node)
+        return node
+
+    def _path(self, node):
+        """Return the indices of a node and all its ancestors."""
+        path = []
+        while node != NO_PARENT:
+            path.append(node)
+            node = int(self.parents[node])
+        return path
+
+    def add_node(self, node_id, parent_id=None, kind='', name='', region=''):
+        """
+        Add a group node such as an organization, site or team
+
+        Parameters:
+        node_id: Unique id of the node
+        parent_id: Id of the parent node, or None for a root
+        kind: Free-form node type, e.g. 'site'
+        name: Display name
+        region: REGIONAL_AVERAGES region used for this node and the nodes below it
+        """
+        with self.lock:
+            self._new_node(node_id, parent_id, kind, name, region, False)
+
+    def _order_groups(self, rows):
+        """
+        Validate group rows against the tree and each other without changing anything
+
+        Returns:
+        The rows ordered so that every parent comes before its children
+        """
+        rows = list(rows)
+        ids = [row[0] for row in rows]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate node ids in one batch")
+        for node_id in ids:
+            if node_id in self.index:
+                raise ValueError(f"Node {node_id!r} already exists")
+        ordered = []
+        known = set()
+        pending = rows
+        while pending:
+            waiting = []
+            for row in pending:
+                parent_id = row[1]
+                if parent_id in self.index and self.is_member[self.index[parent_id]]:
+                    raise ValueError(f"Node {parent_id!r} is a person and cannot have members")
+                if parent_id is None or parent_id == '' or parent_id in known or parent_id in self.index:
+                    ordered.append(row)
+                    known.add(row[0])
+                else:
+                    waiting.append(row)
+            if len(waiting) == len(pending):
+                raise ValueError(f"Unknown parent node: {waiting[0][1]!r}")
+            pending = waiting
+        return ordered
+
+    def _check_members(self, node_ids, parent_ids, groups=frozenset()):
+        """
+        Validate people against the tree without changing anything
+
+        Parameters:
+        node_ids, parent_ids: As for set_members
+        groups: Ids of group nodes about to be added
+
+        Returns:
+        Array with the index of every existing person and -1 for new people
+        """
+        np = self.np
+        count = len(node_ids)
+        if len(set(node_ids)) != count:
+            raise ValueError("Duplicate person ids in one batch")
+        nodes = np.empty(count, dtype=np.intp)
+        for position, node_id in enumerate(node_ids):
+            node = self.index.get(node_id)
+            if node_id in groups or node is not None and not self.is_member[node]:
+                raise ValueError(f"Node {node_id!r} is a group, not a person")
+            nodes[position] = -1 if node is None else node
+        for position in np.flatnonzero(nodes < 0):
+            parent_id = parent_ids[position]
+            if parent_id is None or parent_id == '' or parent_id in groups:
+                continue
+            if parent_id not in self.index:
+                raise ValueError(f"Unknown parent node: {parent_id!r}")
+            if self.is_member[self.index[parent_id]]:
+                raise ValueError(f"Node {parent_id!r} is a person and cannot have members")
+        return nodes
+
+    def add_nodes(self, rows):
+        """
+        Add many group nodes; nothing is added unless every row is valid
+
+        Parameters:
+        rows: Iterable of (node_id, parent_id, kind, name, region) tuples in
+              any order; parents missing from the tree must be among the rows
+
+        Returns:
+        Number of nodes added
+        """
+        with self.lock:
+            ordered = self._order_groups(rows)
+            for row in ordered:
+                self._new_node(row[0], row[1], row[2], row[3], row[4], False)
+            return len(ordered)
+
+    def load(self, groups, node_ids=(), parent_ids=(), inputs=None, factors=None, names=None, regions=None):
+        """
+        Add group nodes and add or update people in one step
+
+        Every group and person is validated against the tree and the rest of
+        the batch first, so an invalid row leaves the tree unchanged.
+
+        Parameters:
+        groups: Rows as for add_nodes
+        node_ids, parent_ids, inputs, factors, names, regions: As for set_members
+
+        Returns:
+        (groups added, people added or updated) tuple
+        """
+        with self.lock:
+            ordered = self._order_groups(groups)
+            self._check_members(node_ids, parent_ids, {row[0] for row in ordered})
+            for row in ordered:
+                self._new_node(row[0], row[1], row[2], row[3], row[4], False)
+            people = self.set_members(node_ids, parent_ids, inputs, factors, names, regions) if len(node_ids) else 0
+            return len(ordered), people
+
+    def set_member(self, node_id, inputs, factors=None, parent_id=None, name='', region='', kind='person'):
+        """
+        Add a person or change their inputs, updating their ancestors in O(depth)
+
+        Parameters:
+        node_id: Id of the person
+        inputs: The five calculate_footprint inputs, in BATCH_INPUT_COLUMNS order
+        factors: Optional dictionary mapping categories to EMISSION_FACTORS names
+        parent_id: Group the person belongs to; required for new people
+        name, region, kind: Stored for new people
+
+        Returns:
+        The person's footprints dictionary
+        """
+        with self.lock:
+            choices = self.calculator.resolve_factors(factors)
+            footprints = self.calculator.calculate_footprint(*inputs, factors=choices)['footprints']
+            row = [footprints[category] for category in COMPARED_CATEGORIES]
+            node = self.index.get(node_id)
+            if node is None:
+                node = self._new_node(node_id, parent_id, kind, name, region, True)
+                self.members[self._path(node)] += 1
+            elif not self.is_member[node]:
+                raise ValueError(f"Node {node_id!r} is a group, not a person")
+            self.inputs[node] = inputs
+            self.codes[node] = [self.calculator.factor_index[category][choices[category]]
+                                for category in FOOTPRINT_CATEGORIES]
+            delta = self.np.array(row) - self.totals[node]
+            self.totals[self._path(node)] += delta
+            # The person's own row is set exactly rather than through the delta
+            self.totals[node] = row
+            return footprints
+
+    def set_members(self, node_ids, parent_ids, inputs, factors=None, names=None, regions=None, kind='person'):
+        """
+        Add or update many people at once
+
+        Footprints are calculated together and added to their ancestors one
+        tree level at a time, so loading 100k people takes a few vectorized
+        passes instead of 100k path walks.
+
+        Parameters:
+        node_ids: Ids of the people
+        parent_ids: Groups of the people; used for new people only
+        inputs: Five array-likes in BATCH_INPUT_COLUMNS order
+        factors: Optional factor choices as for calculate_footprints_batch
+        names, regions: Optional sequences stored for new people
+
+        Returns:
+        Number of people added or updated
+        """
+        np = self.np
+        with self.lock:
+            count = len(node_ids)
+            nodes = self._check_members(node_ids, parent_ids)
+            arrays = np.broadcast_arrays(*[np.asarray(values, dtype=np.float64) for values in inputs])
+            arrays = [np.broadcast_to(values, (count,)) for values in arrays]
+            factors = factors or {}
+            codes = [np.broadcast_to(self.calculator.factor_codes(category, factors.get(category,
+                                                                                        DEFAULT_FACTORS[category])),
+                                     (count,)) for category in FOOTPRINT_CATEGORIES]
+            result = self.calculator.calculate_footprints_batch(*arrays, factors=dict(zip(FOOTPRINT_CATEGORIES, codes)))
+            rows = np.column_stack([result['footprints'][category] for category in COMPARED_CATEGORIES])
+
+            new = np.flatnonzero(nodes < 0)
+            for position in new:
+                nodes[position] = self._new_node(node_ids[position], parent_ids[position], kind,
+                                                 names[position] if names is not None else '',
+                                                 regions[position] if regions is not None else '', True)
+
+            # Differences to add to the ancestors, then the people's own rows
+            deltas = rows - self.totals[nodes]
+            self.totals[nodes] = rows
+            self.inputs[nodes] = np.column_stack(arrays)
+            self.codes[nodes] = np.column_stack(codes)
+            self.members[nodes[new]] += 1
+            added = np.zeros(count, dtype=np.int64)
+            added[new] = 1
+            current = self.parents[nodes]
+            while True:
+                valid = current != NO_PARENT
+                if not valid.any():
+                    break
+                current, deltas, added = current[valid], deltas[valid], added[valid]
+                np.add.at(self.totals, current, deltas)
+                np.add.at(self.members, current, added)
+                current = self.parents[current]
+            return count
+
+    def remove_member(self, node_id):
+        """Remove a person, subtracting their footprint from their ancestors."""
+        with self.lock:
+            node = self.index.get(node_id)
+            if node is None or not self.is_member[node]:
+                raise ValueError(f"Unknown person: {node_id!r}")
+            path = self._path(node)
+            self.totals[path[1:]] -= self.totals[node]
+            self.members[path] -= 1
+            parent = int(self.parents[node])
+            if parent != NO_PARENT:
+                self.children[parent].remove(node)
+            # The slot stays allocated but is detached and no longer reachable by id
+            self.parents[node] = NO_PARENT
+            self.totals[node] = 0.0
+            self.is_member[node] = False
+            self.ids[node] = None
+            del self.index[node_id]
+
+    def rebuild(self):
+        """Recompute every group total from the people below it."""
+        np = self.np
+        with self.lock:
+            size = self.size
+            members = self.is_member[:size]
+            totals = np.where(members[:, None], self.totals[:size], 0.0)
+            counts = members.astype(np.int64)
+            # Add each level into its parents, deepest level first
+            depths = self.depths[:size]
+            for depth in range(int(depths.max(initial=0)), 0, -1):
+                level = np.flatnonzero(depths == depth)
+                level = level[self.parents[level] != NO_PARENT]
+                np.add.at(totals, self.parents[level], totals[level])
+                np.add.at(counts, self.parents[level], counts[level])
+            self.totals[:size] = totals
+            self.members[:size] = counts
+
+    def recalculate(self, calculator=None):
+        """
+        Recalculate every person's footprint, e.g. after a dataset change
+
+        Parameters:
+        calculator: Optional new CarbonFootprintCalculator to use from now on
+        """
+        np = self.np
+        with self.lock:
+            if calculator is not None:
+                self.calculator = calculator
+            people = np.flatnonzero(self.is_member[:self.size])
+            if len(people):
+                factors = {category: self.codes[people, column] for column, category in enumerate(FOOTPRINT_CATEGORIES)}
+                result = self.calculator.calculate_footprints_batch(*self.inputs[people].T, factors=factors)
+                self.totals[people] = np.column_stack([result['footprints'][category]
+                                                       for category in COMPARED_CATEGORIES])
+            self.rebuild()
+
+    def region_of(self, node):
+        """Return the region of a node or its nearest ancestor with one, or ''."""
+        for ancestor in self._path(node):
+            if self.regions[ancestor]:
+                return self.regions[ancestor]
+        return ''
+
+    def summary(self, node_id, expand=False):
+        """
+        Return the totals and comparisons of one node
+
+        Parameters:
+        node_id: Id of the node
+        expand: Include the summaries of the node's children instead of their ids
+
+        Returns:
+        Dictionary with the node's 'id', 'kind', 'name', 'parent', 'depth',
+        'region', 'members' (people below it), 'footprints' (totals per
+        category), 'per_member' (mean footprints), 'comparisons' and
+        'regional_comparisons' of the per-member means as 'low', 'moderate'
+        or 'high', and 'children'
+        """
+        with self.lock:
+            node = self.index.get(node_id)
+            if node is None:
+                raise KeyError(node_id)
+            table = self.calculator.table
+            totals = self.totals[node].tolist()
+            members = int(self.members[node])
+            per_member = [value / members for value in totals] if members else None
+            region = self.region_of(node)
+            parent = int(self.parents[node])
+            result = {
+                'id': node_id,
+                'kind': self.kinds[node],
+                'name': self.names[node],
+                'parent': self.ids[parent] if parent != NO_PARENT else None,
+                'depth': int(self.depths[node]),
+                'region': region,
+                'members': members,
+                'footprints': dict(zip(COMPARED_CATEGORIES, totals)),
+                'per_member': dict(zip(COMPARED_CATEGORIES, per_member)) if per_member else None,
+                'comparisons': None,
+                'regional_comparisons': None,
+                'dataset_version': self.calculator.dataset_version
+            }
+            if per_member:
+                result['comparisons'] = {category: LEVEL_NAMES[code] for category, code
+                                         in zip(COMPARED_CATEGORIES, table.level_codes(per_member))}
+                if region in table.region_index:
+                    result['regional_comparisons'] = {category: LEVEL_NAMES[code] for category, code
+                                                      in zip(COMPARED_CATEGORIES,
+                                                             table.regional_level_codes(per_member, region))}
+            if self.is_member[node]:
+                result['inputs'] = dict(zip(BATCH_INPUT_COLUMNS, self.inputs[node].tolist()))
+                result['factors'] = {category: self.calculator.factor_names[category][code]
+                                     for category, code in zip(FOOTPRINT_CATEGORIES, self.codes[node].tolist())}
+            if expand:
+                result['children'] = [self.summary(self.ids[child]) for child in self.children[node]]
+            else:
+                result['children'] = [self.ids[child] for child in self.children[node]]
+            return result
+
+    def roots(self):
+        """Return the ids of the root nodes."""
+        with self.lock:
+            return [self.ids[node] for node in range(self.size)
+                    if self.parents[node] == NO_PARENT and self.ids[node] is not None]
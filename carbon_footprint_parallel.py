@@ -0,0 +1,180 @@
+"""
+Carbon Footprint Parallel Batch Executor
+
+Runs calculate_footprints_batch across a pool of worker processes. Inputs
+and results are placed in shared memory blocks and every worker computes a
+fixed row range (shard) in place, so only block names and offsets are sent
+between processes. Each shard writes to its own rows of the output, so the
+result order does not depend on which worker finishes first.
+
+The calculation itself is a few vectorized multiplications per row and is
+bound by memory bandwidth, so copying inputs into shared memory and results
+back out costs about as much as computing them. Sharding only pays off for
+very large inputs on many cores; smaller inputs are computed in-process.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from time import perf_counter
+
+from carbon_footprint_metrics import MODEL_SECONDS
+from carbon_footprint_model import BATCH_INPUT_COLUMNS, COMPARED_CATEGORIES, FOOTPRINT_CATEGORIES, CarbonFootprintCalculator
+
+# Default number of rows computed by one task
+DEFAULT_CHUNK_SIZE = 262144
+
+# Default smallest input sharded across workers. Below it the in-process
+# path, at roughly 20 million rows per second, is faster: 600,000 rows on
+# 2 workers ran at 0.56x the single-process speed.
+DEFAULT_MIN_ROWS = 4000000
+
+# Calculator of a worker process
+_worker_calculator = None
+
+def _init_worker(dataset):
+    global _worker_calculator
+    _worker_calculator = CarbonFootprintCalculator(dataset)
+
+def _attach(name):
+    """Attach an existing shared memory block without handing its cleanup to this process."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 always tracks attached blocks
+        return shared_memory.SharedMemory(name=name)
+
+def _layout(np, size, code_categories):
+    """
+    Return the (key, dtype, rows, offset) arrays of a run and the total bytes
+    
+    A run's shared block holds the five input rows, one factor code row per
+    category with per-row factor choices, then the footprint and comparison
+    rows of every COMPARED_CATEGORIES entry.
+    """
+    offset = 0
+    arrays = []
+    for key, dtype, rows in (('inputs', np.float64, len(BATCH_INPUT_COLUMNS)),
+                             ('codes', np.intp, len(code_categories)),
+                             ('footprints', np.float64, len(COMPARED_CATEGORIES)),
+                             ('comparisons', np.int8, len(COMPARED_CATEGORIES))):
+        arrays.append((key, dtype, rows, offset))
+        offset += rows * size * np.dtype(dtype).itemsize
+    return arrays, offset
+
+def _views(np, buffer, size, code_categories):
+    """Return the arrays of a run as views of its shared buffer."""
+    arrays, _ = _layout(np, size, code_categories)
+    return {key: np.ndarray((rows, size), dtype=dtype, buffer=buffer, offset=offset)
+            for key, dtype, rows, offset in arrays}
+
+def _run_shard(name, size, code_categories, scalar_factors, start, stop):
+    """Compute rows [start, stop) of a run in a worker process."""
+    import numpy as np
+
+    block = _attach(name)
+    try:
+        views = _views(np, block.buf, size, code_categories)
+        factors = dict(scalar_factors)
+        for row, category in enumerate(code_categories):
+            factors[category] = views['codes'][row, start:stop]
+        result = _worker_calculator.calculate_footprints_batch(*views['inputs'][:, start:stop], factors=factors)
+        for row, category in enumerate(COMPARED_CATEGORIES):
+            views['footprints'][row, start:stop] = result['footprints'][category]
+            views['comparisons'][row, start:stop] = result['comparisons'][category]
+    finally:
+        # Views must be released before the block can be closed
+        views = factors = None
+        block.close()
+    return stop - start
+
+class ShardedExecutor:
+    def __init__(self, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, calculator=None, min_rows=DEFAULT_MIN_ROWS):
+        """
+        Parameters:
+        workers: Number of worker processes (default: os.cpu_count())
+        chunk_size: Rows per task; inputs smaller than one chunk are computed in-process
+        calculator: CarbonFootprintCalculator used for validation and in-process runs;
+                    workers are given the same dataset
+        min_rows: Inputs with fewer rows are computed in-process (default: DEFAULT_MIN_ROWS)
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.min_rows = min_rows
+        self.calculator = calculator or CarbonFootprintCalculator()
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def calculate_footprints_batch(self, *inputs, factors=None):
+        """
+        Calculate carbon footprints for many profiles on all workers
+
+        Takes the same arguments and returns the same result as
+        CarbonFootprintCalculator.calculate_footprints_batch, element for
+        element.
+        """
+        import numpy as np
+
+        frame, inputs, factors = self.calculator.unpack_batch_inputs(inputs, factors)
+        arrays = np.broadcast_arrays(*[np.asarray(values, dtype=np.float64) for values in inputs])
+        shape = arrays[0].shape
+        size = arrays[0].size
+        if self.workers <= 1 or size <= self.chunk_size or size < self.min_rows:
+            return self.calculator.calculate_footprints_batch(*(frame,) if frame is not None else arrays,
+                                                              factors=factors)
+
+        start = perf_counter()
+        factors = factors or {}
+        for category in factors:
+            if category not in FOOTPRINT_CATEGORIES:
+                raise ValueError(f"Unknown emission factor category: {category!r}")
+        # Names shared by every row travel with the task; per-row choices go to shared memory
+        scalar_factors = {category: choice for category, choice in factors.items() if isinstance(choice, str)}
+        for category, choice in scalar_factors.items():
+            self.calculator.factor_codes(category, choice)
+        code_categories = tuple(category for category in FOOTPRINT_CATEGORIES
+                                if category in factors and category not in scalar_factors)
+        codes = [np.broadcast_to(self.calculator.factor_codes(category, factors[category]), shape).ravel()
+                 for category in code_categories]
+
+        block = shared_memory.SharedMemory(create=True, size=_layout(np, size, code_categories)[1])
+        views = None
+        try:
+            views = _views(np, block.buf, size, code_categories)
+            for row, values in enumerate(arrays):
+                views['inputs'][row] = values.ravel()
+            for row, values in enumerate(codes):
+                views['codes'][row] = values
+
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                initargs=(self.calculator.dataset,))
+            tasks = [self.pool.submit(_run_shard, block.name, size, code_categories, scalar_factors,
+                                      offset, min(offset + self.chunk_size, size))
+                     for offset in range(0, size, self.chunk_size)]
+            for task in tasks:
+                task.result()
+
+            footprints = {category: views['footprints'][row].reshape(shape).copy()
+                          for row, category in enumerate(COMPARED_CATEGORIES)}
+            comparisons = {category: views['comparisons'][row].reshape(shape).copy()
+                           for row, category in enumerate(COMPARED_CATEGORIES)}
+        finally:
+            views = None
+            block.close()
+            block.unlink()
+
+        result = self.calculator.pack_batch_result(footprints, comparisons, frame)
+        MODEL_SECONDS.observe(('sharded_batch',), perf_counter() - start)
+        return result
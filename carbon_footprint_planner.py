@@ -0,0 +1,196 @@
+"""
+Carbon Footprint Goal Planner
+
+Finds the least-effort set of reduction suggestions that brings a profile's
+total footprint down to a target, e.g. the global average. Suggestions are
+quantified by the WhatIfEngine (SUGGESTION_EFFECTS): within a category the
+input scales multiply and at most one emission factor switch applies, and
+categories add up to the total independently.
+
+That makes the search an exact dynamic program over integer effort costs
+(EFFORT_COSTS) instead of a walk through the 2^30 subsets of
+REDUCTION_SUGGESTIONS:
+
+1. Per category, a 0/1 knapsack over the scale suggestions gives the
+   smallest input scale reachable within every effort budget, once per
+   emission factor option. This does not depend on the profile.
+2. Per profile, each category term is the minimum over its factor options
+   at every budget, and the categories are combined with a min-plus
+   convolution, giving the smallest total reachable within every budget.
+3. The plan is the smallest budget whose total meets the target, traced
+   back through the choices made in step 2.
+
+Step 2 runs on arrays, so many profiles are planned at once.
+"""
+from carbon_footprint_model import ANNUAL_MULTIPLIERS, FOOTPRINT_CATEGORIES
+
+# Effort cost of each REDUCTION_SUGGESTIONS 'effort' label
+EFFORT_COSTS = {
+    'Low': 1,
+    'Medium': 2,
+    'Variable': 2,
+    'High': 3
+}
+
+class GoalPlanner:
+    def __init__(self, engine, effort_costs=None):
+        """
+        Build the per-category effort tables
+
+        Parameters:
+        engine: WhatIfEngine providing the quantified suggestions
+        effort_costs: Optional dictionary replacing EFFORT_COSTS
+        """
+        self.engine = engine
+        self.calculator = engine.calculator
+        self.effort_costs = effort_costs or EFFORT_COSTS
+        self.costs = []
+        for category, suggestion in engine.suggestions:
+            if suggestion.get('effort') not in self.effort_costs:
+                raise ValueError(f"Unknown effort of suggestion {suggestion['title']!r}: {suggestion.get('effort')!r}")
+            self.costs.append(self.effort_costs[suggestion['effort']])
+
+        # Per category: factor options as (factor value or None for the
+        # profile's own, smallest scale per budget, suggestion columns per budget)
+        self.options = []
+        for index in range(len(FOOTPRINT_CATEGORIES)):
+            columns = [column for column, action in enumerate(engine.actions) if action[0] == index]
+            scales = [column for column in columns if engine.actions[column][1] is not None]
+            switches = [column for column in columns if engine.actions[column][1] is None]
+            capacity = sum(self.costs[column] for column in scales) + max([self.costs[column] for column in switches],
+                                                                          default=0)
+            best = self._scale_table(scales, capacity)
+            options = [(None, [product for product, _ in best], [chosen for _, chosen in best])]
+            for column in switches:
+                cost = self.costs[column]
+                products = [float('inf')] * cost + [product for product, _ in best[:capacity + 1 - cost]]
+                chosen = [None] * cost + [(column,) + scaled for _, scaled in best[:capacity + 1 - cost]]
+                options.append((engine.actions[column][2], products, chosen))
+            self.options.append(options)
+
+    def _scale_table(self, columns, capacity):
+        """Return the smallest product of scales and its columns within every effort budget up to capacity."""
+        # 0/1 knapsack; every budget starts from the empty set, so entries cover costs up to the budget
+        best = [(1.0, ())] * (capacity + 1)
+        for column in columns:
+            cost = self.costs[column]
+            scale = self.engine.actions[column][1]
+            for budget in range(capacity, cost - 1, -1):
+                product = best[budget - cost][0] * scale
+                if product < best[budget][0]:
+                    best[budget] = (product, best[budget - cost][1] + (column,))
+        return best
+
+    def plan_batch(self, electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters,
+                   targets=None, factors=None):
+        """
+        Plan the least-effort suggestions for many profiles at once
+
+        Parameters are the same as CarbonFootprintCalculator.calculate_footprints_batch
+        with array inputs, plus:
+        targets: Target totals in tons CO2/year, a scalar or an array; defaults
+                 to the global average total
+
+        Returns:
+        Dictionary with 'total', 'new_total' (float64 arrays), 'effort' (int64
+        array), 'reached' (bool array) and 'plans' (one tuple of WhatIfEngine
+        suggestion columns per profile). Where the target is out of reach the
+        plan is the least-effort one with the lowest total.
+        """
+        import numpy as np
+
+        inputs = np.broadcast_arrays(*[np.asarray(values, dtype=np.float64).ravel() for values in
+                                       (electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters)])
+        size = inputs[0].size
+        factor_values = self.calculator.gather_factors(factors)
+        if targets is None:
+            targets = self.calculator.global_averages['total']
+        targets = np.broadcast_to(np.asarray(targets, dtype=np.float64).ravel(), (size,))
+
+        # Smallest total per effort budget, adding categories in calculate_footprint order
+        totals = np.zeros((size, 1))
+        picks = []
+        for index, options in enumerate(self.options):
+            profile_factor = np.broadcast_to(factor_values[FOOTPRINT_CATEGORIES[index]], (size,))[:, None]
+            terms = []
+            for factor, products, _ in options:
+                finite = np.array([1.0 if product == float('inf') else product for product in products])
+                term = inputs[index][:, None] * finite * ANNUAL_MULTIPLIERS[index] * (
+                    profile_factor if factor is None else factor)
+                term[:, np.isinf(products)] = np.inf
+                terms.append(term)
+            terms = np.stack(terms, axis=1)
+            option = np.argmin(terms, axis=1)
+            term = np.take_along_axis(terms, option[:, None, :], axis=1)[:, 0, :]
+
+            combined = np.full((size, totals.shape[1] + term.shape[1] - 1), np.inf)
+            spent = np.zeros(combined.shape, dtype=np.int64)
+            for budget in range(term.shape[1]):
+                candidate = totals + term[:, budget:budget + 1]
+                window = combined[:, budget:budget + totals.shape[1]]
+                better = candidate < window
+                window[better] = candidate[better]
+                spent[:, budget:budget + totals.shape[1]][better] = budget
+            picks.append((option, spent))
+            totals = combined
+
+        # Smallest budget meeting the target, else the smallest budget with the lowest total
+        reached = totals <= targets[:, None]
+        budgets = np.where(reached.any(axis=1), np.argmax(reached, axis=1), np.argmin(totals, axis=1))
+        rows = np.arange(size)
+        new_totals = totals[rows, budgets]
+
+        # Trace the budget spent on each category back from the last one
+        chosen = [()] * size
+        remaining = budgets
+        for index in range(len(self.options) - 1, -1, -1):
+            option, spent = picks[index]
+            category_budget = spent[rows, remaining]
+            category_option = option[rows, category_budget]
+            remaining = remaining - category_budget
+            tables = self.options[index]
+            for row in np.flatnonzero(category_budget):
+                chosen[row] = tables[category_option[row]][2][category_budget[row]] + chosen[row]
+
+        plans = [tuple(sorted(columns)) for columns in chosen]
+        return {
+            'total': totals[:, 0],
+            'new_total': new_totals,
+            'effort': np.array([sum(self.costs[column] for column in columns) for columns in plans], dtype=np.int64),
+            'reached': new_totals <= targets,
+            'plans': plans
+        }
+
+    def plan(self, electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters,
+             target=None, factors=None):
+        """
+        Plan the least-effort suggestions for one profile
+
+        Parameters are the same as CarbonFootprintCalculator.calculate_footprint, plus:
+        target: Target total in tons CO2/year; defaults to the global average total
+
+        Returns:
+        Dictionary with 'target', 'total', 'new_total', 'savings' (tons
+        CO2/year), 'effort', 'reached' and 'suggestions', a list of the chosen
+        suggestions with their 'category'
+        """
+        if target is None:
+            target = self.calculator.global_averages['total']
+        result = self.plan_batch(electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters,
+                                 target, factors)
+        return self.describe(result, 0, target)
+
+    def describe(self, result, row, target):
+        """Return the plan of one plan_batch row as a JSON-ready dictionary."""
+        total = float(result['total'][row])
+        new_total = float(result['new_total'][row])
+        return {
+            'target': float(target),
+            'total': total,
+            'new_total': new_total,
+            'savings': total - new_total,
+            'effort': int(result['effort'][row]),
+            'reached': bool(result['reached'][row]),
+            'suggestions': [dict(self.engine.suggestions[column][1], category=self.engine.suggestions[column][0])
+                            for column in result['plans'][row]]
+        }
@@ -0,0 +1,226 @@
+"""
+Carbon Footprint Population Statistics
+
+Streaming, bounded-memory distribution of the footprints calculated so far,
+per region and category, used to answer "you are in the 83rd percentile of
+Europe" style questions. Each distribution is a fixed set of log-spaced bins
+stored in a Fenwick tree, so updates and percentile queries are O(log bins)
+and two statistics objects merge by adding their trees element by element.
+"""
+import bisect
+import math
+import marshal
+import os
+import threading
+
+from carbon_footprint_model import COMPARED_CATEGORIES
+
+# Region key that aggregates every observation regardless of region
+ALL_REGIONS = 'All'
+
+# Bin layout: log-spaced edges between these bounds, in tons CO2/year
+BIN_LOW = 0.0001
+BIN_HIGH = 1000.0
+BIN_COUNT = 2048
+
+# Serialized statistics format version
+STATS_FORMAT = 1
+
+def make_edges(low=BIN_LOW, high=BIN_HIGH, count=BIN_COUNT):
+    """Return count + 1 log-spaced bin edges between low and high."""
+    step = (math.log(high) - math.log(low)) / count
+    return tuple(math.exp(math.log(low) + step * index) for index in range(count + 1))
+
+class FenwickHistogram:
+    """
+    Fixed-bin histogram backed by a Fenwick (binary indexed) tree
+
+    Bin 0 holds values below the first edge and the last bin values at or
+    above the last edge, so no observation is ever dropped.
+    """
+    __slots__ = ('edges', 'size', 'tree')
+
+    def __init__(self, edges, tree=None):
+        self.edges = edges
+        self.size = len(edges) + 1
+        self.tree = list(tree) if tree is not None else [0] * (self.size + 1)
+
+    def bin_index(self, value):
+        return bisect.bisect_right(self.edges, value)
+
+    def add(self, value, count=1):
+        """Record count observations of value."""
+        position = self.bin_index(value) + 1
+        tree = self.tree
+        while position <= self.size:
+            tree[position] += count
+            position += position & -position
+
+    def add_counts(self, counts):
+        """Record a whole vector of per-bin counts in O(bins)."""
+        self.merge_tree(self.build_tree(counts))
+
+    def build_tree(self, counts):
+        """Return the Fenwick tree for a vector of per-bin counts."""
+        tree = [0] + [int(count) for count in counts]
+        for position in range(1, self.size + 1):
+            parent = position + (position & -position)
+            if parent <= self.size:
+                tree[parent] += tree[position]
+        return tree
+
+    def merge_tree(self, tree):
+        """Add another tree with the same bins; Fenwick trees are linear in the counts."""
+        self.tree = [a + b for a, b in zip(self.tree, tree)]
+
+    def prefix(self, bin_index):
+        """Return the number of observations in bins 0..bin_index."""
+        position = bin_index + 1
+        total = 0
+        tree = self.tree
+        while position > 0:
+            total += tree[position]
+            position -= position & -position
+        return total
+
+    @property
+    def total(self):
+        return self.prefix(self.size - 1)
+
+    def percentile(self, value):
+        """Return the percentage of observations below value, counting half of its own bin."""
+        total = self.total
+        if not total:
+            return None
+        index = self.bin_index(value)
+        below = self.prefix(index - 1) if index else 0
+        within = self.prefix(index) - below
+        return 100.0 * (below + within / 2) / total
+
+class PopulationStats:
+    """Thread-safe per-region, per-category footprint distributions."""
+
+    def __init__(self, edges=None):
+        self.edges = edges or make_edges()
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def _histogram(self, region, category):
+        key = (region, category)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = FenwickHistogram(self.edges)
+        return histogram
+
+    def observe(self, footprints, region=''):
+        """
+        Record one calculation
+
+        Parameters:
+        footprints: Dictionary of footprint values by category, as returned
+                    by calculate_footprint, or a tuple in COMPARED_CATEGORIES order
+        region: Region of the profile; every observation is also counted under ALL_REGIONS
+        """
+        if isinstance(footprints, dict):
+            footprints = [footprints[category] for category in COMPARED_CATEGORIES]
+        regions = (ALL_REGIONS, region) if region and region != ALL_REGIONS else (ALL_REGIONS,)
+        with self.lock:
+            for category, value in zip(COMPARED_CATEGORIES, footprints):
+                for key in regions:
+                    self._histogram(key, category).add(value)
+
+    def observe_batch(self, footprints, regions=None):
+        """
+        Record many calculations at once
+
+        Parameters:
+        footprints: Dictionary of float arrays by category, as returned by
+                    calculate_footprints_batch
+        regions: Optional region name, or array of region names, per row
+        """
+        import numpy as np
+
+        edges = np.asarray(self.edges)
+        size = len(self.edges) + 1
+        groups = [(ALL_REGIONS, None)]
+        if regions is not None and not isinstance(regions, str):
+            regions = np.asarray(regions, dtype=str)
+            groups += [(name, regions == name) for name in np.unique(regions) if name and name != ALL_REGIONS]
+        elif regions and regions != ALL_REGIONS:
+            groups.append((regions, None))
+
+        updates = []
+        for category in COMPARED_CATEGORIES:
+            bins = np.searchsorted(edges, np.asarray(footprints[category]).ravel(), side='right')
+            for region, mask in groups:
+                selected = bins if mask is None else bins[mask.ravel()]
+                updates.append((region, category, np.bincount(selected, minlength=size)))
+
+        with self.lock:
+            for region, category, counts in updates:
+                self._histogram(region, category).add_counts(counts)
+
+    def percentile(self, value, region=ALL_REGIONS, category='total'):
+        """Return the percentile of value within a region and category, or None without data."""
+        with self.lock:
+            histogram = self.histograms.get((region or ALL_REGIONS, category))
+            return histogram.percentile(value) if histogram is not None else None
+
+    def count(self, region=ALL_REGIONS, category='total'):
+        """Return the number of observations for a region and category."""
+        with self.lock:
+            histogram = self.histograms.get((region or ALL_REGIONS, category))
+            return histogram.total if histogram is not None else 0
+
+    def merge(self, other):
+        """Add the observations of another PopulationStats with the same bins."""
+        if other.edges != self.edges:
+            raise ValueError("Cannot merge population statistics with different bins")
+        with other.lock:
+            trees = {key: list(histogram.tree) for key, histogram in other.histograms.items()}
+        with self.lock:
+            for (region, category), tree in trees.items():
+                self._histogram(region, category).merge_tree(tree)
+        return self
+
+    def to_bytes(self):
+        with self.lock:
+            return marshal.dumps({
+                'format': STATS_FORMAT,
+                'edges': self.edges,
+                'trees': {f'{region}\0{category}': histogram.tree
+                          for (region, category), histogram in self.histograms.items()}
+            })
+
+    @classmethod
+    def from_bytes(cls, data):
+        snapshot = marshal.loads(data)
+        if not isinstance(snapshot, dict) or snapshot.get('format') != STATS_FORMAT:
+            raise ValueError("Unsupported population statistics format")
+        stats = cls(tuple(snapshot['edges']))
+        for key, tree in snapshot['trees'].items():
+            region, category = key.split('\0')
+            stats.histograms[(region, category)] = FenwickHistogram(stats.edges, tree)
+        return stats
+
+    def save(self, path):
+        """Write the statistics to a file atomically, so readers never see a partial file."""
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+def merge_files(paths, stats=None):
+    """Merge saved statistics files into stats, or into a new PopulationStats."""
+    for path in paths:
+        loaded = PopulationStats.load(path)
+        if stats is None:
+            stats = loaded
+        else:
+            stats.merge(loaded)
+    return stats if stats is not None else PopulationStats()
@@ -0,0 +1,204 @@
+"""
+Carbon Footprint Scenario Sweep
+
+Evaluates the calculation model over a Cartesian grid of the five inputs,
+e.g. 100 values per input (10^10 scenarios), without materializing it. The
+grid is walked in C order in chunks: the leading inputs are fixed per chunk
+and the trailing inputs are broadcast, so a chunk's totals are a sum of five
+broadcast 1-D category terms. Each chunk is reduced right away into a
+histogram of totals, the count above a threshold and per-input marginals.
+"""
+import itertools
+from time import perf_counter
+
+from carbon_footprint_data import CONSUMPTION_VALUES
+from carbon_footprint_metrics import MODEL_SECONDS
+from carbon_footprint_model import ANNUAL_MULTIPLIERS, BATCH_INPUT_COLUMNS, FOOTPRINT_CATEGORIES
+
+# Default number of values per input
+DEFAULT_STEPS = 100
+
+# Default number of histogram bins over the range of totals
+DEFAULT_BINS = 100
+
+# Default relative margin added around the CONSUMPTION_VALUES range of each input
+DEFAULT_MARGIN = 0.5
+
+# Default memory for the working arrays of one chunk, in bytes
+DEFAULT_MAX_MEMORY = 64 * 1024 * 1024
+
+# Working bytes per grid point: totals, one temporary, histogram bin indices and the above-threshold mask
+BYTES_PER_POINT = 8 + 8 + 8 + 1
+
+def default_ranges(margin=DEFAULT_MARGIN):
+    """
+    Return (low, high) ranges around the web form consumption levels
+
+    Each range spans the lowest to the highest CONSUMPTION_VALUES level of
+    an input, widened by margin times that level, in BATCH_INPUT_COLUMNS order.
+    """
+    ranges = []
+    for levels in CONSUMPTION_VALUES.values():
+        ranges.append((max(min(levels.values()) * (1 - margin), 0.0), max(levels.values()) * (1 + margin)))
+    return ranges
+
+def make_axes(ranges=None, steps=DEFAULT_STEPS):
+    """
+    Return evenly spaced values for each input
+
+    Parameters:
+    ranges: (low, high) per input in BATCH_INPUT_COLUMNS order; defaults to default_ranges()
+    steps: Number of values per input, or a sequence with one count per input
+    """
+    import numpy as np
+
+    ranges = ranges or default_ranges()
+    if len(ranges) != len(BATCH_INPUT_COLUMNS):
+        raise ValueError(f"Expected {len(BATCH_INPUT_COLUMNS)} ranges, got {len(ranges)}")
+    counts = [steps] * len(ranges) if isinstance(steps, int) else list(steps)
+    for count in counts:
+        if count < 1:
+            raise ValueError("Every input needs at least one step")
+    return [np.linspace(low, high, count) for (low, high), count in zip(ranges, counts)]
+
+class ScenarioSweep:
+    def __init__(self, calculator, axes, factors=None):
+        """
+        Parameters:
+        calculator: CarbonFootprintCalculator providing the dataset
+        axes: One 1-D array of values per input, in BATCH_INPUT_COLUMNS order
+        factors: Optional dictionary mapping categories to EMISSION_FACTORS names
+        """
+        import numpy as np
+
+        if len(axes) != len(BATCH_INPUT_COLUMNS):
+            raise ValueError(f"Expected {len(BATCH_INPUT_COLUMNS)} axes, got {len(axes)}")
+        self.calculator = calculator
+        self.axes = [np.asarray(values, dtype=np.float64).ravel() for values in axes]
+        self.shape = tuple(len(values) for values in self.axes)
+        self.size = 1
+        for count in self.shape:
+            self.size *= count
+        choices = calculator.resolve_factors(factors)
+
+        # Each category term depends on one input only, computed as in calculate_footprint
+        self.terms = [values * multiplier * calculator.emission_factors[category][choices[category]]
+                      for values, multiplier, category in zip(self.axes, ANNUAL_MULTIPLIERS, FOOTPRINT_CATEGORIES)]
+
+    def total_range(self):
+        """Return the exact smallest and largest total on the grid."""
+        return (sum(float(term.min()) for term in self.terms), sum(float(term.max()) for term in self.terms))
+
+    def iter_chunks(self, max_points):
+        """
+        Yield (index, totals) for consecutive blocks of the grid
+
+        index holds, per input, an int where the input is fixed in the chunk
+        or a slice where it varies; totals is a float64 array with one axis
+        per varying input and at most max_points elements.
+        """
+        # Broadcast as many trailing inputs as fit, then slice the input before them
+        inputs = len(self.shape)
+        split, block = inputs, 1
+        while split > 0 and block * self.shape[split - 1] <= max_points:
+            split -= 1
+            block *= self.shape[split]
+        sliced = max(split - 1, 0)
+        step = self.shape[0] if split == 0 else max(1, max_points // block)
+
+        # Varying terms shaped to broadcast along their own chunk axis
+        shaped = {axis: self.terms[axis].reshape((-1,) + (1,) * (inputs - 1 - axis)) for axis in range(sliced, inputs)}
+        for fixed in itertools.product(*[range(count) for count in self.shape[:sliced]]):
+            for first in range(0, self.shape[sliced], step):
+                index = list(fixed) + [slice(first, min(first + step, self.shape[sliced]))]
+                index += [slice(None)] * (inputs - len(index))
+                # Add the category terms in calculate_footprint order so totals match it exactly
+                totals = None
+                for axis, position in enumerate(index):
+                    if axis < sliced:
+                        term = self.terms[axis][position]
+                    elif axis == sliced:
+                        term = shaped[axis][position]
+                    else:
+                        term = shaped[axis]
+                    totals = term if totals is None else totals + term
+                yield index, totals
+
+    def run(self, bins=DEFAULT_BINS, threshold=None, max_memory=DEFAULT_MAX_MEMORY, progress=None):
+        """
+        Reduce the whole grid into summaries
+
+        Parameters:
+        bins: Number of equal-width histogram bins between the smallest and largest total
+        threshold: Total in tons CO2/year to compare against; defaults to the calculator's global average
+        max_memory: Bytes allowed for the working arrays of one chunk
+        progress: Optional callable receiving (points done, points total) after each chunk
+
+        Returns:
+        Dictionary with 'points', 'threshold', 'share_above', 'mean_total',
+        'min_total', 'max_total', 'histogram' ({'edges', 'counts'}) and
+        'marginal', mapping each BATCH_INPUT_COLUMNS input to its 'values'
+        with the 'mean_total' and 'share_above' over all scenarios sharing
+        each value
+        """
+        import numpy as np
+
+        start = perf_counter()
+        threshold = self.calculator.global_averages['total'] if threshold is None else threshold
+        low, high = self.total_range()
+        edges = np.linspace(low, high, bins + 1)
+        scale = bins / (high - low) if high > low else 0.0
+        histogram = np.zeros(bins, dtype=np.int64)
+        above_total = 0
+        sum_total = 0.0
+        marginal_above = [np.zeros(count, dtype=np.int64) for count in self.shape]
+        marginal_sum = [np.zeros(count) for count in self.shape]
+        done = 0
+
+        max_points = max(1, max_memory // BYTES_PER_POINT)
+        for index, totals in self.iter_chunks(max_points):
+            points = totals.size
+            above = totals > threshold
+            bin_index = ((totals - low) * scale).astype(np.int64)
+            np.minimum(bin_index, bins - 1, out=bin_index)
+            histogram += np.bincount(bin_index.ravel(), minlength=bins)
+            chunk_above = int(np.count_nonzero(above))
+            chunk_sum = float(totals.sum())
+            above_total += chunk_above
+            sum_total += chunk_sum
+
+            # Marginals: fixed inputs take the whole chunk, varying ones reduce the other chunk axes
+            varying = [axis for axis, position in enumerate(index) if not isinstance(position, int)]
+            for axis, position in enumerate(index):
+                if isinstance(position, int):
+                    marginal_above[axis][position] += chunk_above
+                    marginal_sum[axis][position] += chunk_sum
+                else:
+                    dimension = varying.index(axis)
+                    others = tuple(other for other in range(totals.ndim) if other != dimension)
+                    marginal_above[axis][position] += np.count_nonzero(above, axis=others)
+                    marginal_sum[axis][position] += totals.sum(axis=others)
+
+            done += points
+            if progress is not None:
+                progress(done, self.size)
+
+        MODEL_SECONDS.observe(('scenario_sweep',), perf_counter() - start)
+        marginal = {}
+        for axis, column in enumerate(BATCH_INPUT_COLUMNS):
+            per_value = self.size // self.shape[axis]
+            marginal[column] = {
+                'values': self.axes[axis].tolist(),
+                'mean_total': (marginal_sum[axis] / per_value).tolist(),
+                'share_above': (marginal_above[axis] / per_value).tolist()
+            }
+        return {
+            'points': self.size,
+            'threshold': threshold,
+            'share_above': above_total / self.size,
+            'mean_total': sum_total / self.size,
+            'min_total': low,
+            'max_total': high,
+            'histogram': {'edges': edges.tolist(), 'counts': histogram.tolist()},
+            'marginal': marginal
+        }
@@ -0,0 +1,170 @@
+"""
+Carbon Footprint Uncertainty
+
+Monte Carlo uncertainty bands for footprints. Every emission factor is drawn
+from the distribution configured in FACTOR_UNCERTAINTY; one draw of all
+factors is a sample, shared by every profile, so the results describe how
+much the footprints could move if the dataset values are off.
+
+A category footprint is its annual quantity times one factor, so its mean
+and percentiles are exact scalings of the factor samples. Only the total
+needs the full profiles x samples matrix, which is built a block of rows at
+a time so peak memory stays under a fixed budget.
+"""
+from time import perf_counter
+
+from carbon_footprint_metrics import MODEL_SECONDS
+from carbon_footprint_model import ANNUAL_MULTIPLIERS, COMPARED_CATEGORIES, DEFAULT_FACTORS, FOOTPRINT_CATEGORIES
+
+# Default number of factor samples
+DEFAULT_SAMPLES = 1000
+
+# Percentiles reported next to the mean
+DEFAULT_PERCENTILES = (5, 95)
+
+# Default memory for the totals of one block of rows and their percentile workspace, in bytes
+DEFAULT_MAX_MEMORY = 256 * 1024 * 1024
+
+DISTRIBUTIONS = ('lognormal', 'normal', 'uniform', 'triangular')
+
+def sample_factor(rng, value, spec, samples):
+    """
+    Draw samples of one emission factor
+
+    Parameters:
+    rng: numpy Generator
+    value: Point value of the factor from EMISSION_FACTORS
+    spec: Dictionary with 'distribution' (one of DISTRIBUTIONS) and 'spread'
+    samples: Number of samples
+
+    Returns:
+    float64 array of non-negative samples
+    """
+    import numpy as np
+
+    distribution = spec['distribution']
+    spread = spec['spread']
+    if distribution == 'lognormal':
+        return value * rng.lognormal(0.0, spread, samples)
+    if distribution == 'normal':
+        return np.maximum(rng.normal(value, value * spread, samples), 0.0)
+    if distribution == 'uniform':
+        return rng.uniform(value * max(1 - spread, 0.0), value * (1 + spread), samples)
+    if distribution == 'triangular':
+        return rng.triangular(value * max(1 - spread, 0.0), value, value * (1 + spread), samples)
+    raise ValueError(f"Unknown factor distribution: {distribution!r}")
+
+class UncertaintyModel:
+    def __init__(self, calculator, samples=DEFAULT_SAMPLES, seed=0, uncertainty=None):
+        """
+        Draw the factor samples
+
+        Parameters:
+        calculator: CarbonFootprintCalculator providing the dataset
+        samples: Number of Monte Carlo samples
+        seed: Seed of the random generator; equal seeds give equal results
+        uncertainty: Optional table replacing calculator.factor_uncertainty
+        """
+        import numpy as np
+
+        if samples < 1:
+            raise ValueError("samples must be at least 1")
+        self.calculator = calculator
+        self.samples = samples
+        self.seed = seed
+        self.uncertainty = uncertainty if uncertainty is not None else calculator.factor_uncertainty
+
+        # One (factors, samples) matrix per category, in factor_index column order
+        rng = np.random.default_rng(seed)
+        self.factor_samples = {}
+        for category in FOOTPRINT_CATEGORIES:
+            specs = self.uncertainty.get(category, {})
+            rows = []
+            for name in calculator.factor_names[category]:
+                spec = specs.get(name, specs.get('default'))
+                value = calculator.emission_factors[category][name]
+                rows.append(np.full(samples, float(value)) if spec is None else sample_factor(rng, value, spec, samples))
+            self.factor_samples[category] = np.array(rows)
+        self.stacked_offsets = {}
+        offset = 0
+        for category in FOOTPRINT_CATEGORIES:
+            self.stacked_offsets[category] = offset
+            offset += len(self.factor_samples[category])
+        self.stacked_samples = np.concatenate([self.factor_samples[category] for category in FOOTPRINT_CATEGORIES])
+
+    def calculate_footprints_batch(self, *inputs, factors=None, percentiles=DEFAULT_PERCENTILES,
+                                   max_memory=DEFAULT_MAX_MEMORY, progress=None):
+        """
+        Calculate uncertainty bands for many profiles
+
+        Parameters:
+        inputs: Five array-likes in calculate_footprint argument order
+        factors: Optional factor choices as for calculate_footprints_batch
+        percentiles: Percentiles to report, between 0 and 100
+        max_memory: Bytes allowed for the sample matrices of one block of rows,
+                    on top of the inputs and results
+        progress: Optional callable receiving (rows done, rows total) after each block
+
+        Returns:
+        Dictionary with 'mean' and one 'p<percentile>' entry (e.g. 'p5'), each
+        mapping every COMPARED_CATEGORIES entry to a float64 array of tons
+        CO2/year shaped like the inputs
+        """
+        import numpy as np
+
+        start = perf_counter()
+        if len(inputs) != len(FOOTPRINT_CATEGORIES):
+            raise TypeError(f"Expected {len(FOOTPRINT_CATEGORIES)} arrays, got {len(inputs)} arguments")
+        arrays = np.broadcast_arrays(*[np.asarray(values, dtype=np.float64) for values in inputs])
+        shape = arrays[0].shape
+        size = arrays[0].size
+        factors = factors or {}
+        for category in factors:
+            if category not in FOOTPRINT_CATEGORIES:
+                raise ValueError(f"Unknown emission factor category: {category!r}")
+
+        # Annual quantities and factor columns, flattened to one row per profile
+        quantities = [values.ravel() * multiplier for values, multiplier in zip(arrays, ANNUAL_MULTIPLIERS)]
+        codes = [np.broadcast_to(self.calculator.factor_codes(category, factors.get(category, DEFAULT_FACTORS[category])),
+                                 shape).ravel() for category in FOOTPRINT_CATEGORIES]
+
+        labels = ['mean'] + [f'p{percentile:g}' for percentile in percentiles]
+        result = {label: {} for label in labels}
+
+        # A category is quantity x factor, so its statistics scale the factor's;
+        # a negative quantity turns percentile p into percentile 100 - p
+        for index, category in enumerate(FOOTPRINT_CATEGORIES):
+            factor_samples = self.factor_samples[category]
+            quantity = quantities[index]
+            result['mean'][category] = quantity * factor_samples.mean(axis=1)[codes[index]]
+            bounds = np.percentile(factor_samples, percentiles, axis=1)
+            mirrored = np.percentile(factor_samples, [100 - percentile for percentile in percentiles], axis=1)
+            for position, label in enumerate(labels[1:]):
+                result[label][category] = np.where(quantity >= 0, quantity * bounds[position][codes[index]],
+                                                   quantity * mirrored[position][codes[index]])
+        result['mean']['total'] = (result['mean']['electricity'] + result['mean']['transportation'] +
+                                   result['mean']['food'] + result['mean']['waste'] + result['mean']['water'])
+
+        # Totals need every sample. Each block of rows is a (rows, factors)
+        # matrix holding every profile's quantity in its chosen factor's column,
+        # multiplied by the stacked (factors, samples) matrix in one BLAS call
+        for label in labels[1:]:
+            result[label]['total'] = np.empty(size)
+        block_rows = max(1, min(size, max_memory // (self.samples * 8 * 2)))
+        buffer = np.empty((block_rows, self.samples))
+        for first in range(0, size, block_rows):
+            last = min(first + block_rows, size)
+            weights = np.zeros((last - first, len(self.stacked_samples)))
+            rows = np.arange(last - first)
+            for index, category in enumerate(FOOTPRINT_CATEGORIES):
+                weights[rows, self.stacked_offsets[category] + codes[index][first:last]] = quantities[index][first:last]
+            totals = np.matmul(weights, self.stacked_samples, out=buffer[:last - first])
+            bands = np.percentile(totals, percentiles, axis=1)
+            for position, label in enumerate(labels[1:]):
+                result[label]['total'][first:last] = bands[position]
+            if progress is not None:
+                progress(last, size)
+
+        MODEL_SECONDS.observe(('uncertainty_batch',), perf_counter() - start)
+        return {label: {category: values.reshape(shape) for category, values in columns.items()}
+                for label, columns in result.items()}
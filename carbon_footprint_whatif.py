@@ -0,0 +1,116 @@
+"""
+Carbon Footprint What-If Engine
+
+Estimates how many tons of CO2 per year each entry in REDUCTION_SUGGESTIONS
+would save for a given profile. Every suggestion is modelled as a change to
+one category, either scaling its input or switching its emission factor (see
+SUGGESTION_EFFECTS), so only that category term and the total are recomputed.
+"""
+from carbon_footprint_model import ANNUAL_MULTIPLIERS, FOOTPRINT_CATEGORIES
+
+class WhatIfEngine:
+    def __init__(self, calculator):
+        """
+        Compile every suggestion into a category index and effect
+
+        Parameters:
+        calculator: CarbonFootprintCalculator providing the dataset
+        """
+        self.calculator = calculator
+        self.suggestions = []
+        self.actions = []
+        for index, category in enumerate(FOOTPRINT_CATEGORIES):
+            for suggestion in calculator.detailed_suggestions.get(category, []):
+                effect = calculator.suggestion_effects.get(suggestion['title'])
+                if effect is None:
+                    continue
+                if 'factor' in effect:
+                    if effect['factor'] not in calculator.emission_factors[category]:
+                        raise ValueError(f"Unknown {category} emission factor in suggestion "
+                                         f"{suggestion['title']!r}: {effect['factor']!r}")
+                    action = (index, None, calculator.emission_factors[category][effect['factor']])
+                else:
+                    action = (index, effect['scale'], None)
+                self.suggestions.append((category, suggestion))
+                self.actions.append(action)
+
+    def _factor_values(self, factors):
+        """Return the emission factor values for a profile in FOOTPRINT_CATEGORIES order."""
+        if not factors:
+            return self.calculator.table.default_factors
+        choices = self.calculator.resolve_factors(factors)
+        return [self.calculator.emission_factors[category][choices[category]] for category in FOOTPRINT_CATEGORIES]
+
+    def rank(self, electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters,
+             factors=None, limit=None):
+        """
+        Rank suggestions by estimated savings for one profile
+
+        Parameters are the same as CarbonFootprintCalculator.calculate_footprint.
+        limit: Optional maximum number of suggestions to return
+
+        Returns:
+        List of dictionaries with the suggestion fields plus 'category',
+        'savings' and 'new_total' (tons CO2/year), largest savings first.
+        Suggestions that would not reduce the footprint are left out.
+        """
+        inputs = (electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters)
+        factor_values = self._factor_values(factors)
+
+        # Category terms computed exactly as calculate_footprint computes them
+        terms = [inputs[index] * ANNUAL_MULTIPLIERS[index] * factor_values[index] for index in range(len(inputs))]
+        total = terms[0] + terms[1] + terms[2] + terms[3] + terms[4]
+
+        ranked = []
+        for (category, suggestion), (index, scale, factor) in zip(self.suggestions, self.actions):
+            if scale is not None:
+                term = inputs[index] * scale * ANNUAL_MULTIPLIERS[index] * factor_values[index]
+            else:
+                term = inputs[index] * ANNUAL_MULTIPLIERS[index] * factor
+            changed = list(terms)
+            changed[index] = term
+            new_total = changed[0] + changed[1] + changed[2] + changed[3] + changed[4]
+            if new_total < total:
+                ranked.append(dict(suggestion, category=category, savings=total - new_total, new_total=new_total))
+
+        ranked.sort(key=lambda item: item['savings'], reverse=True)
+        return ranked[:limit] if limit is not None else ranked
+
+    def rank_batch(self, electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters, factors=None):
+        """
+        Estimate savings of every suggestion for many profiles at once
+
+        Parameters are the same as CarbonFootprintCalculator.calculate_footprints_batch
+        with array inputs.
+
+        Returns:
+        Dictionary with 'suggestions' (list of (category, title) column labels),
+        'savings' (profiles x suggestions float64 array, zero where a suggestion
+        would not help) and 'ranking' (column indices, largest savings first).
+        """
+        import numpy as np
+
+        inputs = np.broadcast_arrays(*[np.asarray(values, dtype=np.float64) for values in
+                                       (electricity_kwh, transport_km, meat_consumption, waste_kg, water_liters)])
+        factor_values = self.calculator.gather_factors(factors)
+        factor_values = [factor_values[category] for category in FOOTPRINT_CATEGORIES]
+
+        terms = [inputs[index] * ANNUAL_MULTIPLIERS[index] * factor_values[index] for index in range(len(inputs))]
+        total = terms[0] + terms[1] + terms[2] + terms[3] + terms[4]
+
+        savings = np.empty(total.shape + (len(self.actions),))
+        for column, (index, scale, factor) in enumerate(self.actions):
+            if scale is not None:
+                term = inputs[index] * scale * ANNUAL_MULTIPLIERS[index] * factor_values[index]
+            else:
+                term = inputs[index] * ANNUAL_MULTIPLIERS[index] * factor
+            changed = list(terms)
+            changed[index] = term
+            savings[..., column] = total - (changed[0] + changed[1] + changed[2] + changed[3] + changed[4])
+
+        np.maximum(savings, 0.0, out=savings)
+        return {
+            'suggestions': [(category, suggestion['title']) for category, suggestion in self.suggestions],
+            'savings': savings,
+            'ranking': np.argsort(-savings, axis=-1, kind='stable')
+        }
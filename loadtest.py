@@ -0,0 +1,398 @@
+"""
+Carbon Footprint Calculator Load Test
+
+Starts app.py under gunicorn and replays a mix of /regions and /calculate
+traffic against it, then reports throughput, p50/p95/p99 latency and error
+rates per endpoint. Use it for capacity planning; the benchmark suite only
+measures single requests in-process.
+
+Arrivals are open-loop: requests are sent on a Poisson schedule at the
+given rate whether or not earlier ones have finished, and latency is
+measured from the scheduled send time, so a saturated server shows up as
+growing latency and errors instead of a lower request rate. /calculate
+requests draw their levels and region from a Zipf-like distribution, so a
+few popular combinations dominate as they do during a campaign.
+
+Requests reuse keep-alive connections. Each request has a timeout, and a
+request whose reused connection turns out to have been closed by the
+server is resent once on a new connection.
+
+Usage:
+python loadtest.py --rate 500 --duration 30
+python loadtest.py --rate 2000 --workers 4 --threads 8 --mix /calculate=95 /regions=5
+python loadtest.py --url http://staging:8000 --rate 200 --output capacity.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+from carbon_footprint_data import CONSUMPTION_VALUES, REGIONAL_AVERAGES
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Endpoints the traffic mix can include
+ENDPOINTS = ('/calculate', '/regions', '/')
+
+# Default share of requests sent to each endpoint. '/' renders
+# templates/index.html, which is not part of this repository, so it would
+# only add 500s; include it with --mix where the template is deployed.
+DEFAULT_MIX = {'/calculate': 90, '/regions': 10}
+
+# Default exponent of the popularity distribution; 0 makes every combination equally likely
+DEFAULT_SKEW = 1.1
+
+# Latency percentiles reported per endpoint
+PERCENTILES = (50, 95, 99)
+
+# Seconds to wait for a freshly started server to answer
+STARTUP_TIMEOUT = 30
+
+# Default seconds allowed for connecting, or for one request and response
+REQUEST_TIMEOUT = 10
+
+def parse_mix(values):
+    """Parse ENDPOINT=WEIGHT arguments into a dictionary of endpoint weights."""
+    mix = {}
+    for value in values:
+        endpoint, _, weight = value.partition('=')
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {endpoint!r}; choose from {', '.join(ENDPOINTS)}")
+        try:
+            mix[endpoint] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid weight in {value!r}; expected ENDPOINT=WEIGHT") from None
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("At least one endpoint needs a positive weight")
+    return mix
+
+class TrafficModel:
+    """Random request paths following an endpoint mix and skewed /calculate inputs."""
+
+    def __init__(self, mix=None, skew=DEFAULT_SKEW, seed=0):
+        """
+        Parameters:
+        mix: Dictionary mapping endpoints to relative weights (default: DEFAULT_MIX)
+        skew: Exponent s of the 1 / rank^s popularity of level and region combinations
+        seed: Random seed; equal seeds produce equal traffic
+        """
+        self.rng = random.Random(seed)
+        mix = mix or DEFAULT_MIX
+        self.endpoints = [endpoint for endpoint, weight in mix.items() if weight > 0]
+        self.endpoint_weights = list(itertools.accumulate(mix[endpoint] for endpoint in self.endpoints))
+
+        # Every dropdown combination with every region (or none), in a random popularity order
+        fields = list(CONSUMPTION_VALUES)
+        regions = [''] + list(REGIONAL_AVERAGES)
+        self.queries = []
+        for levels in itertools.product(*(CONSUMPTION_VALUES[field] for field in fields)):
+            for region in regions:
+                query = dict(zip(fields, levels))
+                if region:
+                    query['region'] = region
+                self.queries.append('/calculate?' + urlencode(query))
+        self.rng.shuffle(self.queries)
+        self.query_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, len(self.queries) + 1)))
+
+    def next_request(self):
+        """Return the (endpoint, path) of the next request."""
+        endpoint = self.rng.choices(self.endpoints, cum_weights=self.endpoint_weights)[0]
+        if endpoint == '/calculate':
+            return endpoint, self.rng.choices(self.queries, cum_weights=self.query_weights)[0]
+        return endpoint, endpoint
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one server, opened on demand up to a limit."""
+
+    def __init__(self, host, port, limit, timeout=REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle = []
+        self.slots = asyncio.Semaphore(limit)
+        self.reconnects = 0
+
+    async def request(self, path):
+        """Send a GET request and return the response status code."""
+        async with self.slots:
+            if self.idle:
+                try:
+                    return await self._exchange(self.idle.pop(), path)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # The server closed the idle connection; a GET is safe to send again
+                    self.reconnects += 1
+            connection = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            return await self._exchange(connection, path)
+
+    async def _exchange(self, connection, path):
+        """Send one request on a connection, keep it for reuse if possible and return the status code."""
+        reader, writer = connection
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n\r\n'.encode('ascii'))
+            status, keep_alive = await asyncio.wait_for(self._read_response(reader), self.timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self.idle.append(connection)
+        else:
+            writer.close()
+        return status
+
+    async def _read_response(self, reader):
+        """Read one response and return (status, keep_alive)."""
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        else:
+            await reader.read()
+            return status, False
+        return status, headers.get('connection', '').lower() != 'close'
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+class EndpointStats:
+    """Latencies and outcomes of the requests sent to one endpoint."""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.failures = {}
+
+    def summary(self, seconds):
+        """Return throughput, latency percentiles in milliseconds and error rates."""
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        errors = sum(count for status, count in self.statuses.items() if status >= 400) + sum(self.failures.values())
+        result = {
+            'requests': requests,
+            'throughput': requests / seconds if seconds else None,
+            'errors': errors,
+            'error_rate': errors / requests if requests else 0.0,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'failures': dict(self.failures)
+        }
+        for percentile in PERCENTILES:
+            # Nearest-rank percentile
+            rank = max(0, -(-percentile * requests // 100) - 1)
+            result[f'p{percentile}_ms'] = latencies[rank] * 1000 if latencies else None
+        return result
+
+async def run_load(url, rate, duration, traffic, connections=256, warmup=0.0, seed=0, timeout=REQUEST_TIMEOUT):
+    """
+    Send open-loop traffic to a server and collect per-endpoint statistics
+
+    Parameters:
+    url: Base URL of the server, e.g. http://127.0.0.1:8000
+    rate: Mean arrivals per second
+    duration: Seconds of measured traffic
+    traffic: TrafficModel producing the requests
+    connections: Most connections open at once; arrivals beyond them wait
+                 for a connection, and the wait counts towards their latency
+    warmup: Seconds of traffic sent first and left out of the results
+    seed: Random seed of the arrival times
+    timeout: Seconds allowed for connecting, or for one request and response;
+             slower requests count as TimeoutError failures
+
+    Returns:
+    Dictionary with 'seconds', 'offered_rate', 'max_in_flight', 'reconnects'
+    (requests resent after a reused connection was found closed) and
+    per-endpoint 'endpoints' summaries including 'all'
+    """
+    parts = urlsplit(url)
+    pool = ConnectionPool(parts.hostname, parts.port or 80, connections, timeout)
+    rng = random.Random(seed)
+    stats = {}
+    in_flight = 0
+    max_in_flight = 0
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    measure_from = start + warmup
+    end = measure_from + duration
+
+    async def send(scheduled, endpoint, path):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        status = failure = None
+        try:
+            status = await pool.request(path)
+        except asyncio.TimeoutError:
+            failure = 'TimeoutError'
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            failure = type(e).__name__
+        finally:
+            in_flight -= 1
+        if scheduled < measure_from:
+            return
+        latency = loop.time() - scheduled
+        for key in (endpoint, 'all'):
+            endpoint_stats = stats.setdefault(key, EndpointStats())
+            endpoint_stats.latencies.append(latency)
+            if failure is None:
+                endpoint_stats.statuses[status] = endpoint_stats.statuses.get(status, 0) + 1
+            else:
+                endpoint_stats.failures[failure] = endpoint_stats.failures.get(failure, 0) + 1
+
+    tasks = set()
+    scheduled = start
+    while True:
+        scheduled += rng.expovariate(rate)
+        if scheduled >= end:
+            break
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(send(scheduled, *traffic.next_request()))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    pool.close()
+
+    seconds = loop.time() - measure_from
+    return {
+        'seconds': seconds,
+        'offered_rate': rate,
+        'max_in_flight': max_in_flight,
+        'reconnects': pool.reconnects,
+        'endpoints': {endpoint: endpoint_stats.summary(seconds) for endpoint, endpoint_stats in sorted(stats.items())}
+    }
+
+def free_port():
+    """Return a TCP port that is free on the loopback interface."""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def start_server(port, workers, threads, env=None):
+    """
+    Start app.py under gunicorn on the loopback interface and wait until it answers
+
+    Returns:
+    The gunicorn Popen object
+    """
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+               '--worker-class', 'gthread', '--threads', str(threads), '--log-level', 'warning', 'app:app']
+    server = subprocess.Popen(command, cwd=PROJECT_DIR, env=dict(os.environ, **(env or {})))
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as connection:
+                connection.sendall(b'GET /regions HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+                if connection.recv(12).startswith(b'HTTP/1.1 200'):
+                    return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError(f"gunicorn did not answer within {STARTUP_TIMEOUT} seconds")
+
+def stop_server(server):
+    """Shut gunicorn down gracefully, killing it if it does not exit."""
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+def print_report(report):
+    """Print a per-endpoint table of a run_load result."""
+    print(f"Offered {report['offered_rate']:,.0f} req/s for {report['seconds']:.1f}s, "
+          f"at most {report['max_in_flight']:,} requests in flight, "
+          f"{report['reconnects']:,} resent on a new connection")
+    print(f"{'endpoint':12} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for endpoint, summary in report['endpoints'].items():
+        latencies = ' '.join(f"{summary[f'p{percentile}_ms']:9.2f}" for percentile in PERCENTILES)
+        print(f"{endpoint:12} {summary['requests']:9,} {summary['throughput']:9,.1f} {latencies} "
+              f"{summary['error_rate']:8.2%}")
+        problems = {f'HTTP {status}': count for status, count in summary['statuses'].items() if int(status) >= 400}
+        problems.update(summary['failures'])
+        if problems:
+            print(f"{'':12} " + ', '.join(f"{name}: {count:,}" for name, count in problems.items()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the carbon footprint web application.")
+    parser.add_argument('--rate', type=float, default=200, help="Mean requests per second (default: 200)")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of measured traffic (default: 30)")
+    parser.add_argument('--warmup', type=float, default=2, help="Seconds of unmeasured traffic first (default: 2)")
+    parser.add_argument('--mix', nargs='+', metavar='ENDPOINT=WEIGHT',
+                        help="Relative request weights, e.g. /calculate=90 /regions=10 (default); "
+                             "/ needs templates/index.html on the server")
+    parser.add_argument('--skew', type=float, default=DEFAULT_SKEW,
+                        help=f"Popularity skew of /calculate inputs, 0 for uniform (default: {DEFAULT_SKEW})")
+    parser.add_argument('--connections', type=int, default=256,
+                        help="Most client connections open at once (default: 256)")
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                        help=f"Seconds allowed per request (default: {REQUEST_TIMEOUT})")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument('--url', help="Test an already running server instead of starting gunicorn")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="gunicorn worker processes (default: all cores)")
+    parser.add_argument('--threads', type=int, default=4, help="Threads per gunicorn worker (default: 4)")
+    parser.add_argument('--output', help="Also write the report as JSON to this file")
+    options = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(options.mix) if options.mix else None
+    except ValueError as e:
+        parser.error(str(e))
+    if options.rate <= 0 or options.duration <= 0 or options.timeout <= 0:
+        parser.error("--rate, --duration and --timeout must be positive")
+    traffic = TrafficModel(mix, options.skew, options.seed)
+
+    server = None
+    url = options.url
+    if url is None:
+        port = free_port()
+        print(f"Starting gunicorn with {options.workers} worker(s) x {options.threads} thread(s) on port {port}...",
+              file=sys.stderr)
+        server = start_server(port, options.workers, options.threads)
+        url = f'http://127.0.0.1:{port}'
+    try:
+        report = asyncio.run(run_load(url, options.rate, options.duration, traffic, options.connections,
+                                      options.warmup, options.seed, options.timeout))
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    report.update(url=url, mix=mix or DEFAULT_MIX, skew=options.skew,
+                  server=None if options.url else {'workers': options.workers, 'threads': options.threads})
+    print_report(report)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(json.dumps(report, indent=2) + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
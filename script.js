@@ -1,3 +1,85 @@
+// Calculate a /calculate response from a factor bundle (see /bundle in app.py).
+// Uses the same double-precision operations in the same order as the server,
+// so the numbers are identical. Returns null when the form holds a value the
+// bundle does not know, so the caller can ask the server instead.
+function calculateWithBundle(bundle, values) {
+    const known = (object, key) => Object.prototype.hasOwnProperty.call(object, key);
+    const selectedLevels = {};
+    const selectedFactors = {};
+    const footprints = {};
+    
+    for (const field in bundle.fields) {
+        const category = bundle.fields[field];
+        const level = values[field] || 'moderate';
+        const factor = values[`${field}_factor`] || bundle.default_factors[category];
+        if (!known(bundle.consumption_values[field], level) || !known(bundle.factors[category], factor)) {
+            return null;
+        }
+        selectedLevels[field] = level;
+        selectedFactors[field] = factor;
+        
+        // Annual footprint: input * multiplier * emission factor, as in calculate_footprint
+        footprints[category] = bundle.consumption_values[field][level] * bundle.multipliers[category] *
+            bundle.factors[category][factor];
+    }
+    const region = values.region || '';
+    if (region && !known(bundle.regions, region)) {
+        return null;
+    }
+    
+    // Calculate total footprint, adding the categories in the server's order
+    // (bundle keys are sorted, so the order comes from the categories list)
+    footprints.total = bundle.categories
+        .filter(category => category !== 'total')
+        .map(category => footprints[category])
+        .reduce((sum, value) => sum + value);
+    
+    // Compare with the global average thresholds
+    const comparisons = {};
+    bundle.categories.forEach((category, index) => {
+        if (footprints[category] > bundle.thresholds.high[index]) {
+            comparisons[category] = 'high';
+        } else if (footprints[category] < bundle.thresholds.low[index]) {
+            comparisons[category] = 'low';
+        } else {
+            comparisons[category] = 'moderate';
+        }
+    });
+    
+    // Recommendations for high categories, in the server's (sorted) order
+    const recommendations = {};
+    Object.keys(bundle.recommendations).sort().forEach(category => {
+        if (comparisons[category] === 'high') {
+            recommendations[category] = bundle.recommendations[category];
+        }
+    });
+    
+    let regionalComparison = '';
+    if (region) {
+        const regional = bundle.regions[region];
+        if (footprints.total > regional.high) {
+            regionalComparison = regional.messages.higher;
+        } else if (footprints.total < regional.low) {
+            regionalComparison = regional.messages.lower;
+        } else {
+            regionalComparison = regional.messages.close;
+        }
+    }
+    
+    return {
+        success: true,
+        footprints: footprints,
+        comparisons: comparisons,
+        level: comparisons.total,
+        recommendations: recommendations,
+        regional_comparison: regionalComparison,
+        global_averages: bundle.global_averages,
+        selected_levels: selectedLevels,
+        selected_factors: selectedFactors,
+        dataset_version: bundle.dataset_version
+    };
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     // Get form and result elements
     const calculatorForm = document.getElementById('calculator-form');
@@ -65,8 +147,19 @@ document.addEventListener('DOMContentLoaded', function() {
     
     window.addEventListener('scroll', animateOnScroll);
     
-    // Load regions from API
+    // Factor bundle for calculating results in the browser, kept for offline use
+    let factorBundle = null;
+    let bundleCheckedAt = 0;
+    let bundleRequest = null;
+    try {
+        factorBundle = JSON.parse(localStorage.getItem('factorBundle'));
+    } catch (error) {
+        localStorage.removeItem('factorBundle');
+    }
+    
+    // Load regions and the factor bundle from API
     loadRegions();
+    refreshBundle();
     
     // Add event listener for form submission
     calculatorForm.addEventListener('submit', function(e) {
@@ -91,6 +184,31 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
+    // Function to fetch the current factor bundle; the browser revalidates it with its ETag
+    function refreshBundle() {
+        if (!bundleRequest) {
+            bundleRequest = fetch('/bundle')
+                .then(response => response.json())
+                .then(bundle => {
+                    factorBundle = bundle;
+                    bundleCheckedAt = Date.now();
+                    localStorage.setItem('factorBundle', JSON.stringify(bundle));
+                })
+                .catch(error => {
+                    console.error('Error loading factor bundle:', error);
+                })
+                .finally(() => {
+                    bundleRequest = null;
+                });
+        }
+        return bundleRequest;
+    }
+    
+    // Function to check whether the factor bundle was confirmed current recently
+    function bundleIsFresh() {
+        return factorBundle !== null && Date.now() - bundleCheckedAt < factorBundle.refresh_seconds * 1000;
+    }
+    
     // Function to calculate carbon footprint
     function calculateFootprint() {
         // Show loading, hide results and error
@@ -101,6 +219,17 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Get form data
         const formData = new FormData(calculatorForm);
+        const values = Object.fromEntries(formData);
+        
+        // Calculate in the browser when the bundle is current
+        const local = bundleIsFresh() ? calculateWithBundle(factorBundle, values) : null;
+        if (local) {
+            showResponse(local);
+            return;
+        }
+        if (!bundleIsFresh()) {
+            refreshBundle();
+        }
         
         // Send request to server
         fetch('/calculate', {
@@ -109,34 +238,21 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(response => response.json())
         .then(data => {
-            // Hide loading
-            loadingDiv.classList.add('d-none');
-            
-            if (data.success) {
-                // Display results
-                displayResults(data);
-                resultsDiv.classList.remove('d-none');
-                
-                // Add animation classes to results
-                const resultCards = document.querySelectorAll('#results .card');
-                resultCards.forEach((card, index) => {
-                    setTimeout(() => {
-                        card.classList.add('fade-in');
-                    }, index * 200); // Stagger animations
-                });
-                
-                // Smooth scroll to results
-                document.querySelector('#results').scrollIntoView({
-                    behavior: 'smooth'
-                });
-            } else {
-                // Show error
-                errorDiv.textContent = data.error || 'An error occurred. Please try again.';
-                errorDiv.classList.remove('d-none');
-                errorDiv.classList.add('fade-in');
+            // A different dataset version means the bundle is stale
+            if (data.dataset_version && factorBundle && data.dataset_version !== factorBundle.dataset_version) {
+                bundleCheckedAt = 0;
+                refreshBundle();
             }
+            showResponse(data);
         })
         .catch(error => {
+            // Offline: use the stored bundle even if it may be out of date
+            const offline = factorBundle ? calculateWithBundle(factorBundle, values) : null;
+            if (offline) {
+                showResponse(offline);
+                return;
+            }
+            
             // Hide loading, show error
             loadingDiv.classList.add('d-none');
             errorDiv.textContent = 'Network error. Please check your connection and try again.';
@@ -146,6 +262,36 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Function to show a /calculate response
+    function showResponse(data) {
+        // Hide loading
+        loadingDiv.classList.add('d-none');
+        
+        if (data.success) {
+            // Display results
+            displayResults(data);
+            resultsDiv.classList.remove('d-none');
+            
+            // Add animation classes to results
+            const resultCards = document.querySelectorAll('#results .card');
+            resultCards.forEach((card, index) => {
+                setTimeout(() => {
+                    card.classList.add('fade-in');
+                }, index * 200); // Stagger animations
+            });
+            
+            // Smooth scroll to results
+            document.querySelector('#results').scrollIntoView({
+                behavior: 'smooth'
+            });
+        } else {
+            // Show error
+            errorDiv.textContent = data.error || 'An error occurred. Please try again.';
+            errorDiv.classList.remove('d-none');
+            errorDiv.classList.add('fade-in');
+        }
+    }
+    
     // Function to display results
     function displayResults(data) {
         // Total footprint
@@ -331,4 +477,9 @@ document.addEventListener('DOMContentLoaded', function() {
     function capitalizeFirstLetter(string) {
         return string.charAt(0).toUpperCase() + string.slice(1);
     }
-}); 
\ No newline at end of file
+}); 
+
+// Allow the calculation to be loaded by the parity check in tests/test_bundle.py
+if (typeof module !== 'undefined') {
+    module.exports = { calculateWithBundle };
+}
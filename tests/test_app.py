@@ -0,0 +1,279 @@
+import json
+import threading
+import time
+
+import pytest
+
+import app
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+def post_batch(client, records, path='/calculate/batch'):
+    body = '\n'.join(json.dumps(record) for record in records)
+    response = client.post(path, data=body, buffered=True)
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+@pytest.mark.parametrize('record', [
+    {'electricity': ['high']},
+    {'meat': {'level': 'low'}},
+    {'region': ['Europe']},
+    {'transport_factor': ['bus']},
+    {'water': 3}
+])
+def test_batch_reports_non_string_values_per_record(client, record):
+    lines = post_batch(client, [{'electricity': 'high'}, record, {'meat': 'low'}])
+    assert [line['index'] for line in lines] == [0, 1, 2]
+    assert [line['success'] for line in lines] == [True, False, True]
+    assert lines[1]['error'].startswith('Invalid')
+
+def test_org_member_with_list_level_is_rejected(client):
+    response = client.put('/org/members/test-person', json={'electricity': ['high']})
+    assert response.status_code == 200
+    assert response.get_json()['success'] is False
+
+def test_iter_batch_records_reads_records_across_reads():
+    import io
+    records = [{'electricity': 'high', 'note': 'x' * (index * 997 % 5000)} for index in range(300)]
+    array = json.dumps(records).encode('utf-8')
+    lines = '\n'.join(json.dumps(record) for record in records).encode('utf-8')
+    assert list(app.iter_batch_records(io.BytesIO(array))) == records
+    assert list(app.iter_batch_records(io.BytesIO(lines))) == records
+
+def test_iter_batch_records_stops_on_malformed_array():
+    import io
+    import time
+    body = b'[{"electricity": "high"}, {"electricity": ' + b'"x", ' * 2000000 + b'}]'
+    records = app.iter_batch_records(io.BytesIO(body))
+    assert next(records) == {'electricity': 'high'}
+    start = time.perf_counter()
+    with pytest.raises(ValueError):
+        next(records)
+    assert time.perf_counter() - start < 5
+
+def test_batch_reports_malformed_body_after_good_records(client):
+    response = client.post('/calculate/batch', data='[{"meat": "low"}, {"meat": ', buffered=True)
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]['success'] is True
+    assert lines[1] == {'index': 1, 'success': False, 'error': lines[1]['error']}
+
+def test_batch_reports_malformed_ndjson_line_and_continues(client):
+    body = '{"meat": "low"}\n{"meat": \n{"water": "high"}\n[1, 2\n{"waste": "low"}'
+    lines = [json.loads(line) for line in client.post('/calculate/batch', data=body, buffered=True)
+             .get_data(as_text=True).splitlines()]
+    assert [line['index'] for line in lines] == [0, 1, 2, 3, 4]
+    assert [line['success'] for line in lines] == [True, False, True, False, True]
+    assert lines[1]['error'].startswith('Invalid JSON')
+    assert lines[4]['selected_levels']['waste'] == 'low'
+
+@pytest.mark.parametrize('body', [b'[{"meat": "low"},]', b'[{"meat": "low"}, ]', b'[,]', b'[{"meat": "low"} {"meat": "low"}]'])
+def test_iter_batch_records_rejects_invalid_arrays(body):
+    import io
+    with pytest.raises(ValueError):
+        list(app.iter_batch_records(io.BytesIO(body)))
+    assert list(app.iter_batch_records(io.BytesIO(b'[ ]'))) == []
+
+def factor_choices():
+    """Yield the default factors, then every other factor of one field at a time."""
+    yield {}
+    calculator = app.dataset_state.calculator
+    for field, category in app.FIELD_CATEGORIES.items():
+        for name in calculator.factor_index[category]:
+            if name != app.DEFAULT_FACTORS[category]:
+                yield {field: name}
+
+def test_encoded_calculate_responses_equal_jsonify():
+    import itertools
+    state = app.dataset_state
+    mismatches = []
+    with app.app.app_context():
+        for combination in itertools.product(*(state.consumption_values[field] for field in app.INPUT_FIELDS)):
+            levels = dict(zip(app.INPUT_FIELDS, combination))
+            for region in state.region_index:
+                for factors in factor_choices():
+                    expected = app.jsonify(app.build_calculate_response(state, levels, region, factors)).get_data()
+                    body, _ = app.encode_calculate_response(state, levels, region, factors)
+                    if body != expected:
+                        mismatches.append((levels, region, factors))
+                    if not factors and state.table[app.response_code(state, levels, region)][0] != expected:
+                        mismatches.append(('table', levels, region))
+    assert mismatches == []
+
+def test_dataset_swap_picks_up_consumption_values(tmp_path, monkeypatch, client):
+    import carbon_footprint_data
+    dataset = carbon_footprint_data.current_dataset()
+    dataset['CONSUMPTION_VALUES'] = dict(dataset['CONSUMPTION_VALUES'],
+                                         electricity={'high': 450, 'moderate': 600, 'low': 150})
+    path = str(tmp_path / 'dataset.snapshot')
+    carbon_footprint_data.save_snapshot(path, dataset=dataset)
+    before = app.dataset_state
+    monkeypatch.setitem(app.app.config, 'DATASET_FILE', path)
+    try:
+        state = app.swap_dataset()
+        assert state.version != before.version
+        assert state.hash != before.hash
+        data = client.post('/calculate', data={'electricity': 'moderate'}).get_json()
+        assert data['footprints']['electricity'] == 600 * 12 * dataset['EMISSION_FACTORS']['electricity']['mixed_grid']
+        assert data['dataset_version'] == state.version
+        assert client.get('/bundle').get_json()['consumption_values']['electricity']['moderate'] == 600
+    finally:
+        monkeypatch.undo()
+        app.swap_dataset(reload_data=False)
+
+def test_cache_is_keyed_on_content_not_version_label(tmp_path, monkeypatch, client):
+    import carbon_footprint_data
+    dataset = carbon_footprint_data.current_dataset()
+    path = str(tmp_path / 'dataset.snapshot')
+    monkeypatch.setitem(app.app.config, 'DATASET_FILE', path)
+    try:
+        carbon_footprint_data.save_snapshot(path, 'same-label', dataset)
+        app.swap_dataset()
+        first = client.post('/calculate', data={'electricity': 'moderate'}).get_json()
+
+        # An entry written by a request still running during the swap must not be served afterwards
+        monkeypatch.setattr(app.response_cache, 'clear', lambda: None)
+        dataset['CONSUMPTION_VALUES'] = dict(dataset['CONSUMPTION_VALUES'],
+                                             electricity={'high': 450, 'moderate': 600, 'low': 150})
+        carbon_footprint_data.save_snapshot(path, 'same-label', dataset)
+        state = app.swap_dataset()
+        second = client.post('/calculate', data={'electricity': 'moderate'}).get_json()
+        assert first['dataset_version'] == second['dataset_version'] == 'same-label'
+        assert second['footprints']['electricity'] == 2 * first['footprints']['electricity']
+        assert client.get('/dataset').get_json()['hash'] == state.hash == carbon_footprint_data.dataset_version(dataset)
+    finally:
+        monkeypatch.undo()
+        app.swap_dataset(reload_data=False)
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "Timed out waiting for the other threads"
+        time.sleep(0.001)
+
+def test_single_flight_shares_one_call_among_concurrent_callers():
+    flights = app.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(threading.current_thread().name)
+        release.wait(5)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('key', compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Followers only count as coalesced once the leader's flight exists
+    wait_until(lambda: flights.stats()['coalesced'] == 7)
+    assert flights.stats()['in_flight'] == 1
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len({id(result) for result, _ in results}) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flights.stats() == {'in_flight': 0, 'coalesced': 7}
+
+    # A failure reaches every waiting caller, and the next call runs again
+    def fail():
+        release.wait(5)
+        raise ValueError('boom')
+    release.clear()
+    errors = []
+    def call():
+        try:
+            flights.do('key', fail)
+        except ValueError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: flights.stats()['coalesced'] == 9)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 3 and len({id(error) for error in errors}) == 1
+    assert flights.do('key', lambda: 1) == (1, False)
+
+def test_admission_sheds_on_full_queue_and_timeout():
+    admission = app.AdmissionController(1, 1, 0.2)
+    assert admission.acquire() is None
+    outcomes = []
+    waiter = threading.Thread(target=lambda: outcomes.append(admission.acquire()))
+    waiter.start()
+    wait_until(lambda: admission.stats()['queue_depth'] == 1)
+    assert admission.acquire() == 'queue_full'
+    waiter.join(5)
+    assert outcomes == ['timeout']
+
+    # A waiting request gets the slot as soon as it is released
+    waiter = threading.Thread(target=lambda: outcomes.append(admission.acquire()))
+    waiter.start()
+    wait_until(lambda: admission.stats()['queue_depth'] == 1)
+    admission.release()
+    waiter.join(5)
+    assert outcomes == ['timeout', None]
+    admission.release()
+    stats = admission.stats()
+    assert stats['running'] == 0 and stats['admitted'] == 2
+    assert stats['shed'] == {'queue_full': 1, 'timeout': 1}
+
+def test_shed_requests_get_503_with_retry_after(monkeypatch, client):
+    admission = app.AdmissionController(1, 0, 0.01)
+    monkeypatch.setattr(app, 'admission', admission)
+    assert admission.acquire() is None
+    response = client.post('/calculate', data={'electricity': 'high'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(app.app.config['ADMISSION_RETRY_AFTER'])
+    assert response.get_json()['success'] is False
+    admission.release()
+    assert client.post('/calculate', data={'electricity': 'high'}).status_code == 200
+    assert admission.stats()['running'] == 0
+
+def test_streamed_batch_holds_its_slot_until_closed(monkeypatch, client):
+    admission = app.AdmissionController(1, 0, 0.01)
+    monkeypatch.setattr(app, 'admission', admission)
+    response = client.post('/calculate/batch', data=json.dumps({'electricity': 'low'}))
+    assert response.status_code == 200
+    assert admission.stats()['running'] == 1
+    assert client.post('/calculate', data={'electricity': 'high'}).status_code == 503
+    assert json.loads(response.get_data(as_text=True))['success'] is True
+    response.close()
+    assert admission.stats()['running'] == 0
+    assert client.post('/calculate', data={'electricity': 'high'}).status_code == 200
+
+def test_calculate_answers_if_none_match_with_304(client):
+    first = client.get('/calculate?electricity=high&region=Europe')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag
+    again = client.get('/calculate?electricity=high&region=Europe', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+    # A different result has a different tag, so the old one does not match
+    other = client.get('/calculate?electricity=low&region=Europe', headers={'If-None-Match': etag})
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+    for path in ('/bundle', '/regions'):
+        tag = client.get(path).headers['ETag']
+        assert client.get(path, headers={'If-None-Match': tag}).status_code == 304
+
+def test_response_cache_evicts_least_recently_used():
+    cache = app.ResponseCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2, 'maxsize': 2}
+
+def test_calculate_counts_cache_hits_misses_and_evictions(monkeypatch, client):
+    monkeypatch.setattr(app, 'response_cache', app.ResponseCache(2))
+    for electricity in ('low', 'low', 'moderate', 'high', 'low'):
+        assert client.post('/calculate', data={'electricity': electricity}).status_code == 200
+    # 'low' was evicted by 'high', the third distinct request at capacity 2
+    assert client.get('/cache/stats').get_json() == {'hits': 1, 'misses': 4, 'evictions': 2, 'size': 2,
+                                                     'maxsize': 2}
@@ -0,0 +1,70 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+import app
+from carbon_footprint_binary import (LEVEL_UNKNOWN, MIMETYPE, STATUS_INVALID, STATUS_MALFORMED, STATUS_OK,
+                                     encode_failures, encode_header, encode_records, read_results)
+from carbon_footprint_model import COMPARED_CATEGORIES, LEVEL_NAMES, CarbonFootprintCalculator
+
+def test_encode_records_round_trips_through_read_results(tmp_path):
+    calculator = CarbonFootprintCalculator()
+    rng = np.random.default_rng(0)
+    inputs = [rng.uniform(0, 800, 50), rng.uniform(0, 600, 50), rng.uniform(0, 5, 50),
+              rng.uniform(0, 20, 50), rng.uniform(0, 400, 50)]
+    result = calculator.calculate_footprints_batch(*inputs)
+    data = (encode_header(calculator.dataset_version) + encode_records(result['footprints'], result['comparisons']) +
+            encode_failures(2) + encode_failures(1, STATUS_MALFORMED))
+
+    path = tmp_path / 'results.cfpb'
+    path.write_bytes(data)
+    for source in (data, io.BytesIO(data), str(path)):
+        decoded = read_results(source)
+        assert decoded['dataset_version'] == calculator.dataset_version
+        assert decoded['status'].tolist() == [STATUS_OK] * 50 + [STATUS_INVALID] * 2 + [STATUS_MALFORMED]
+        for category in COMPARED_CATEGORIES:
+            assert np.array_equal(decoded['footprints'][category][:50],
+                                  result['footprints'][category].astype(np.float32))
+            assert decoded['comparisons'][category][:50].tolist() == result['comparisons'][category].tolist()
+            assert np.isnan(decoded['footprints'][category][50:]).all()
+            assert (decoded['comparisons'][category][50:] == LEVEL_UNKNOWN).all()
+
+def test_read_results_rejects_foreign_and_truncated_streams():
+    data = encode_header('v1') + encode_failures(1)
+    with pytest.raises(ValueError):
+        read_results(b'JSON' + data[4:])
+    with pytest.raises(ValueError):
+        read_results(data[:-1])
+
+def test_batch_negotiates_binary_results_through_accept():
+    client = app.app.test_client()
+    records = [{'electricity': 'high', 'region': 'Europe'}, {'electricity': 'lots'}, {'meat': 'low', 'water': 'high'}]
+    body = '\n'.join(json.dumps(record) for record in records)
+
+    ndjson = client.post('/calculate/batch', data=body, buffered=True)
+    assert ndjson.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in ndjson.get_data(as_text=True).splitlines()]
+
+    response = client.post('/calculate/batch', data=body, headers={'Accept': MIMETYPE}, buffered=True)
+    assert response.mimetype == MIMETYPE
+    assert 'Accept' in response.headers['Vary']
+    decoded = read_results(response.data)
+    assert decoded['dataset_version'] == app.dataset_state.version
+    assert decoded['status'].tolist() == [STATUS_OK, STATUS_INVALID, STATUS_OK]
+    for row, line in enumerate(lines):
+        assert line['success'] is (row != 1)
+        if not line['success']:
+            continue
+        for category in COMPARED_CATEGORIES:
+            assert decoded['footprints'][category][row] == np.float32(line['footprints'][category])
+            assert LEVEL_NAMES[decoded['comparisons'][category][row]] == line['comparisons'][category]
+
+    # JSON stays the default when both are acceptable, and a malformed body ends the stream
+    both = client.post('/calculate/batch', data=body, buffered=True,
+                       headers={'Accept': f'application/x-ndjson, {MIMETYPE};q=0.5'})
+    assert both.mimetype == 'application/x-ndjson'
+    broken = client.post('/calculate/batch', data='[{"electricity": "low"}, {', headers={'Accept': MIMETYPE},
+                         buffered=True)
+    assert read_results(broken.data)['status'].tolist() == [STATUS_OK, STATUS_MALFORMED]
@@ -0,0 +1,42 @@
+import sys
+
+import pytest
+
+import carbon_footprint_app
+
+COLUMNS = 'electricity_kwh,transport_km,meat_consumption,waste_kg,water_liters\n'
+
+def test_bulk_scores_csv(tmp_path):
+    source = tmp_path / 'profiles.csv'
+    source.write_text(COLUMNS + '300,200,1.5,5,150\n450,350,2.5,12,200\n')
+    output = tmp_path / 'results.csv'
+    assert carbon_footprint_app.main(['bulk', str(source), str(output), '--progress-interval', '1000']) == 0
+    lines = output.read_text().splitlines()
+    assert len(lines) == 3 and 'total' in lines[0].split(',')
+
+def test_parquet_without_pyarrow_is_a_clear_error(tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    source = tmp_path / 'profiles.csv'
+    source.write_text(COLUMNS + '300,200,1.5,5,150\n')
+    output = tmp_path / 'results.parquet'
+    assert carbon_footprint_app.main(['bulk', str(source), str(output)]) == 1
+    assert 'pip install pyarrow' in capsys.readouterr().err
+    assert not output.exists()
+
+def test_bulk_uses_default_factors_for_empty_factor_cells(tmp_path):
+    import pandas as pd
+    from carbon_footprint_model import CarbonFootprintCalculator
+
+    source = tmp_path / 'profiles.csv'
+    source.write_text(COLUMNS.rstrip('\n') + ',transportation_factor,food_factor\n'
+                      '300,200,1.5,5,150,bus,\n450,350,2.5,12,200,,\n100,50,0.3,2,70,train,\n')
+    output = tmp_path / 'results.csv'
+    # One row per chunk, so a chunk can hold only empty factor cells
+    assert carbon_footprint_app.main(['bulk', str(source), str(output), '--chunk-size', '1',
+                                      '--progress-interval', '1000']) == 0
+    totals = pd.read_csv(output)['total'].tolist()
+    calculator = CarbonFootprintCalculator()
+    expected = [calculator.calculate_footprint(300, 200, 1.5, 5, 150, {'transportation': 'bus'}),
+                calculator.calculate_footprint(450, 350, 2.5, 12, 200),
+                calculator.calculate_footprint(100, 50, 0.3, 2, 70, {'transportation': 'train'})]
+    assert totals == pytest.approx([result['footprints']['total'] for result in expected])
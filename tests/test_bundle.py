@@ -0,0 +1,59 @@
+import itertools
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import app
+from carbon_footprint_data import CONSUMPTION_VALUES
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_PATH = os.path.join(PROJECT_DIR, 'script.js')
+
+# Loads script.js outside a browser and runs calculateWithBundle on every form in the input
+PARITY_SCRIPT = """
+global.document = {addEventListener() {}};
+const {calculateWithBundle} = require(process.argv[1]);
+const input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+process.stdout.write(JSON.stringify(input.forms.map(form => calculateWithBundle(input.bundle, form))));
+"""
+
+def parity_forms(bundle):
+    """Return every level and region combination, and every factor of every field at each level."""
+    fields = list(bundle['fields'])
+    regions = [''] + list(bundle['regions'])
+    forms = []
+    for levels in itertools.product(*(CONSUMPTION_VALUES[field] for field in fields)):
+        for region in regions:
+            forms.append(dict(zip(fields, levels), region=region))
+    for field, category in bundle['fields'].items():
+        for name in bundle['factors'][category]:
+            for level in CONSUMPTION_VALUES[field]:
+                forms.append({field: level, f'{field}_factor': name, 'region': regions[-1]})
+    return forms
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="needs Node.js")
+def test_script_calculates_exactly_what_calculate_returns():
+    client = app.app.test_client()
+    bundle = client.get('/bundle').get_json()
+    forms = parity_forms(bundle)
+    output = subprocess.run(['node', '-e', PARITY_SCRIPT, SCRIPT_PATH],
+                            input=json.dumps({'bundle': bundle, 'forms': forms}),
+                            capture_output=True, text=True, check=True, cwd=PROJECT_DIR).stdout
+    local = json.loads(output)
+    assert len(local) == len(forms)
+    mismatches = [form for form, result in zip(forms, local) if result != client.post('/calculate', data=form).get_json()]
+    assert mismatches == []
+
+def test_versioned_bundle_is_immutable_and_current_bundle_revalidates():
+    client = app.app.test_client()
+    current = client.get('/bundle')
+    assert current.headers['Cache-Control'] == 'no-cache'
+    version = current.get_json()['version']
+    assert client.get('/bundle', headers={'If-None-Match': current.headers['ETag']}).status_code == 304
+    versioned = client.get(f'/bundle/{version}')
+    assert versioned.get_data() == current.get_data()
+    assert 'immutable' in versioned.headers['Cache-Control']
+    assert client.get('/bundle/0000').status_code == 404
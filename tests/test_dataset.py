@@ -0,0 +1,31 @@
+import os
+
+import carbon_footprint_data
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'dataset.snapshot')
+    version = carbon_footprint_data.save_snapshot(path)
+    dataset = carbon_footprint_data.load_snapshot(path)
+    assert version == carbon_footprint_data.DATASET_VERSION
+    assert dataset == carbon_footprint_data.current_dataset()
+    assert carbon_footprint_data.dataset_version(dataset) == version
+
+def test_snapshot_keeps_an_explicit_version(tmp_path):
+    path = str(tmp_path / 'dataset.snapshot')
+    assert carbon_footprint_data.save_snapshot(path, '2026-10') == '2026-10'
+    assert carbon_footprint_data.load_snapshot(path)['DATASET_VERSION'] == '2026-10'
+
+def test_configured_snapshot_is_loaded_without_hashing_the_literals(tmp_path):
+    import subprocess
+    import sys
+    path = str(tmp_path / 'dataset.snapshot')
+    dataset = carbon_footprint_data.current_dataset()
+    dataset['GLOBAL_AVERAGES'] = dict(dataset['GLOBAL_AVERAGES'], total=1.0)
+    carbon_footprint_data.save_snapshot(path, '2026-11', dataset)
+    # dataset_version serializes the tables with json.dumps, so this fails if it runs at import
+    script = ("import json; json.dumps = None; import carbon_footprint_data as data; "
+              "print(data.DATASET_VERSION, data.GLOBAL_AVERAGES['total'])")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True,
+                            env=dict(os.environ, CARBON_DATASET_SNAPSHOT=path)).stdout
+    assert output.split() == ['2026-11', '1.0']
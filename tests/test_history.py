@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import carbon_footprint_history
+from carbon_footprint_history import HistoryStore, parse_timestamp
+from carbon_footprint_model import COMPARED_CATEGORIES
+
+def footprints(total):
+    return {category: total for category in COMPARED_CATEGORIES}
+
+def test_append_after_compaction_by_another_store(tmp_path):
+    writer = HistoryStore(str(tmp_path), initial_capacity=16)
+    for index in range(5):
+        writer.append('alice', footprints(index), 1700000000 + index)
+    assert HistoryStore(str(tmp_path), initial_capacity=16).compact() == 5
+
+    # Same capacity after compaction, so only the generation tells the writer to remap
+    writer.append('alice', footprints(5), 1700000005)
+    records = HistoryStore(str(tmp_path), initial_capacity=16).select(user_id='alice')
+    assert records['time'].tolist() == [1700000000 + index for index in range(6)]
+    assert records['total'].tolist() == [float(index) for index in range(6)]
+
+def test_interrupted_compaction_leaves_the_old_generation(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path), initial_capacity=4)
+    for stamp in (30, 10, 20):
+        store.append('dave', footprints(stamp), stamp)
+
+    # Fail while writing the third column, after two new column files exist
+    write_synced = HistoryStore._write_synced
+    calls = []
+    def crash(self, path, values):
+        calls.append(path)
+        if len(calls) == 3:
+            raise OSError('disk full')
+        write_synced(self, path, values)
+    monkeypatch.setattr(HistoryStore, '_write_synced', crash)
+    with pytest.raises(OSError):
+        store.compact(before=20)
+    monkeypatch.undo()
+
+    reopened = HistoryStore(str(tmp_path), initial_capacity=4)
+    assert len(reopened) == 3
+    assert reopened.select()['time'].tolist() == [30, 10, 20]
+    assert reopened.select()['total'].tolist() == [30.0, 10.0, 20.0]
+
+    assert reopened.compact(before=20) == 2
+    assert store.select()['time'].tolist() == [20, 30]
+    assert not os.path.exists(os.path.join(str(tmp_path), carbon_footprint_history.HEADER_FILE))
+    assert sorted(os.listdir(str(tmp_path))) == ['current', 'gen-1', 'lock']
+
+def test_compact_drops_old_records_and_sorts(tmp_path):
+    store = HistoryStore(str(tmp_path), initial_capacity=4)
+    for stamp in (30, 10, 20, 40, 5):
+        store.append('bob', footprints(stamp), stamp)
+    assert store.compact(before=10) == 4
+    assert store.select()['time'].tolist() == [10, 20, 30, 40]
+    assert store.select(start=15, end=40)['time'].tolist() == [20, 30]
+
+def test_parse_timestamp_accepts_unix_seconds_and_iso_strings():
+    assert parse_timestamp('1700000000') == 1700000000
+    assert parse_timestamp('1700000000.5') == 1700000000
+    assert parse_timestamp('2023-11-14T22:13:20') == 1700000000
+    assert parse_timestamp('2023-11-14') == 1699920000
+    assert parse_timestamp(1700000000) == 1700000000
+    assert parse_timestamp('') is None
+
+def test_history_endpoints_take_unix_seconds_and_iso_dates(tmp_path, monkeypatch):
+    import app
+    store = HistoryStore(str(tmp_path))
+    for stamp in (1699920000, 1700000000, 1700100000):
+        store.append('carol', footprints(stamp / 1e8), stamp)
+    monkeypatch.setitem(app.app.config, 'HISTORY_DIR', str(tmp_path))
+    monkeypatch.setattr(app, '_history_store', store)
+    client = app.app.test_client()
+
+    by_seconds = client.get('/history/users/carol?start=1700000000&end=1700100000').get_json()
+    by_date = client.get('/history/users/carol?start=2023-11-14T22:13:20&end=2023-11-16T02:00:00').get_json()
+    assert by_seconds['success'] and by_date['success']
+    assert [point['time'] for point in by_seconds['points']] == [1700000000]
+    assert [point['time'] for point in by_date['points']] == [1700000000]
+
+    rollup = client.get('/history/rollup?period=year&start=1699920000').get_json()
+    assert rollup['rollup'][0]['count'] == 3
+    assert client.get('/history/rollup?start=yesterday').get_json()['success'] is False
@@ -0,0 +1,35 @@
+import asyncio
+
+from carbon_footprint_meter import SECONDS_PER_MONTH, Household, IngestionPipeline, MeterReading, MeterWindow
+from carbon_footprint_model import CarbonFootprintCalculator
+
+def test_new_meter_is_not_biased_by_its_first_reading():
+    window = MeterWindow()
+    # One kWh per minute for an hour, each reading covering the minute before it
+    for minute in range(1, 61):
+        window.add(1700000000 + minute * 60, 1.0)
+    assert window.monthly_kwh(1700003600) == SECONDS_PER_MONTH / 60
+    # A single reading covers its own interval
+    single = MeterWindow()
+    single.add(1700000060, 1.0)
+    assert single.monthly_kwh(1700000060) == SECONDS_PER_MONTH / 60
+
+def test_malformed_readings_are_dropped_without_stopping_ingestion():
+    households = {'m1': Household(100, 1, 5, 150)}
+
+    async def run():
+        pipeline = IngestionPipeline(CarbonFootprintCalculator(), households, queue_size=1, recompute_interval=60)
+        pipeline.start()
+        await pipeline.submit([MeterReading('m1', 1700000060, 'lots'), ('m1', 1700000120), None,
+                               MeterReading(['m1'], 1700000120, 1.0), MeterReading('m1', 1700000120, float('nan')),
+                               MeterReading('m1', 1700000120, 1.0)])
+        # The queue holds one batch, so these only complete if ingestion keeps going
+        for minute in range(3, 6):
+            await pipeline.submit([MeterReading('m1', 1700000000 + minute * 60, 1.0)])
+        await asyncio.wait_for(pipeline.close(), 5)
+        return pipeline
+
+    pipeline = asyncio.run(run())
+    assert pipeline.readings == 4
+    assert pipeline.dropped == 5
+    assert 'm1' in pipeline.footprints
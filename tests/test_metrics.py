@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import app
+
+def sample(text, name):
+    """Return the value of one sample line of a Prometheus exposition, or 0 when the series is absent."""
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+def test_metrics_exposition_counts_requests():
+    client = app.app.test_client()
+    levels = 'electricity="high",transport="low",meat="moderate",waste="moderate",water="moderate"'
+    requests = f'carbon_calculate_requests_total{{{levels},region="Europe"}}'
+    stages = 'carbon_calculate_stage_seconds_count{stage="total"}'
+    records = 'carbon_batch_records_total{success="false"}'
+    model = 'carbon_model_seconds_count{method="calculate_footprints_batch"}'
+
+    before = client.get('/metrics')
+    assert before.status_code == 200
+    assert before.mimetype == 'text/plain'
+    assert '# TYPE carbon_calculate_requests_total counter' in before.get_data(as_text=True)
+    before = before.get_data(as_text=True)
+
+    for _ in range(3):
+        client.post('/calculate', data={'electricity': 'high', 'transport': 'low', 'region': 'Europe'})
+    client.post('/calculate/batch', data='{"electricity": "lots"}\n{"electricity": "low"}', buffered=True)
+
+    after = client.get('/metrics').get_data(as_text=True)
+    assert sample(after, requests) == sample(before, requests) + 3
+    assert sample(after, stages) == sample(before, stages) + 3
+    assert sample(after, records) == sample(before, records) + 1
+    assert sample(after, model) == sample(before, model) + 1
+
+def test_metrics_off_disables_endpoint_and_hooks():
+    script = '\n'.join([
+        "import app",
+        "client = app.app.test_client()",
+        "client.post('/calculate', data={'electricity': 'high'})",
+        "client.post('/calculate/batch', data='{\"electricity\": \"lots\"}', buffered=True)",
+        "app.dataset_state.calculator.calculate_footprint(1, 2, 3, 4, 5)",
+        "print(client.get('/metrics').status_code)",
+        "print(sum(len(getattr(metric, 'values', getattr(metric, 'series', {}))) for metric in app.REGISTRY.metrics))",
+    ])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True,
+                            env=dict(os.environ, CARBON_METRICS='off')).stdout
+    assert output.split() == ['404', '0']
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from carbon_footprint_model import (BATCH_INPUT_COLUMNS, COMPARED_CATEGORIES, DEFAULT_FACTORS, FOOTPRINT_CATEGORIES,
+                                    LEVEL_NAMES, CarbonFootprintCalculator)
+
+ROWS = 200
+
+def make_inputs(rng):
+    return [rng.uniform(0, 800, ROWS), rng.uniform(0, 600, ROWS), rng.uniform(0, 5, ROWS),
+            rng.uniform(0, 20, ROWS), rng.uniform(0, 400, ROWS)]
+
+def make_factors(calculator, rng):
+    return {category: rng.choice(list(calculator.emission_factors[category]), ROWS)
+            for category in FOOTPRINT_CATEGORIES}
+
+def assert_row_matches(calculator, inputs, factors, row, footprints, comparisons, recommendations):
+    expected = calculator.calculate_footprint(*[float(values[row]) for values in inputs],
+                                              factors={category: str(choices[row])
+                                                       for category, choices in factors.items()})
+    for category in COMPARED_CATEGORIES:
+        # Bit-for-bit equal, not just approximately
+        assert footprints[category][row] == expected['footprints'][category]
+        assert LEVEL_NAMES[comparisons[category][row]] == expected['comparisons'][category]
+    for category, flags in recommendations.items():
+        assert bool(flags[row]) == (category in expected['recommendations'])
+
+def test_batch_arrays_match_calculate_footprint():
+    calculator = CarbonFootprintCalculator()
+    rng = np.random.default_rng(0)
+    inputs = make_inputs(rng)
+    factors = make_factors(calculator, rng)
+    result = calculator.calculate_footprints_batch(*inputs, factors=factors)
+    assert result['dataset_version'] == calculator.dataset_version
+    for row in range(ROWS):
+        assert_row_matches(calculator, inputs, factors, row, result['footprints'], result['comparisons'],
+                           result['recommendations'])
+
+def test_batch_dataframe_matches_calculate_footprint():
+    calculator = CarbonFootprintCalculator()
+    rng = np.random.default_rng(1)
+    inputs = make_inputs(rng)
+    factors = make_factors(calculator, rng)
+    frame = pd.DataFrame(dict(zip(BATCH_INPUT_COLUMNS, inputs)), index=np.arange(ROWS) * 3)
+    for category, choices in factors.items():
+        # Partly filled factor columns fall back to the default factor
+        column = choices.astype(object)
+        column[::7] = None if category == 'food' else ''
+        frame[f'{category}_factor'] = column
+        choices[::7] = DEFAULT_FACTORS[category]
+
+    result = calculator.calculate_footprints_batch(frame)
+    assert result.index.equals(frame.index)
+    assert result.attrs['dataset_version'] == calculator.dataset_version
+    footprints = {category: result[category].to_numpy() for category in COMPARED_CATEGORIES}
+    comparisons = {category: result[f'{category}_comparison'].to_numpy() for category in COMPARED_CATEGORIES}
+    recommendations = {column[:-len('_recommend')]: result[column].to_numpy()
+                       for column in result.columns if column.endswith('_recommend')}
+    for row in range(ROWS):
+        assert_row_matches(calculator, inputs, factors, row, footprints, comparisons, recommendations)
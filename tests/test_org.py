@@ -0,0 +1,68 @@
+import pytest
+
+import app
+from carbon_footprint_model import CarbonFootprintCalculator
+from carbon_footprint_org import OrgTree
+
+PROFILE = (300, 200, 1.5, 5, 150)
+
+@pytest.fixture
+def tree():
+    tree = OrgTree(CarbonFootprintCalculator(), initial_capacity=4)
+    tree.add_nodes([('team', 'site', 'team', '', ''), ('site', 'org', 'site', '', ''), ('org', None, 'org', '', 'Europe')])
+    return tree
+
+def test_add_nodes_takes_rows_in_any_order(tree):
+    assert tree.summary('team')['depth'] == 2
+    assert tree.roots() == ['org']
+
+@pytest.mark.parametrize('rows', [
+    [('a', None, '', '', ''), ('a', None, '', '', '')],
+    [('b', None, '', '', ''), ('org', None, '', '', '')],
+    [('c', 'org', '', '', ''), ('d', 'missing', '', '', '')],
+    [('e', 'f', '', '', ''), ('f', 'e', '', '', '')]
+])
+def test_add_nodes_is_all_or_nothing(tree, rows):
+    with pytest.raises(ValueError):
+        tree.add_nodes(rows)
+    assert len(tree) == 3
+
+def test_load_validates_people_before_adding_groups(tree):
+    with pytest.raises(ValueError):
+        tree.load([('new-team', 'site', 'team', '', '')], ['p1'], ['missing'], [[value] for value in PROFILE])
+    with pytest.raises(ValueError):
+        tree.load([('new-team', 'site', 'team', '', '')], ['new-team'], ['site'], [[value] for value in PROFILE])
+    assert 'new-team' not in tree and 'p1' not in tree
+
+def test_incremental_updates_match_rebuild(tree):
+    tree.load([('other', 'site', 'team', '', '')], ['p1', 'p2'], ['team', 'other'], [[value] * 2 for value in PROFILE])
+    tree.set_member('p1', (450, 350, 2.5, 12, 200))
+    tree.set_member('p3', PROFILE, parent_id='team')
+    tree.remove_member('p2')
+    before = tree.summary('org')
+    tree.rebuild()
+    after = tree.summary('org')
+    assert before['members'] == after['members'] == 2
+    assert before['footprints'] == pytest.approx(after['footprints'])
+    expected = tree.calculator.calculate_footprint(450, 350, 2.5, 12, 200)['footprints']['total']
+    assert tree.summary('p1')['footprints']['total'] == expected
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app, '_org_tree', None)
+    return app.app.test_client()
+
+def test_org_nodes_request_with_duplicate_id_adds_nothing(client):
+    response = client.post('/org/nodes', json=[{'id': 'org'}, {'id': 'org'}]).get_json()
+    assert response['success'] is False
+    assert client.get('/org').get_json()['roots'] == []
+
+def test_org_nodes_request_with_bad_person_adds_nothing(client):
+    records = [{'id': 'org'}, {'id': 'team', 'parent': 'org'}, {'id': 'p1', 'parent': 'nowhere', 'meat': 'low'}]
+    assert client.post('/org/nodes', json=records).get_json()['success'] is False
+    assert client.get('/org').get_json()['roots'] == []
+
+def test_org_record_with_non_string_parent_is_rejected(client):
+    response = client.post('/org/nodes', json=[{'id': 'team', 'parent': {'id': 'org'}}])
+    assert response.status_code == 200
+    assert response.get_json()['success'] is False
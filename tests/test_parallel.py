@@ -0,0 +1,56 @@
+import numpy as np
+
+from carbon_footprint_model import BATCH_INPUT_COLUMNS, COMPARED_CATEGORIES, CarbonFootprintCalculator
+from carbon_footprint_parallel import DEFAULT_MIN_ROWS, ShardedExecutor
+
+def make_inputs(size):
+    rng = np.random.default_rng(0)
+    inputs = [rng.uniform(0, 800, size), rng.uniform(0, 600, size), rng.uniform(0, 5, size),
+              rng.uniform(0, 20, size), rng.uniform(0, 400, size)]
+    factors = {'transportation': rng.choice(['car_petrol', 'bus', 'car_electric', 'train'], size),
+               'electricity': 'renewable'}
+    return inputs, factors
+
+def test_shards_match_the_in_process_batch_for_every_chunk_size():
+    calculator = CarbonFootprintCalculator()
+    inputs, factors = make_inputs(500)
+    expected = calculator.calculate_footprints_batch(*inputs, factors=factors)
+
+    with ShardedExecutor(workers=2, chunk_size=64, calculator=calculator, min_rows=0) as executor:
+        # Uneven last shards and a reused pool must not change any row
+        for chunk_size in (64, 37, 499, 1):
+            executor.chunk_size = chunk_size
+            result = executor.calculate_footprints_batch(*inputs, factors=factors)
+            assert result['dataset_version'] == expected['dataset_version']
+            for category in COMPARED_CATEGORIES:
+                assert np.array_equal(result['footprints'][category], expected['footprints'][category])
+                assert np.array_equal(result['comparisons'][category], expected['comparisons'][category])
+            assert result['recommendations'].keys() == expected['recommendations'].keys()
+            for category, values in expected['recommendations'].items():
+                assert np.array_equal(result['recommendations'][category], values)
+
+def test_sharded_dataframe_keeps_index_and_columns():
+    import pandas as pd
+
+    calculator = CarbonFootprintCalculator()
+    inputs, factors = make_inputs(300)
+    frame = pd.DataFrame(dict(zip(BATCH_INPUT_COLUMNS, inputs)), index=np.arange(1000, 1300))
+    frame['transportation_factor'] = factors['transportation']
+    expected = calculator.calculate_footprints_batch(frame)
+
+    with ShardedExecutor(workers=2, chunk_size=100, calculator=calculator, min_rows=0) as executor:
+        result = executor.calculate_footprints_batch(frame)
+    pd.testing.assert_frame_equal(result, expected)
+
+def test_inputs_below_min_rows_stay_in_process():
+    calculator = CarbonFootprintCalculator()
+    inputs, factors = make_inputs(500)
+    expected = calculator.calculate_footprints_batch(*inputs, factors=factors)
+    assert DEFAULT_MIN_ROWS > 500
+
+    with ShardedExecutor(workers=2, chunk_size=64, calculator=calculator) as executor:
+        result = executor.calculate_footprints_batch(*inputs, factors=factors)
+        # No worker processes were started
+        assert executor.pool is None
+    for category in COMPARED_CATEGORIES:
+        assert np.array_equal(result['footprints'][category], expected['footprints'][category])
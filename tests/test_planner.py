@@ -0,0 +1,97 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from carbon_footprint_model import ANNUAL_MULTIPLIERS, FOOTPRINT_CATEGORIES, CarbonFootprintCalculator
+from carbon_footprint_planner import GoalPlanner
+from carbon_footprint_whatif import WhatIfEngine
+
+TRANSPORT = ['car_petrol', 'bus', 'car_electric', 'train']
+
+@pytest.fixture(scope='module')
+def planner():
+    return GoalPlanner(WhatIfEngine(CarbonFootprintCalculator()))
+
+def category_options(planner, index, factor):
+    """Return {effort: smallest term} over every subset of a category's suggestions."""
+    engine = planner.engine
+    columns = [column for column, action in enumerate(engine.actions) if action[0] == index]
+    best = {}
+    for count in range(len(columns) + 1):
+        for subset in itertools.combinations(columns, count):
+            switches = [column for column in subset if engine.actions[column][1] is None]
+            # Switching the factor twice in one category is not a combination the model allows
+            if len(switches) > 1:
+                continue
+            term = ANNUAL_MULTIPLIERS[index] * (engine.actions[switches[0]][2] if switches else factor)
+            for column in subset:
+                if engine.actions[column][1] is not None:
+                    term *= engine.actions[column][1]
+            cost = sum(planner.costs[column] for column in subset)
+            best[cost] = min(best.get(cost, float('inf')), term)
+    return best
+
+def enumerate_efforts(planner, inputs, factors):
+    """Return {effort: smallest total} over every allowed combination of suggestions."""
+    totals = {0: 0.0}
+    for index, category in enumerate(FOOTPRINT_CATEGORIES):
+        options = category_options(planner, index, float(factors[category]))
+        combined = {}
+        for cost, total in totals.items():
+            for extra, unit in options.items():
+                value = total + inputs[index] * unit
+                combined[cost + extra] = min(combined.get(cost + extra, float('inf')), value)
+        totals = combined
+    return totals
+
+def test_plans_match_exhaustive_enumeration(planner):
+    rng = np.random.default_rng(0)
+    size = 40
+    inputs = [rng.uniform(0, 800, size), rng.uniform(0, 600, size), rng.uniform(0, 5, size),
+              rng.uniform(0, 20, size), rng.uniform(0, 400, size)]
+    targets = rng.uniform(1, 12, size)
+    transport = rng.choice(TRANSPORT, size)
+    result = planner.plan_batch(*inputs, targets=targets, factors={'transportation': transport})
+
+    for row in range(size):
+        factors = planner.calculator.gather_factors({'transportation': transport[row]})
+        totals = enumerate_efforts(planner, [values[row] for values in inputs], factors)
+        reachable = [cost for cost, total in totals.items() if total <= targets[row] * (1 + 1e-12)]
+        lowest = min(totals.values())
+        effort = min(reachable) if reachable else min(cost for cost, total in totals.items()
+                                                       if total <= lowest * (1 + 1e-12))
+        assert result['effort'][row] == effort
+        assert result['reached'][row] == bool(reachable)
+        assert result['new_total'][row] == pytest.approx(totals[effort])
+
+        # The chosen suggestions really produce the planned total
+        plan = result['plans'][row]
+        assert sum(planner.costs[column] for column in plan) == effort
+        scales = [1.0] * len(FOOTPRINT_CATEGORIES)
+        chosen = [float(factors[category]) for category in FOOTPRINT_CATEGORIES]
+        switched = set()
+        for column in plan:
+            index, scale, factor = planner.engine.actions[column]
+            if scale is None:
+                assert index not in switched
+                switched.add(index)
+                chosen[index] = factor
+            else:
+                scales[index] *= scale
+        total = sum(values[row] * scale * multiplier * factor for values, scale, multiplier, factor
+                    in zip(inputs, scales, ANNUAL_MULTIPLIERS, chosen))
+        assert total == pytest.approx(result['new_total'][row])
+
+def test_plan_describes_suggestions_and_stops_at_the_target(planner):
+    profile = (300, 200, 1.5, 5, 150)
+    already = planner.plan(*profile, target=1000.0)
+    assert already['reached'] and already['effort'] == 0 and already['suggestions'] == []
+    assert already['new_total'] == already['total']
+
+    result = planner.plan(*profile, target=already['total'] * 0.6)
+    assert result['reached']
+    assert result['new_total'] <= result['target']
+    assert result['savings'] == pytest.approx(result['total'] - result['new_total'])
+    assert result['effort'] == sum(planner.effort_costs[item['effort']] for item in result['suggestions'])
+    assert all(item['category'] in FOOTPRINT_CATEGORIES for item in result['suggestions'])
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from carbon_footprint_model import COMPARED_CATEGORIES
+from carbon_footprint_population import ALL_REGIONS, FenwickHistogram, PopulationStats, make_edges
+
+def counts_by_bin(edges, values):
+    return np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+
+def test_fenwick_prefix_sums_and_percentiles_match_counting():
+    edges = make_edges(0.1, 100.0, 37)
+    values = np.random.default_rng(0).lognormal(1.0, 1.5, 500)
+    histogram = FenwickHistogram(edges)
+    for value in values:
+        histogram.add(value)
+    counts = counts_by_bin(edges, values)
+    assert histogram.total == 500
+    assert [histogram.prefix(index) for index in range(len(counts))] == np.cumsum(counts).tolist()
+
+    # Values below the first edge and above the last are kept in the outer bins
+    for value in (0.01, 0.5, 2.0, 7.3, 50.0, 5000.0):
+        index = histogram.bin_index(value)
+        expected = 100.0 * (counts[:index].sum() + counts[index] / 2) / 500
+        assert histogram.percentile(value) == pytest.approx(expected)
+    assert FenwickHistogram(edges).percentile(1.0) is None
+
+def test_add_counts_builds_the_same_tree_as_single_adds():
+    edges = make_edges(0.1, 100.0, 50)
+    values = np.random.default_rng(1).uniform(0, 120, 300)
+    single = FenwickHistogram(edges)
+    for value in values:
+        single.add(value)
+    bulk = FenwickHistogram(edges)
+    bulk.add_counts(counts_by_bin(edges, values))
+    assert bulk.tree == single.tree
+
+def test_merge_equals_observing_everything_in_one_object():
+    rng = np.random.default_rng(2)
+    regions = rng.choice(['Europe', 'Asia', ''], 400)
+    footprints = {category: rng.uniform(0, 20, 400) for category in COMPARED_CATEGORIES}
+
+    combined = PopulationStats()
+    combined.observe_batch(footprints, regions)
+    first, second = PopulationStats(), PopulationStats()
+    first.observe_batch({category: values[:150] for category, values in footprints.items()}, regions[:150])
+    for row in range(150, 400):
+        second.observe({category: values[row] for category, values in footprints.items()}, regions[row])
+    merged = first.merge(second)
+
+    assert merged.histograms.keys() == combined.histograms.keys()
+    for key, histogram in combined.histograms.items():
+        assert merged.histograms[key].tree == histogram.tree
+    assert merged.count() == 400
+    assert merged.count('Europe') == (regions == 'Europe').sum()
+    assert merged.percentile(10.0, 'Asia', 'food') == combined.percentile(10.0, 'Asia', 'food')
+    assert merged.percentile(10.0, ALL_REGIONS) == combined.percentile(10.0, ALL_REGIONS)
+
+def test_merge_rejects_different_bins_and_survives_serialization(tmp_path):
+    stats = PopulationStats()
+    stats.observe({category: 4.0 for category in COMPARED_CATEGORIES}, 'Europe')
+    with pytest.raises(ValueError):
+        stats.merge(PopulationStats(make_edges(count=16)))
+
+    path = str(tmp_path / 'stats.bin')
+    stats.save(path)
+    loaded = PopulationStats.load(path)
+    assert loaded.count('Europe', 'water') == 1
+    assert loaded.percentile(5.0, 'Europe') == stats.percentile(5.0, 'Europe') == 100.0
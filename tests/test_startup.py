@@ -0,0 +1,29 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median seconds allowed for carbon_footprint_app.py --help
+STARTUP_BUDGET = float(os.environ.get('CARBON_STARTUP_BUDGET', '0.3'))
+
+# Modules that must not be imported when the command line tool starts
+HEAVY_MODULES = ('numpy', 'pandas', 'flask')
+
+def test_command_line_starts_within_budget():
+    script = os.path.join(PROJECT_DIR, 'carbon_footprint_app.py')
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '--help'], check=True, stdout=subprocess.DEVNULL, cwd=PROJECT_DIR)
+        timings.append(time.perf_counter() - start)
+    assert statistics.median(timings) <= STARTUP_BUDGET
+
+def test_command_line_does_not_import_heavy_modules():
+    probe = ('import sys, carbon_footprint_app; '
+             f'print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))')
+    loaded = subprocess.run([sys.executable, '-c', probe], check=True, capture_output=True, text=True,
+                            cwd=PROJECT_DIR).stdout.strip()
+    assert loaded == ''
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from carbon_footprint_model import BATCH_INPUT_COLUMNS, CarbonFootprintCalculator
+from carbon_footprint_sweep import BYTES_PER_POINT, ScenarioSweep, make_axes
+
+STEPS = (4, 3, 5, 2, 3)
+
+def brute_force(calculator, axes, factors, bins, threshold):
+    grid = np.meshgrid(*axes, indexing='ij')
+    totals = calculator.calculate_footprints_batch(*grid, factors=factors)['footprints']['total']
+    low, high = totals.min(), totals.max()
+    bin_index = np.minimum(((totals - low) * (bins / (high - low))).astype(np.int64), bins - 1)
+    above = totals > threshold
+    marginal = {}
+    for axis, column in enumerate(BATCH_INPUT_COLUMNS):
+        others = tuple(other for other in range(len(axes)) if other != axis)
+        marginal[column] = {'mean_total': totals.mean(axis=others), 'share_above': above.mean(axis=others)}
+    return {'counts': np.bincount(bin_index.ravel(), minlength=bins), 'share_above': above.mean(),
+            'mean_total': totals.mean(), 'min_total': low, 'max_total': high, 'marginal': marginal}
+
+@pytest.mark.parametrize('points', [1, 2, 3, 7, 11, 30, 61, 360, 10 ** 6])
+def test_sweep_matches_brute_force_grid(points):
+    calculator = CarbonFootprintCalculator()
+    axes = make_axes(steps=STEPS)
+    factors = {'transportation': 'bus'}
+    sweep = ScenarioSweep(calculator, axes, factors)
+    seen = []
+    result = sweep.run(bins=7, threshold=6.0, max_memory=points * BYTES_PER_POINT,
+                       progress=lambda done, total: seen.append((done, total)))
+    expected = brute_force(calculator, axes, factors, 7, 6.0)
+    assert max(totals.size for _, totals in sweep.iter_chunks(points)) <= points
+
+    assert result['points'] == np.prod(STEPS)
+    assert seen[-1] == (result['points'], result['points'])
+    # Totals are summed as in calculate_footprint, so the extremes and bins match exactly
+    assert result['min_total'] == expected['min_total'] and result['max_total'] == expected['max_total']
+    assert result['histogram']['counts'] == expected['counts'].tolist()
+    assert result['share_above'] == expected['share_above']
+    assert result['mean_total'] == pytest.approx(expected['mean_total'])
+    for column in BATCH_INPUT_COLUMNS:
+        assert result['marginal'][column]['share_above'] == expected['marginal'][column]['share_above'].tolist()
+        assert result['marginal'][column]['mean_total'] == pytest.approx(expected['marginal'][column]['mean_total'])
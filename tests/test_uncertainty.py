@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from carbon_footprint_model import (ANNUAL_MULTIPLIERS, COMPARED_CATEGORIES, DEFAULT_FACTORS, FOOTPRINT_CATEGORIES,
+                                    CarbonFootprintCalculator)
+from carbon_footprint_uncertainty import UncertaintyModel
+
+def make_inputs():
+    rng = np.random.default_rng(3)
+    return [rng.uniform(0, 800, 40), rng.uniform(0, 600, 40), rng.uniform(0, 5, 40),
+            rng.uniform(0, 20, 40), rng.uniform(0, 400, 40)]
+
+FACTORS = {'transportation': np.array(['bus', 'car_petrol', 'train', 'plane_short'] * 10)}
+
+def test_equal_seeds_give_identical_intervals():
+    calculator = CarbonFootprintCalculator()
+    inputs = make_inputs()
+    first = UncertaintyModel(calculator, samples=500, seed=7).calculate_footprints_batch(*inputs, factors=FACTORS)
+    second = UncertaintyModel(calculator, samples=500, seed=7).calculate_footprints_batch(*inputs, factors=FACTORS)
+    # Blocks of a single row only change the rounding of the matrix product
+    blocked = UncertaintyModel(calculator, samples=500, seed=7).calculate_footprints_batch(
+        *inputs, factors=FACTORS, max_memory=1)
+    other = UncertaintyModel(calculator, samples=500, seed=8).calculate_footprints_batch(*inputs, factors=FACTORS)
+    for label in ('mean', 'p5', 'p95'):
+        for category in COMPARED_CATEGORIES:
+            assert np.array_equal(first[label][category], second[label][category])
+            assert blocked[label][category] == pytest.approx(first[label][category], rel=1e-12)
+    assert not np.array_equal(first['p95']['total'], other['p95']['total'])
+
+def test_total_intervals_match_summing_every_sample():
+    calculator = CarbonFootprintCalculator()
+    inputs = make_inputs()
+    model = UncertaintyModel(calculator, samples=300, seed=1)
+    result = model.calculate_footprints_batch(*inputs, factors=FACTORS, percentiles=(5, 50, 95), max_memory=4096)
+    for row in range(40):
+        totals = 0
+        for index, category in enumerate(FOOTPRINT_CATEGORIES):
+            name = FACTORS[category][row] if category in FACTORS else DEFAULT_FACTORS[category]
+            code = calculator.factor_index[category][name]
+            totals = totals + inputs[index][row] * ANNUAL_MULTIPLIERS[index] * model.factor_samples[category][code]
+        for percentile in (5, 50, 95):
+            assert result[f'p{percentile}']['total'][row] == pytest.approx(np.percentile(totals, percentile))
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from carbon_footprint_model import FOOTPRINT_CATEGORIES, CarbonFootprintCalculator
+from carbon_footprint_whatif import WhatIfEngine
+
+PROFILE = (450, 250, 2.5, 8, 200)
+
+def test_rank_matches_recalculating_each_suggestion():
+    calculator = CarbonFootprintCalculator()
+    ranked = WhatIfEngine(calculator).rank(*PROFILE, factors={'transportation': 'car_petrol'})
+    assert ranked
+    assert [item['savings'] for item in ranked] == sorted((item['savings'] for item in ranked), reverse=True)
+
+    total = calculator.calculate_footprint(*PROFILE, factors={'transportation': 'car_petrol'})['footprints']['total']
+    for item in ranked:
+        index = FOOTPRINT_CATEGORIES.index(item['category'])
+        effect = calculator.suggestion_effects[item['title']]
+        inputs = list(PROFILE)
+        factors = {'transportation': 'car_petrol'}
+        if 'factor' in effect:
+            factors[item['category']] = effect['factor']
+        else:
+            inputs[index] *= effect['scale']
+        new_total = calculator.calculate_footprint(*inputs, factors=factors)['footprints']['total']
+        assert item['new_total'] == pytest.approx(new_total)
+        assert item['savings'] == pytest.approx(total - new_total)
+
+def test_rank_batch_matches_rank_per_profile():
+    engine = WhatIfEngine(CarbonFootprintCalculator())
+    rng = np.random.default_rng(0)
+    inputs = [rng.uniform(0, 800, 20), rng.uniform(0, 600, 20), rng.uniform(0, 5, 20),
+              rng.uniform(0, 20, 20), rng.uniform(0, 400, 20)]
+    result = engine.rank_batch(*inputs)
+    assert result['savings'].shape == (20, len(engine.suggestions))
+    assert (result['savings'] >= 0).all()
+
+    for row in range(20):
+        ranked = engine.rank(*[float(values[row]) for values in inputs])
+        savings = {(item['category'], item['title']): item['savings'] for item in ranked}
+        for column, label in enumerate(result['suggestions']):
+            assert result['savings'][row, column] == pytest.approx(savings.get(label, 0.0))
+        best = result['suggestions'][result['ranking'][row, 0]]
+        assert savings[best] == max(savings.values())